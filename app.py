@@ -1,6 +1,8 @@
 import os
-from flask import Flask
+from flask import Flask, request
 from models import db
+from schema import upgrade_schema
+from db_profile import configure_database, init_report_session
 from config import Config
 from routes.main import main_bp
 from routes.scan import scan_bp
@@ -11,17 +13,31 @@ from dotenv import load_dotenv
 from errors import (
     register_error_handlers
 )  # Importar la función de registro de errores
+from commands import register_commands
+from jobs import init_jobs
+from journal import init_journal
+from sql_budget import init_sql_budget
+from metrics import init_metrics
+from upload_stream import UploadRequest
 
 load_dotenv()  # Cargar variables de entorno desde .env
 
 
 app = Flask(__name__)
+app.request_class = UploadRequest  # Archivos cargados en memoria (con hash)
 app.config.from_object(Config)
+configure_database(app)  # Perfil de la base de datos (WAL, pool, etc.)
 
 # Inicializar SQLAlchemy
 with app.app_context():
     db.init_app(app)
+    init_report_session(app)  # Sesión de solo lectura para los informes
     db.create_all()
+    upgrade_schema()  # Columnas e índices nuevos en bases de datos existentes
+
+# Latencia, sentencias SQL y /metrics (antes de los blueprints para medir
+# también la carga de la sesión del día)
+init_metrics(app)
 
 # Registrar Blueprints
 app.register_blueprint(main_bp)
@@ -33,8 +49,28 @@ app.register_blueprint(session_bp)
 # Registrar manejadores de errores
 register_error_handlers(app)
 
+# Presupuesto de sentencias SQL por petición (tras los blueprints)
+init_sql_budget(app)
+
+
+@app.before_request
+def apply_route_content_length():
+    # Límite de tamaño de la petición configurable por ruta
+    limit = app.config['ROUTE_MAX_CONTENT_LENGTH'].get(request.endpoint)
+    if limit is not None:
+        request.max_content_length = limit
+
+
+# Registrar comandos de la CLI de Flask (p. ej. flask recount-sessions)
+register_commands(app)
+
+# Pool de hilos para las cargas de manifiestos en segundo plano
+init_jobs(app)
+
+# Reaplicar diarios de escaneos pendientes y abrir el de este proceso
+init_journal(app)
+
 # Crear carpetas necesarias si no existen
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['EXPORT_FOLDER'], exist_ok=True)
 
 if __name__ == '__main__':
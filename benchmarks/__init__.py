@@ -0,0 +1,5 @@
+"""
+Benchmarks de la aplicación: manifiestos sintéticos, carga de manifiestos,
+rutas principales con el cliente de pruebas de Flask y carga HTTP contra un
+gunicorn local. Se ejecutan con `python -m benchmarks` (ver __main__.py).
+"""
@@ -0,0 +1,147 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+from urllib.parse import urlencode
+
+
+# python -m benchmarks run [--rows N] [--database-url URL] [--http] ...
+# python -m benchmarks compare anterior.json nuevo.json
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _parser():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='Ejecuta los benchmarks')
+    run.add_argument('--rows', type=int, default=10000,
+                     help='Guías del manifiesto sintético (10k a 1M)')
+    run.add_argument('--format', choices=('csv', 'xlsx'), default='csv')
+    run.add_argument('--scans', type=int, default=2000,
+                     help='Escaneos con el cliente de pruebas')
+    run.add_argument('--database-url',
+                     help='Base de datos vacía (por defecto SQLite en el '
+                          'directorio de trabajo)')
+    run.add_argument('--workdir',
+                     help='Directorio de trabajo (por defecto uno temporal '
+                          'que se borra al terminar)')
+    run.add_argument('--http', action='store_true',
+                     help='Carga HTTP contra un gunicorn local')
+    run.add_argument('--workers', type=int, default=2)
+    run.add_argument('--threads', type=int, default=8)
+    run.add_argument('--concurrency', type=int, default=16)
+    run.add_argument('--http-requests', type=int, default=2000)
+    run.add_argument('--out', default='benchmark.json')
+
+    compare = commands.add_parser('compare', help='Compara dos informes')
+    compare.add_argument('old')
+    compare.add_argument('new')
+    return parser
+
+
+def _run_http(args, workdir: str, env: dict, session_id: int) -> dict:
+    from .http_load import GunicornServer, run_load
+    from .inprocess import scan_codes
+
+    results = {}
+    server_env = dict(env, METRICS_DUMP_SECONDS='0')
+    with GunicornServer(REPO_DIR, workdir, server_env, args.workers,
+                        args.threads) as server:
+        results['http_scan'] = run_load(server.url, [
+            ('POST', '/scan', {'code': code})
+            for code in scan_codes(args.rows, args.http_requests, seed=1)
+        ], args.concurrency, 'scan.scan')
+        rng = random.Random(2)
+        results['http_registros'] = run_load(server.url, [
+            ('GET', '/registros?' + urlencode({
+                'session_id': session_id,
+                'status': rng.choice(['RECIBIDO', 'NO RECIBIDO'])}), None)
+            for _ in range(max(1, args.http_requests // 10))
+        ], args.concurrency, 'records.registros')
+        results['http_export_csv'] = run_load(server.url, [
+            ('GET', f'/export?session_id={session_id}&format=csv', None)
+        ] * args.concurrency, args.concurrency, 'records.export')
+    return results
+
+
+def run(args):
+    from .manifests import write_manifest
+    from .report import build_report, write_report
+
+    out = os.path.abspath(args.out)
+    workdir = os.path.abspath(args.workdir) if args.workdir else \
+        tempfile.mkdtemp(prefix='benchmark-')
+    os.makedirs(workdir, exist_ok=True)
+    database_url = args.database_url or \
+        'sqlite:///' + os.path.join(workdir, 'benchmark.db')
+    env = {
+        'DATABASE_URL': database_url,
+        'IMPORT_ASYNC': '0',
+        'SCAN_LOG_SAMPLE_RATE': '0',
+        'LOG_LEVEL': 'WARNING',
+    }
+    os.environ.update(env)
+    # config.py toma las carpetas del directorio actual al importarse
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_DIR)
+    try:
+        from app import app
+        from models import db, Guia
+        from .inprocess import bench_import, bench_routes
+
+        with app.app_context():
+            if db.session.query(Guia.id).first() is not None:
+                sys.exit('La base de datos de benchmarks debe estar vacía: '
+                         + db.engine.url.render_as_string(hide_password=True))
+            dialect = db.engine.dialect.name
+
+        manifest = write_manifest(
+            os.path.join(workdir, f'manifest.{args.format}'), args.rows)
+        # Un archivo que comparte el 90% de las filas con el primero
+        overlap = write_manifest(
+            os.path.join(workdir, f'overlap.{args.format}'), args.rows,
+            offset=args.rows // 10)
+        results = {
+            'import_new': bench_import(app, manifest, args.rows),
+            # El mismo archivo otra vez (historial de cargas)
+            'import_identical': bench_import(app, manifest, args.rows),
+            'import_overlap': bench_import(app, overlap, args.rows),
+        }
+        results.update(bench_routes(app, args.rows, args.scans))
+        if args.http:
+            with app.app_context():
+                from session_cache import get_or_create_session
+                session_id = get_or_create_session().id
+            results.update(_run_http(args, workdir, env, session_id))
+
+        options = {key: value for key, value in vars(args).items()
+                   if key not in ('command', 'database_url', 'workdir',
+                                  'out')}
+        write_report(build_report(REPO_DIR, dialect, options, results), out)
+        print(f'Informe guardado en {out}')
+    finally:
+        os.chdir(REPO_DIR)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv=None):
+    args = _parser().parse_args(argv)
+    if args.command == 'compare':
+        from .report import compare
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        print('\n'.join(compare(old, new)))
+    else:
+        run(args)
+
+
+if __name__ == '__main__':
+    main()
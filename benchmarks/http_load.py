@@ -0,0 +1,158 @@
+import http.client
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+from .report import summarize
+
+
+# Carga HTTP con varios hilos (conexiones keep-alive de http.client) contra
+# un servidor local, p. ej. gunicorn con varios workers
+
+_SQL_METRIC = re.compile(
+    r'^sql_statements_per_request_(sum|count)\{endpoint="([^"]+)"\} (\S+)$',
+    re.MULTILINE)
+
+
+class GunicornServer:
+    """
+    Arranca gunicorn (wsgi:application) en un puerto libre con el entorno
+    indicado y lo detiene al salir del bloque with.
+    """
+
+    def __init__(self, repo_dir: str, workdir: str, env: dict,
+                 workers: int = 2, threads: int = 8):
+        self.repo_dir = repo_dir
+        self.workdir = workdir
+        self.env = dict(os.environ, **env)
+        self.workers = workers
+        self.threads = threads
+        self.process = None
+        self.url = None
+
+    def __enter__(self):
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        self.url = f'http://127.0.0.1:{port}'
+        self.log = open(os.path.join(self.workdir, 'gunicorn.log'), 'ab')
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--pythonpath', self.repo_dir,
+             '-w', str(self.workers), '-k', 'gthread',
+             '--threads', str(self.threads), '-b', f'127.0.0.1:{port}',
+             'wsgi:application'],
+            cwd=self.workdir, env=self.env, stdout=self.log,
+            stderr=subprocess.STDOUT)
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError('gunicorn terminó al arrancar (ver '
+                                   f'{self.log.name})')
+            try:
+                _request(self.url, 'GET', '/')
+                return self
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError('gunicorn no respondió en 60 segundos')
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.log.close()
+
+
+def _request(base_url: str, method: str, path: str, body=None):
+    parts = urlsplit(base_url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port,
+                                            timeout=30)
+    try:
+        connection.request(method, path, body)
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+
+def sql_counts(base_url: str) -> dict:
+    """
+    {endpoint: [sentencias, peticiones]} según /metrics del servidor.
+    """
+    _, body = _request(base_url, 'GET', '/metrics')
+    counts = {}
+    for kind, endpoint, value in _SQL_METRIC.findall(body.decode()):
+        counts.setdefault(endpoint, [0, 0])[kind == 'count'] = float(value)
+    return counts
+
+
+def run_load(base_url: str, requests: list, concurrency: int,
+             endpoint: str = None) -> dict:
+    """
+    Envía la lista de peticiones (método, ruta, cuerpo JSON o None) con
+    concurrency hilos, cada uno con su conexión keep-alive. Con endpoint,
+    la media de sentencias SQL por petición sale del delta de /metrics.
+    """
+    parts = urlsplit(base_url)
+    before = sql_counts(base_url) if endpoint else {}
+    pending = iter(requests)
+    lock = threading.Lock()
+    latencies, errors = [], []
+
+    def worker():
+        connection = http.client.HTTPConnection(parts.hostname, parts.port,
+                                                timeout=60)
+        local, failed = [], 0
+        while True:
+            with lock:
+                item = next(pending, None)
+            if item is None:
+                break
+            method, path, payload = item
+            body = json.dumps(payload) if payload is not None else None
+            headers = {'Content-Type': 'application/json'} if body else {}
+            t0 = time.perf_counter()
+            try:
+                connection.request(method, path, body, headers)
+                response = connection.getresponse()
+                response.read()
+                if response.status >= 400:
+                    failed += 1
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                connection.close()
+                connection = http.client.HTTPConnection(
+                    parts.hostname, parts.port, timeout=60)
+            local.append(time.perf_counter() - t0)
+        connection.close()
+        with lock:
+            latencies.extend(local)
+            errors.append(failed)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+
+    extra = {'concurrency': concurrency, 'errors': sum(errors)}
+    if endpoint:
+        # Los workers vuelcan sus métricas al terminar cada petición
+        # (METRICS_DUMP_SECONDS=0), justo después de responder
+        time.sleep(0.5)
+        after = sql_counts(base_url)
+        statements, count = (
+            a - b for a, b in zip(after.get(endpoint, [0, 0]),
+                                  before.get(endpoint, [0, 0])))
+        if count:
+            extra['sql_per_request'] = round(statements / count, 2)
+    return summarize(latencies, seconds, **extra)
@@ -0,0 +1,159 @@
+import os
+import random
+import re
+import time
+from werkzeug.datastructures import FileStorage
+from sql_budget import count_statements
+from .manifests import tracking_code, guia_code
+from .report import summarize
+
+
+# Benchmarks dentro del proceso: la carga con process_excel_upload y las
+# rutas con el cliente de pruebas de Flask, contando las sentencias SQL de
+# cada petición
+
+_CURSOR = re.compile(r'cursor=([^&"]+)')
+
+
+def bench_import(app, path: str, n_rows: int) -> dict:
+    """
+    Mide process_excel_upload con un manifiesto ya generado: el archivo se
+    lee por bloques directamente del búfer de la carga, sin guardarlo antes
+    en disco.
+    """
+    from session_cache import get_or_create_session
+    from utils import process_excel_upload
+
+    with app.app_context():
+        current_session = get_or_create_session()
+        with open(path, 'rb') as f, count_statements() as statements:
+            start = time.perf_counter()
+            stats = process_excel_upload(
+                FileStorage(f, filename=os.path.basename(path)),
+                current_session, app.config)
+            seconds = time.perf_counter() - start
+    if 'error' in stats:
+        raise RuntimeError(stats['error'])
+    return {
+        'rows': n_rows,
+        'seconds': round(seconds, 4),
+        'rows_per_s': round(n_rows / seconds, 1),
+        'sql_statements': len(statements),
+        'n_added_guia': stats['n_added_guia'],
+        'n_added_session_status': stats['n_added_session_status'],
+        'n_unchanged_rows': stats.get('n_unchanged_rows', 0),
+    }
+
+
+def _run(client, requests) -> dict:
+    latencies, statements, errors = [], [], 0
+    response_bytes = 0
+    start = time.perf_counter()
+    for method, url, kwargs in requests:
+        with count_statements() as executed:
+            t0 = time.perf_counter()
+            response = client.open(url, method=method, **kwargs)
+            # Las exportaciones se generan en flujo: leer todo el cuerpo
+            response_bytes += len(response.get_data())
+            response.close()
+            latencies.append(time.perf_counter() - t0)
+        statements.append(len(executed))
+        if response.status_code >= 400:
+            errors += 1
+    return summarize(latencies, time.perf_counter() - start, statements,
+                     errors=errors, response_bytes=response_bytes)
+
+
+def scan_codes(n_rows: int, n_scans: int, seed: int = 0) -> list:
+    """
+    Mezcla de escaneos como la de un turno: trackings y guías
+    internacionales del manifiesto, repeticiones de códigos ya escaneados y
+    paquetes desconocidos.
+    """
+    rng = random.Random(seed)
+    codes = []
+    for _ in range(n_scans):
+        roll = rng.random()
+        if codes and roll < 0.1:
+            codes.append(rng.choice(codes))
+        elif roll < 0.2:
+            codes.append(tracking_code(n_rows + 1 + rng.randrange(10 ** 6)))
+        elif roll < 0.35:
+            codes.append(guia_code(rng.randint(1, n_rows)))
+        else:
+            codes.append(tracking_code(rng.randint(1, n_rows)))
+    return codes
+
+
+def misread_codes(n_rows: int, n_scans: int, seed: int = 0) -> list:
+    """
+    Códigos del manifiesto leídos con un carácter cambiado, de menos o de
+    más (etiquetas dañadas): paquetes desconocidos con sugerencias. El
+    carácter cambiado es una letra, así el código no coincide con otro
+    tracking del manifiesto (son secuenciales).
+    """
+    rng = random.Random(seed)
+    codes = []
+    for _ in range(n_scans):
+        code = tracking_code(rng.randint(1, n_rows))
+        i = rng.randrange(3, len(code))
+        roll = rng.random()
+        if roll < 0.6:
+            code = code[:i] + rng.choice('ABCDEFGHJK') + code[i + 1:]
+        elif roll < 0.8:
+            code = code[:i] + code[i + 1:]
+        else:
+            code = code[:i] + rng.choice('0123456789') + code[i:]
+        codes.append(code)
+    return codes
+
+
+def bench_routes(app, n_rows: int, n_scans: int, n_pages: int = 20,
+                 n_exports: int = 3) -> dict:
+    """
+    Mide /scan (también con códigos mal leídos), /register_unknown,
+    /registros (páginas, filtros) y /export (CSV y XLSX) sobre la sesión del
+    día con el manifiesto ya cargado.
+    """
+    client = app.test_client()
+    results = {}
+    results['scan'] = _run(client, [
+        ('POST', '/scan', {'json': {'code': code}})
+        for code in scan_codes(n_rows, n_scans)])
+    results['scan_misread'] = _run(client, [
+        ('POST', '/scan', {'json': {'code': code}})
+        for code in misread_codes(n_rows, max(1, n_scans // 10))])
+    results['register_unknown'] = _run(client, [
+        ('POST', '/register_unknown',
+         {'json': {'code': guia_code(10 ** 9 + i),
+                   'code_type': 'guia_internacional'}})
+        for i in range(max(1, n_scans // 10))])
+
+    with app.app_context():
+        from session_cache import get_or_create_session
+        session_id = get_or_create_session().id
+
+    # Recorrer las primeras páginas siguiendo el cursor de cada una
+    urls = [f'/registros?session_id={session_id}']
+    for _ in range(n_pages - 1):
+        response = client.get(urls[-1])
+        match = _CURSOR.search(response.get_data(as_text=True))
+        if not match:
+            break
+        urls.append(f'/registros?session_id={session_id}'
+                    f'&cursor={match.group(1)}')
+    results['registros_pages'] = _run(
+        client, [('GET', url, {}) for url in urls])
+    results['registros_filters'] = _run(client, [
+        ('GET', f'/registros?session_id={session_id}&status=RECIBIDO', {}),
+        ('GET', f'/registros?session_id={session_id}'
+                f'&tracking={tracking_code(n_rows // 2)[:-2]}', {}),
+        ('GET', f'/registros?session_id={session_id}'
+                f'&guia_internacional={guia_code(n_rows // 3)[-6:]}', {}),
+        ('GET', f'/registros?tracking={tracking_code(7)[-5:]}', {}),
+    ])
+    for export_format in ('csv', 'xlsx'):
+        results[f'export_{export_format}'] = _run(client, [
+            ('GET', f'/export?session_id={session_id}'
+                    f'&format={export_format}', {})] * n_exports)
+    return results
@@ -0,0 +1,53 @@
+import csv
+import random
+from openpyxl import Workbook
+
+
+# Manifiestos sintéticos con códigos como los reales: tracking 'TBA' + 12
+# dígitos y guía internacional 'BOG' + 10 dígitos
+
+def tracking_code(n: int) -> str:
+    return f'TBA{n:012d}'
+
+
+def guia_code(n: int) -> str:
+    return f'BOG{n:010d}'
+
+
+def manifest_rows(n_rows: int, seed: int = 0, offset: int = 0,
+                  missing_guia: float = 0.05, duplicates: float = 0.01):
+    """
+    Genera n_rows filas (tracking, guía internacional) en orden aleatorio
+    pero reproducible. Una fracción de filas llega sin guía internacional
+    y otra repite un tracking anterior, como en los manifiestos reales.
+    """
+    rng = random.Random(seed)
+    numbers = list(range(offset + 1, offset + n_rows + 1))
+    rng.shuffle(numbers)
+    for i, n in enumerate(numbers):
+        if i and rng.random() < duplicates:
+            n = numbers[rng.randrange(i)]
+        guia = '' if rng.random() < missing_guia else guia_code(n)
+        yield tracking_code(n), guia
+
+
+def write_manifest(path: str, n_rows: int, seed: int = 0,
+                   offset: int = 0) -> str:
+    """
+    Escribe el manifiesto en CSV o XLSX (según la extensión de path) con
+    las columnas TRACKING y GUIA INTERNACIONAL.
+    """
+    rows = manifest_rows(n_rows, seed, offset)
+    if path.endswith('.xlsx'):
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(['TRACKING', 'GUIA INTERNACIONAL'])
+        for row in rows:
+            sheet.append(row)
+        workbook.save(path)
+    else:
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['TRACKING', 'GUIA INTERNACIONAL'])
+            writer.writerows(rows)
+    return path
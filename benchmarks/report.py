@@ -0,0 +1,103 @@
+import json
+import os
+import platform
+import subprocess
+from datetime import datetime
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    # Percentil por rango más cercano de una lista ya ordenada
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(latencies: list, seconds: float, statements: list = None,
+              **extra) -> dict:
+    """
+    Resumen de una serie de peticiones: cantidad, peticiones por segundo,
+    latencias p50/p95/p99/máxima en milisegundos y sentencias SQL por
+    petición (media y máximo) si se contaron.
+    """
+    ordered = sorted(latencies)
+    result = {
+        'requests': len(ordered),
+        'seconds': round(seconds, 4),
+        'throughput_per_s': round(len(ordered) / seconds, 2)
+        if seconds else 0.0,
+        'p50_ms': round(percentile(ordered, 50) * 1000, 3),
+        'p95_ms': round(percentile(ordered, 95) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 99) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3) if ordered else 0.0,
+    }
+    if statements:
+        result['sql_per_request'] = round(sum(statements) / len(statements),
+                                          2)
+        result['sql_max'] = max(statements)
+    result.update(extra)
+    return result
+
+
+def _git_commit(repo_dir: str):
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=repo_dir,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_report(repo_dir: str, database: str, options: dict,
+                 results: dict) -> dict:
+    return {
+        'meta': {
+            'commit': _git_commit(repo_dir),
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'database': database,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'options': options,
+        },
+        'results': results,
+    }
+
+
+def write_report(report: dict, path: str):
+    # Claves ordenadas y una métrica por línea: dos informes se comparan
+    # con un diff normal
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+# Métricas que se comparan y si un valor mayor es mejor
+_COMPARED = {
+    'throughput_per_s': True,
+    'rows_per_s': True,
+    'p50_ms': False,
+    'p95_ms': False,
+    'p99_ms': False,
+    'sql_per_request': False,
+    'sql_statements': False,
+}
+
+
+def compare(old: dict, new: dict) -> list:
+    """
+    Líneas de texto con la variación de cada métrica entre dos informes
+    (marcadas con '!' si empeora más de un 10%).
+    """
+    lines = [f"{old['meta'].get('commit')} -> {new['meta'].get('commit')}"]
+    for name in sorted(set(old['results']) & set(new['results'])):
+        before, after = old['results'][name], new['results'][name]
+        for metric, higher_is_better in _COMPARED.items():
+            if metric not in before or metric not in after:
+                continue
+            a, b = before[metric], after[metric]
+            change = (b - a) / a * 100 if a else 0.0
+            worse = change < -10 if higher_is_better else change > 10
+            lines.append(f"{'!' if worse else ' '} {name:<28} {metric:<17} "
+                         f'{a:>12} -> {b:>12} ({change:+.1f}%)')
+    return lines
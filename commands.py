@@ -0,0 +1,14 @@
+import click
+from models import db
+from session_counters import recompute_session_counters
+
+
+def register_commands(app):
+    @app.cli.command('recount-sessions')
+    @click.option('--session-id', type=int, default=None,
+                  help='Recalcular solo esta sesión.')
+    def recount_sessions(session_id):
+        """Recalcula los contadores de las sesiones desde los estados."""
+        n_sessions = recompute_session_counters(session_id)
+        db.session.commit()
+        click.echo(f'Contadores recalculados para {n_sessions} sesión(es).')
@@ -9,7 +9,100 @@ class Config:
         'DATABASE_URL', 'sqlite:///app.db'
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    UPLOAD_FOLDER = os.path.join(os.getcwd(), 'uploads')
+    # Perfil de la base de datos (ver db_profile.py): 'production' aplica
+    # WAL, busy_timeout y demás PRAGMAs en SQLite y ajusta el pool;
+    # 'default' deja la configuración de SQLAlchemy sin cambios
+    DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'production')
+    # Pool de las escrituras y del bind de informes (ver db_profile.py)
+    DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 5))
+    DATABASE_MAX_OVERFLOW = int(os.environ.get('DATABASE_MAX_OVERFLOW', 5))
+    REPORTS_POOL_SIZE = int(os.environ.get('REPORTS_POOL_SIZE', 10))
+    REPORTS_MAX_OVERFLOW = int(os.environ.get('REPORTS_MAX_OVERFLOW', 20))
+    # Réplica de solo lectura para los informes; por defecto la misma BD
+    REPORTS_DATABASE_URL = os.environ.get('REPORTS_DATABASE_URL')
+    DATABASE_POOL_RECYCLE = 1800  # Segundos antes de renovar una conexión
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',  # Con WAL no se pierde integridad
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 30000)),
+        'cache_size': -64000,  # 64MB por conexión
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+    }
     EXPORT_FOLDER = os.path.join(os.getcwd(), 'exports')
-    MAX_CONTENT_LENGTH = 2 * 1024 * 1024  # 2MB máximo por archivo
+    MAX_CONTENT_LENGTH = 2 * 1024 * 1024  # 2MB máximo por petición por defecto
+    # Límite por ruta (endpoint) que reemplaza a MAX_CONTENT_LENGTH; la carga
+    # de manifiestos se procesa por bloques y admite archivos grandes
+    UPLOAD_MAX_CONTENT_LENGTH = int(os.environ.get(
+        'UPLOAD_MAX_CONTENT_LENGTH', 100 * 1024 * 1024))  # 100MB
+    ROUTE_MAX_CONTENT_LENGTH = {
+        'main.upload': UPLOAD_MAX_CONTENT_LENGTH,
+    }
     ALLOWED_EXTENSIONS = {'xlsx', 'csv'}
+    # Los archivos cargados se leen desde memoria; por encima de este tamaño
+    # se pasan a un archivo temporal anónimo (en UPLOAD_SPOOL_DIR o el
+    # directorio temporal del sistema) que se borra al cerrarlo
+    UPLOAD_SPOOL_MAX_SIZE = int(os.environ.get(
+        'UPLOAD_SPOOL_MAX_SIZE', 8 * 1024 * 1024))  # 8MB
+    UPLOAD_SPOOL_DIR = os.environ.get('UPLOAD_SPOOL_DIR')
+    IMPORT_CHUNK_SIZE = 5000  # Filas por bloque en la carga masiva
+    # Cargas en segundo plano (pool de hilos local); con IMPORT_ASYNC=0 la
+    # carga se hace dentro de la petición
+    IMPORT_ASYNC = os.environ.get('IMPORT_ASYNC', '1') == '1'
+    IMPORT_WORKERS = int(os.environ.get('IMPORT_WORKERS', 1))
+    RECORDS_PAGE_SIZE = 100  # Guías por página en /registros
+    BULK_STATUS_MAX_ITEMS = 1000  # Guías seleccionadas por cambio masivo
+    SCAN_BATCH_MAX_ITEMS = 500  # Escaneos por petición en /scan/batch
+    # Días que se guardan los client_id de escaneos ya aplicados (reenvíos)
+    PROCESSED_SCAN_RETENTION_DAYS = 7
+    # Guías sugeridas para un código desconocido (a un carácter de
+    # diferencia); 0 las desactiva
+    SCAN_SUGGESTIONS_LIMIT = int(os.environ.get('SCAN_SUGGESTIONS_LIMIT', 3))
+    # Con SCAN_WRITE_BEHIND=1 /scan responde tras anotar el escaneo en el
+    # diario (fsync) y un hilo lo aplica después a la base de datos
+    SCAN_WRITE_BEHIND = os.environ.get('SCAN_WRITE_BEHIND', '0') == '1'
+    SCAN_JOURNAL_DIR = os.path.join(os.getcwd(), 'instance', 'scan_journal')
+    # Segundos que /scan espera el fsync del diario antes de escanear de
+    # forma síncrona
+    SCAN_JOURNAL_TIMEOUT = 5
+    # Intentos de un escaneo del diario que no se puede aplicar antes de
+    # apartarlo en scan_journal.dead
+    SCAN_JOURNAL_MAX_ATTEMPTS = 3
+    # Contadores y estados en vivo (SSE) en las vistas de escaneo y de
+    # registros; cada página abierta ocupa un hilo del servidor
+    SESSION_EVENTS_ENABLED = os.environ.get('SESSION_EVENTS_ENABLED',
+                                            '1') == '1'
+    # Eventos de sesión (SSE): archivo cuya fecha de modificación avisa a
+    # todos los procesos del host de que hay eventos nuevos
+    SESSION_EVENTS_SIGNAL_FILE = os.path.join(os.getcwd(), 'instance',
+                                              'session_events.signal')
+    SESSION_EVENTS_RETENTION = 3600  # Segundos que se guardan los eventos
+    SESSION_EVENTS_STREAM_SECONDS = 300  # Duración de cada conexión SSE
+    # Segundos que cada proceso reutiliza la sesión del día sin consultarla;
+    # al cerrarla se cambia la fecha de modificación de este archivo para
+    # que los demás procesos del host la relean de inmediato
+    SESSION_CACHE_TTL = 60
+    SESSION_CACHE_SIGNAL_FILE = os.path.join(os.getcwd(), 'instance',
+                                             'session_cache.signal')
+    # Máximo de sentencias SQL por petición (ver sql_budget.py); con
+    # SQL_QUERY_BUDGET_STRICT=1 (pruebas) superarlo es un error
+    SQL_QUERY_BUDGETS = {
+        'main.index': 1,
+        'records.registros': 2,
+        'records.export': 2,
+        'records.edit_guia_status:GET': 1,
+        'records.edit_guia_status:POST': 7,
+        'records.update_guia_fields': 6,
+        'records.bulk_edit_status': 9,
+    }
+    SQL_QUERY_BUDGET_STRICT = os.environ.get(
+        'SQL_QUERY_BUDGET_STRICT', '0') == '1'
+    # Métricas en /metrics (formato de Prometheus, ver metrics.py); cada
+    # proceso vuelca las suyas en METRICS_DIR cada METRICS_DUMP_SECONDS
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+    METRICS_DIR = os.path.join(os.getcwd(), 'instance', 'metrics')
+    METRICS_DUMP_SECONDS = float(os.environ.get('METRICS_DUMP_SECONDS', 5))
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    # Fracción de escaneos que se registran en el log (eventos JSON)
+    SCAN_LOG_SAMPLE_RATE = float(os.environ.get('SCAN_LOG_SAMPLE_RATE', 0.01))
+    SLOW_REQUEST_SECONDS = 1.0  # Peticiones más lentas se registran siempre
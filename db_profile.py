@@ -0,0 +1,125 @@
+import sqlite3
+from flask import current_app
+from flask.globals import app_ctx
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import scoped_session, sessionmaker
+from models import db
+
+
+# PRAGMAs que se aplican a cada conexión SQLite nueva (perfil 'production')
+_sqlite_pragmas = {}
+
+
+def _is_memory_sqlite(url) -> bool:
+    return url.get_backend_name() == 'sqlite' and \
+        url.database in (None, '', ':memory:')
+
+
+def _pool_options(url, pool_size: int, max_overflow: int,
+                  recycle: int) -> dict:
+    options = {'pool_pre_ping': True, 'pool_recycle': recycle}
+    if not _is_memory_sqlite(url):
+        # SQLite en memoria usa un pool sin tamaño configurable
+        options.update(pool_size=pool_size, max_overflow=max_overflow)
+    return options
+
+
+def _configure_reports_bind(app, url):
+    """
+    Bind 'reports': engine propio para las lecturas de informes (listado de
+    registros, exportación, contadores de las páginas), con su pool y
+    conexiones de solo lectura. Usa REPORTS_DATABASE_URL (p. ej. una
+    réplica de PostgreSQL) o, si no se indica, la misma base de datos.
+    """
+    if _is_memory_sqlite(url):
+        # Otra conexión sería otra base de datos en memoria vacía
+        return
+    reports_url = make_url(app.config.get('REPORTS_DATABASE_URL') or url)
+    options = {'url': reports_url}
+    if app.config.get('DATABASE_PROFILE', 'production') == 'production':
+        options.update(_pool_options(
+            reports_url, app.config['REPORTS_POOL_SIZE'],
+            app.config['REPORTS_MAX_OVERFLOW'],
+            app.config['DATABASE_POOL_RECYCLE']))
+    if reports_url.get_backend_name() == 'postgresql':
+        options['connect_args'] = {
+            'options': '-c default_transaction_read_only=on'}
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    binds.setdefault('reports', options)
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def configure_database(app):
+    """
+    Aplica el perfil de base de datos DATABASE_PROFILE y declara el bind de
+    informes antes de db.init_app. Con 'production' se ajusta el pool de
+    conexiones y, en SQLite, cada conexión usa WAL (los lectores no
+    bloquean al escritor), espera busy_timeout en lugar de fallar con
+    "database is locked" y sincroniza con synchronous=NORMAL. Con 'default'
+    no se cambia la configuración de los engines.
+    """
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    _configure_reports_bind(app, url)
+    if app.config.get('DATABASE_PROFILE', 'production') != 'production':
+        return
+    # Pool pequeño para las escrituras (escaneo, registro, edición)
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    for key, value in _pool_options(
+            url, app.config['DATABASE_POOL_SIZE'],
+            app.config['DATABASE_MAX_OVERFLOW'],
+            app.config['DATABASE_POOL_RECYCLE']).items():
+        options.setdefault(key, value)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    if url.get_backend_name() == 'sqlite':
+        _sqlite_pragmas.update(app.config['SQLITE_PRAGMAS'])
+
+
+@event.listens_for(Engine, 'connect')
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    if not _sqlite_pragmas or \
+            not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in _sqlite_pragmas.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+    cursor.close()
+
+
+def _set_query_only(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA query_only = ON')
+    cursor.close()
+
+
+def _app_ctx_id() -> int:
+    return id(app_ctx._get_current_object())
+
+
+def init_report_session(app):
+    """
+    Crea (tras db.init_app) la sesión de solo lectura sobre el bind
+    'reports', una por contexto de aplicación como db.session.
+    """
+    with app.app_context():
+        engine = db.engines.get('reports')
+    if engine is None:
+        app.extensions['report_session'] = db.session
+        return
+    if engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', _set_query_only)
+    registry = scoped_session(sessionmaker(bind=engine),
+                              scopefunc=_app_ctx_id)
+    app.extensions['report_session'] = registry
+
+    @app.teardown_appcontext
+    def _remove_report_session(exc):
+        registry.remove()
+
+
+def report_session():
+    """
+    Sesión para las consultas de informes: no comparte conexiones con las
+    escrituras y no puede modificar datos.
+    """
+    return current_app.extensions['report_session']
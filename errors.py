@@ -4,7 +4,8 @@ from flask import render_template, flash, redirect, request
 def register_error_handlers(app):
     @app.errorhandler(413)
     def file_too_large(e):
-        flash('El archivo es demasiado grande (máx 2MB).', 'danger')
+        max_mb = (request.max_content_length or 0) / (1024 * 1024)
+        flash(f'El archivo es demasiado grande (máx {max_mb:g}MB).', 'danger')
         return redirect(request.url)
 
     @app.errorhandler(404)
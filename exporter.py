@@ -0,0 +1,180 @@
+import csv
+import io
+import json
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+
+# Columnas de la exportación de guías de una sesión
+EXPORT_COLUMNS = ['Tracking', 'Guía Internacional', 'Fecha Recibido (Guía)',
+                  'Estado Sesión', 'Fecha y Hora Estado']
+
+EXPORT_FORMATS = {
+    'xlsx': ('application/vnd.openxmlformats-officedocument.'
+             'spreadsheetml.sheet'),
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Caracteres de control que no admite XML 1.0
+_ILLEGAL_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/'
+    'content-types">'
+    '<Default Extension="rels" ContentType="application/'
+    'vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/'
+    'vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="'
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.'
+    'worksheet+xml"/>'
+    '</Types>'
+)
+
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/'
+    'relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/'
+    'officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/'
+    'main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/'
+    'relationships">'
+    '<sheets><sheet name="Guias" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/'
+    'relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/'
+    'officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/'
+    'main"><sheetData>'
+)
+
+_SHEET_END = '</sheetData></worksheet>'
+
+
+def _format_dt(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S') if value else 'N/A'
+
+
+def export_row(row) -> list:
+    """
+    Valores de EXPORT_COLUMNS para una fila con tracking, guia_internacional,
+    fecha_recibido, status y timestamp_status_change.
+    """
+    return [row.tracking or 'N/A', row.guia_internacional or 'N/A',
+            _format_dt(row.fecha_recibido), row.status,
+            _format_dt(row.timestamp_status_change)]
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """
+    Destino no posicionable para zipfile: acumula lo escrito hasta que el
+    generador lo entrega al cliente.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _xlsx_row(values) -> str:
+    cells = ''.join(
+        '<c t="inlineStr"><is><t>'
+        f'{escape(_ILLEGAL_XML_CHARS.sub("", str(value)))}'
+        '</t></is></c>'
+        for value in values)
+    return f'<row>{cells}</row>'
+
+
+def stream_xlsx(rows, flush_every: int = 1000):
+    """
+    Genera un XLSX mínimo (una hoja, celdas de texto en línea) a medida que
+    se recorren las filas. El zip se escribe en modo flujo, sin archivo
+    temporal ni la hoja completa en memoria.
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as package:
+        package.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        package.writestr('_rels/.rels', _ROOT_RELS)
+        package.writestr('xl/workbook.xml', _WORKBOOK)
+        package.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        with package.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(_SHEET_START.encode())
+            sheet.write(_xlsx_row(EXPORT_COLUMNS).encode())
+            for i, row in enumerate(rows, 1):
+                sheet.write(_xlsx_row(export_row(row)).encode())
+                if i % flush_every == 0:
+                    yield buffer.drain()
+            sheet.write(_SHEET_END.encode())
+    yield buffer.drain()
+
+
+def stream_csv(rows, flush_every: int = 1000):
+    """
+    Genera el CSV (UTF-8 con BOM para que Excel respete los acentos).
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(EXPORT_COLUMNS)
+    for i, row in enumerate(rows, 1):
+        writer.writerow(export_row(row))
+        if i % flush_every == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def stream_ndjson(rows, flush_every: int = 1000):
+    """
+    Genera un objeto JSON por línea con las claves de EXPORT_COLUMNS.
+    """
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(EXPORT_COLUMNS, export_row(row))),
+                                ensure_ascii=False))
+        if len(lines) >= flush_every:
+            yield ('\n'.join(lines) + '\n').encode()
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode()
+
+
+EXPORT_WRITERS = {
+    'xlsx': stream_xlsx,
+    'csv': stream_csv,
+    'ndjson': stream_ndjson,
+}
@@ -0,0 +1,35 @@
+# Sugerencias "¿quisiste decir...?" para códigos escaneados que no están en
+# el manifiesto: una etiqueta dañada suele leerse con un carácter cambiado,
+# de más o de menos, o con dos caracteres contiguos intercambiados.
+#
+# En lugar de comparar el código con todos los del manifiesto (un árbol BK
+# en Python recorre buena parte de sus nodos con códigos secuenciales como
+# los de un manifiesto), se generan todos los códigos a distancia 1 del
+# leído y se buscan en los diccionarios que el índice del escáner ya
+# mantiene. El coste depende de la longitud del código y del alfabeto, no
+# del tamaño de la sesión.
+
+
+def edit_neighbors(code: str, alphabet) -> set:
+    """
+    Códigos a distancia de edición 1 de code (Damerau, con trasposiciones
+    de caracteres contiguos) formados con los caracteres de alphabet.
+    """
+    splits = [(code[:i], code[i:]) for i in range(len(code) + 1)]
+    neighbors = {left + right[1:] for left, right in splits if right}
+    neighbors.update(left + right[1] + right[0] + right[2:]
+                     for left, right in splits if len(right) > 1)
+    neighbors.update(left + c + right[1:] for left, right in splits
+                     if right for c in alphabet if c != right[0])
+    neighbors.update(left + c + right for left, right in splits
+                     for c in alphabet)
+    neighbors.discard(code)
+    return neighbors
+
+
+def nearest_codes(code: str, codes: dict, alphabet) -> list:
+    """
+    Claves de codes (diccionario {código normalizado: valor}) a distancia 1
+    de code, en orden alfabético.
+    """
+    return sorted(codes.keys() & edit_neighbors(code, alphabet))
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import event, inspect, select, update, delete
+from sqlalchemy.orm import Session as OrmSession
+from models import db, Guia, GuiaSessionStatus, ImportHistory
+
+
+def row_digests(chunk: pd.DataFrame) -> tuple:
+    """
+    Huellas de 64 bits (estables entre procesos) de las filas ya sanitizadas
+    de un bloque del manifiesto: (tracking normalizado, fila completa).
+    """
+    keys = pd.util.hash_pandas_object(chunk['tracking_norm'], index=False)
+    values = pd.util.hash_pandas_object(
+        chunk[['tracking_norm', 'guia_internacional']], index=False)
+    return keys.to_numpy(dtype=np.uint64), values.to_numpy(dtype=np.uint64)
+
+
+def merge_row_digests(known, keys: np.ndarray, values: np.ndarray) -> tuple:
+    """
+    Une las huellas conocidas (ordenadas por tracking) con las de una carga
+    nueva; para un mismo tracking prevalece la fila nueva.
+    """
+    if known is not None:
+        keys = np.concatenate([known[0], keys])
+        values = np.concatenate([known[1], values])
+    order = np.argsort(keys, kind='stable')
+    keys, values = keys[order], values[order]
+    # El orden estable deja la fila más reciente al final de cada tracking
+    last = np.append(keys[1:] != keys[:-1], True)
+    return keys[last], values[last]
+
+
+def find_identical_import(session_id: int, sha256: str):
+    """
+    Última carga de la sesión si el archivo tenía el mismo contenido. Si
+    después se cargó otro archivo, el idéntico se procesa (solo las filas
+    que cambiaron) para volver a dejar sus valores.
+    """
+    last = db.session.execute(
+        select(ImportHistory)
+        .where(ImportHistory.session_id == session_id)
+        .order_by(ImportHistory.id.desc()).limit(1)
+    ).scalar()
+    return last if last is not None and last.sha256 == sha256 else None
+
+
+def known_row_digests(session_id: int):
+    """
+    Huellas (tracking, fila) de las filas cargadas en la sesión, ordenadas
+    por tracking, o None si no hay cargas anteriores registradas.
+    """
+    data = db.session.execute(
+        select(ImportHistory.row_digests)
+        .where(ImportHistory.session_id == session_id,
+               ImportHistory.row_digests.isnot(None))
+        .order_by(ImportHistory.id.desc()).limit(1)
+    ).scalar()
+    if not data:
+        return None
+    digests = np.frombuffer(data, dtype=np.uint64)
+    return digests[:len(digests) // 2], digests[len(digests) // 2:]
+
+
+def record_import_history(session_id: int, sha256: str, filename: str,
+                          n_rows: int, stats: dict, digests: tuple):
+    """
+    Registra una carga terminada dentro de la transacción actual, con las
+    huellas de todas las filas cargadas hasta ahora en la sesión (las de
+    las cargas anteriores dejan de guardarse).
+    """
+    db.session.execute(
+        update(ImportHistory)
+        .where(ImportHistory.session_id == session_id,
+               ImportHistory.row_digests.isnot(None))
+        .values(row_digests=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.add(ImportHistory(
+        session_id=session_id, sha256=sha256, filename=filename,
+        rows=n_rows, n_added_guia=stats['n_added_guia'],
+        n_added_session_status=stats['n_added_session_status'],
+        n_ignored_guia=stats['n_ignored_guia'],
+        n_unchanged_rows=stats.get('n_unchanged_rows', 0),
+        row_digests=np.concatenate(digests).tobytes()))
+
+
+def clear_import_history(session_id: int):
+    """
+    Olvida las cargas de la sesión (p. ej. al eliminar sus guías), para que
+    una nueva carga del mismo archivo se procese entera.
+    """
+    db.session.execute(
+        delete(ImportHistory).where(ImportHistory.session_id == session_id))
+
+
+def forget_imports_with_guias(guia_ids, exclude_session_id: int = None,
+                              connection=None):
+    """
+    Olvida las cargas de las sesiones que contienen alguna de las guías (p.
+    ej. porque sus códigos cambiaron), salvo exclude_session_id, para que
+    una nueva carga del mismo archivo vuelva a procesarse entera.
+    """
+    sessions = select(GuiaSessionStatus.session_id).where(
+        GuiaSessionStatus.guia_id.in_(guia_ids))
+    if exclude_session_id is not None:
+        sessions = sessions.where(
+            GuiaSessionStatus.session_id != exclude_session_id)
+    (connection or db.session).execute(
+        delete(ImportHistory).where(ImportHistory.session_id.in_(sessions)))
+
+
+@event.listens_for(OrmSession, 'before_flush')
+def _forget_edited_guias(orm_session, flush_context, instances):
+    # Un tracking o guía internacional editado a mano deja de coincidir con
+    # lo cargado: las sesiones con esa guía vuelven a procesar todo
+    edited = [
+        guia.id for guia in orm_session.dirty
+        if isinstance(guia, Guia) and guia.id is not None and (
+            inspect(guia).attrs.tracking.history.has_changes() or
+            inspect(guia).attrs.guia_internacional.history.has_changes())
+    ]
+    if edited:
+        forget_imports_with_guias(edited,
+                                  connection=orm_session.connection())
+
+
+def history_stats(history: ImportHistory) -> dict:
+    return {
+        'n_added_guia': history.n_added_guia,
+        'n_added_session_status': history.n_added_session_status,
+        'n_ignored_guia': history.n_ignored_guia,
+        'n_unchanged_rows': history.n_unchanged_rows,
+    }
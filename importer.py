@@ -0,0 +1,339 @@
+import time
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from sqlalchemy import select, update, bindparam
+from models import db, Guia, GuiaSessionStatus
+from utils import SANITIZE_PATTERN, insert_ignore, normalize_codes
+from manifest_index import bump_manifest_version, invalidate
+from session_counters import record_transition
+from pg_bulk import copy_supported, copy_manifest_chunk
+from metrics import record_import
+from import_history import (
+    row_digests, merge_row_digests, known_row_digests, record_import_history,
+    forget_imports_with_guias
+)
+
+
+# Columnas del manifiesto del transportador y su nombre interno
+MANIFEST_COLUMNS = {'TRACKING': 'tracking',
+                    'GUIA INTERNACIONAL': 'guia_internacional'}
+
+
+def _sanitize_column(df: pd.DataFrame, column: str) -> pd.Series:
+    """
+    Versión vectorizada de sanitize_string(str(valor).strip()) para una
+    columna del manifiesto; las celdas vacías o inexistentes quedan como ''.
+    """
+    if column not in df.columns:
+        return pd.Series('', index=df.index, dtype=object)
+    values = df[column].fillna('').astype(str).str.strip()
+    return values.str.replace(SANITIZE_PATTERN, '', regex=True)
+
+
+def _iter_csv_chunks(source, chunk_size: int):
+    # Solo las dos columnas y como texto: un código con ceros a la izquierda
+    # no se convierte en número ni un 'NA' en un valor vacío
+    yield from pd.read_csv(source, usecols=lambda c: c in MANIFEST_COLUMNS,
+                           dtype=str, keep_default_na=False,
+                           chunksize=chunk_size)
+
+
+def _cell_text(value) -> str:
+    # Las celdas numéricas de Excel llegan como int o float (1234.0)
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _iter_xlsx_chunks(source, chunk_size: int):
+    # Modo read-only de openpyxl: recorre las filas sin cargar la hoja entera
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        positions = {column: i for i, column in enumerate(header)
+                     if column in MANIFEST_COLUMNS}
+        batch = []
+        for row in rows:
+            batch.append([_cell_text(row[i]) if i < len(row) else ''
+                          for i in positions.values()])
+            if len(batch) >= chunk_size:
+                yield pd.DataFrame(batch, columns=list(positions))
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=list(positions))
+    finally:
+        workbook.close()
+
+
+class ManifestReadError(ValueError):
+    """El archivo cargado no se pudo leer como manifiesto CSV o XLSX."""
+
+
+def _read_errors(chunks):
+    # Los errores de pandas/openpyxl al leer el archivo (formato inválido,
+    # CSV mal formado, XLSX dañado) se distinguen de los de la base de datos
+    try:
+        yield from chunks
+    except Exception as e:
+        raise ManifestReadError(str(e)) from e
+
+
+def iter_manifest_chunks(source, extension: str, chunk_size: int = 5000):
+    """
+    Lee un manifiesto CSV o XLSX (ruta o archivo) en bloques de chunk_size
+    filas, solo con las columnas TRACKING y GUIA INTERNACIONAL, para que la
+    memoria no dependa del tamaño del archivo. Los errores de lectura se
+    lanzan como ManifestReadError.
+    """
+    if extension.lower() == 'csv':
+        return _read_errors(_iter_csv_chunks(source, chunk_size))
+    return _read_errors(_iter_xlsx_chunks(source, chunk_size))
+
+
+class ManifestImporter:
+    """
+    Carga masiva de un manifiesto en una sesión, por bloques de filas.
+    Cada bloque se resuelve con consultas por conjuntos e inserciones
+    masivas en lugar de consultas por fila.
+    """
+
+    def __init__(self, session_id: int, chunk_size: int = 5000,
+                 on_chunk=None, known_rows: tuple = None):
+        self.session_id = session_id
+        self.chunk_size = chunk_size
+        # Llamado con el importador tras procesar cada bloque, antes de su
+        # commit (p. ej. para guardar el progreso de un ImportJob)
+        self.on_chunk = on_chunk
+        # Huellas (tracking, fila) de las cargas anteriores de la sesión,
+        # ordenadas por tracking (ver import_history.py): las filas que no
+        # cambiaron ya están aplicadas y no se vuelven a consultar. Las
+        # huellas de las filas se actualizan al aplicar cada bloque.
+        if known_rows is not None:
+            known_rows = (known_rows[0], known_rows[1].copy())
+        self.known_rows = known_rows
+        self._row_keys = []
+        self._row_values = []
+        self.n_unchanged_rows = 0
+        self.n_added_guia = 0
+        self.n_added_session_status = 0
+        self.n_ignored_guia = 0
+        self.n_rows = 0
+
+    def stats(self) -> dict:
+        return {
+            'n_added_guia': self.n_added_guia,
+            'n_added_session_status': self.n_added_session_status,
+            'n_ignored_guia': self.n_ignored_guia,
+            'n_unchanged_rows': self.n_unchanged_rows,
+        }
+
+    def row_digests(self) -> tuple:
+        """
+        Huellas de las filas cargadas en la sesión, incluidas las de cargas
+        anteriores que este archivo no cambia.
+        """
+        empty = np.empty(0, dtype=np.uint64)
+        return merge_row_digests(self.known_rows,
+                                 np.concatenate(self._row_keys + [empty]),
+                                 np.concatenate(self._row_values + [empty]))
+
+    def add_dataframe(self, df: pd.DataFrame):
+        """
+        Procesa todas las filas de un DataFrame con las columnas del
+        manifiesto, confirmando cada bloque de chunk_size filas.
+        """
+        for start in range(0, len(df), self.chunk_size):
+            self.add_chunk(df.iloc[start:start + self.chunk_size])
+
+    def add_chunk(self, df: pd.DataFrame):
+        """
+        Procesa y confirma un bloque de filas. Cada bloque es una transacción
+        corta, así el bloqueo de escritura de SQLite no se mantiene durante
+        toda la carga y los escáneres pueden seguir trabajando.
+        """
+        self.n_rows += len(df)
+        self._add_chunk(df)
+        if self.on_chunk:
+            self.on_chunk(self)
+        db.session.commit()
+
+    def _add_chunk(self, df: pd.DataFrame):
+        chunk = pd.DataFrame({name: _sanitize_column(df, column)
+                              for column, name in MANIFEST_COLUMNS.items()})
+
+        # Códigos normalizados como en Guia (utils.normalize_code)
+        chunk['tracking_norm'] = normalize_codes(chunk['tracking'])
+        chunk['guia_internacional_norm'] = normalize_codes(
+            chunk['guia_internacional'])
+
+        # Filas sin alguno de los dos códigos
+        valid = (chunk['tracking_norm'] != '') & \
+                (chunk['guia_internacional_norm'] != '')
+        self.n_ignored_guia += int((~valid).sum())
+        chunk = chunk[valid]
+
+        # Duplicados dentro del archivo: prevalece la última guía
+        # internacional. Los de bloques anteriores ya están en la base de
+        # datos y se actualizan como cualquier guía existente.
+        deduped = chunk.drop_duplicates('tracking_norm', keep='last')
+        self.n_ignored_guia += len(chunk) - len(deduped)
+        if deduped.empty:
+            return
+
+        keys, values = row_digests(deduped)
+        self._row_keys.append(keys)
+        self._row_values.append(values)
+        known_keys, known_values = self.known_rows or (None, None)
+        if known_keys is not None and len(known_keys):
+            # Filas idénticas a las de la última carga de su tracking
+            position = np.searchsorted(known_keys, keys)
+            position[position == len(known_keys)] = 0
+            found = known_keys[position] == keys
+            unchanged = found & (known_values[position] == values)
+            # Un tracking repetido en un bloque posterior se compara con la
+            # fila que deja este archivo, no con la de la carga anterior
+            known_values[position[found]] = values[found]
+            n_unchanged = int(unchanged.sum())
+            self.n_unchanged_rows += n_unchanged
+            self.n_ignored_guia += n_unchanged
+            deduped = deduped[~unchanged]
+            if deduped.empty:
+                return
+
+        if copy_supported(db.session):
+            # PostgreSQL: COPY a una tabla temporal y SQL por conjuntos
+            n_added_guia, added, updated_ids = copy_manifest_chunk(
+                self.session_id, deduped)
+            if updated_ids:
+                forget_imports_with_guias(updated_ids, self.session_id)
+            self.n_added_guia += n_added_guia
+            self.n_ignored_guia += len(deduped) - added
+            self.n_added_session_status += added
+            record_transition(self.session_id, None, 'NO RECIBIDO', added)
+            return
+
+        rows = deduped.to_dict('records')
+        existing = self._existing_guias([r['tracking_norm'] for r in rows])
+
+        # Guías existentes: actualizar la guía internacional si cambió
+        changed = [
+            {'b_id': existing[r['tracking_norm']][0],
+             'b_guia': r['guia_internacional'],
+             'b_guia_norm': r['guia_internacional_norm']}
+            for r in rows
+            if r['tracking_norm'] in existing and
+            existing[r['tracking_norm']][1] != r['guia_internacional']
+        ]
+        if changed:
+            guia = Guia.__table__
+            db.session.execute(
+                update(guia).where(guia.c.id == bindparam('b_id')).values(
+                    guia_internacional=bindparam('b_guia'),
+                    guia_internacional_norm=bindparam('b_guia_norm')),
+                changed
+            )
+            # Otras sesiones con estas guías tenían registrados los valores
+            # anteriores (UPDATE de Core: no pasa por before_flush)
+            forget_imports_with_guias([c['b_id'] for c in changed],
+                                      self.session_id)
+
+        # Guías nuevas
+        new_rows = [r for r in rows if r['tracking_norm'] not in existing]
+        if new_rows:
+            db.session.execute(Guia.__table__.insert(), [
+                {'tracking': r['tracking'],
+                 'guia_internacional': r['guia_internacional'],
+                 'tracking_norm': r['tracking_norm'],
+                 'guia_internacional_norm': r['guia_internacional_norm'],
+                 'fecha_recibido': None}
+                for r in new_rows
+            ])
+            self.n_added_guia += len(new_rows)
+            existing.update(self._existing_guias(
+                [r['tracking_norm'] for r in new_rows]))
+
+        # Guías ya cargadas en la sesión
+        guia_ids = {existing[r['tracking_norm']][0] for r in rows}
+        in_session = set(db.session.execute(
+            select(GuiaSessionStatus.guia_id).where(
+                GuiaSessionStatus.session_id == self.session_id,
+                GuiaSessionStatus.guia_id.in_(guia_ids))
+        ).scalars())
+        self.n_ignored_guia += len(in_session)
+
+        added = insert_ignore(GuiaSessionStatus, [
+            {'session_id': self.session_id, 'guia_id': guia_id,
+             'status': 'NO RECIBIDO'}
+            for guia_id in guia_ids - in_session
+        ], ['session_id', 'guia_id'])
+        self.n_ignored_guia += len(guia_ids - in_session) - added
+        self.n_added_session_status += added
+        record_transition(self.session_id, None, 'NO RECIBIDO', added)
+
+    def _existing_guias(self, tracking_norms: list) -> dict:
+        """
+        {tracking_norm: (id, guia_internacional)} de las guías ya existentes,
+        con una sola consulta. Si hay varias con el mismo tracking se usa la
+        más antigua.
+        """
+        found = {}
+        rows = db.session.execute(
+            select(Guia.tracking_norm, Guia.id, Guia.guia_internacional)
+            .where(Guia.tracking_norm.in_(tracking_norms))
+            .order_by(Guia.id.desc())
+        )
+        for tracking_norm, guia_id, guia_internacional in rows:
+            found[tracking_norm] = (guia_id, guia_internacional)
+        return found
+
+    def finish(self) -> dict:
+        """
+        Invalida los índices del manifiesto de la sesión y confirma. También
+        se llama si la carga falla, porque los bloques ya confirmados quedan.
+        """
+        bump_manifest_version(self.session_id)
+        invalidate(self.session_id)
+        db.session.commit()
+        return self.stats()
+
+
+def import_manifest(df: pd.DataFrame, session_id: int,
+                    chunk_size: int = 5000) -> dict:
+    """
+    Importa un manifiesto (DataFrame con columnas TRACKING y GUIA
+    INTERNACIONAL) en la sesión. Devuelve n_added_guia,
+    n_added_session_status y n_ignored_guia.
+    """
+    return import_manifest_chunks([df], session_id, chunk_size)
+
+
+def import_manifest_chunks(chunks, session_id: int, chunk_size: int = 5000,
+                           on_chunk=None, sha256: str = None,
+                           filename: str = None) -> dict:
+    """
+    Igual que import_manifest para un iterable de DataFrames (por ejemplo
+    iter_manifest_chunks), confirmando cada bloque por separado. Con el
+    sha256 del archivo, la carga se registra en el historial de la sesión y
+    las filas idénticas a las de cargas anteriores se saltan.
+    """
+    known_rows = known_row_digests(session_id) if sha256 else None
+    importer = ManifestImporter(session_id, chunk_size, on_chunk, known_rows)
+    start = time.perf_counter()
+    try:
+        for df in chunks:
+            importer.add_dataframe(df)
+    except Exception:
+        db.session.rollback()
+        importer.finish()
+        raise
+    if sha256:
+        record_import_history(session_id, sha256, filename or '',
+                              importer.n_rows, importer.stats(),
+                              importer.row_digests())
+    stats = importer.finish()
+    record_import(importer.n_rows, time.perf_counter() - start)
+    return stats
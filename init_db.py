@@ -1,4 +1,6 @@
 from app import app, db
+from schema import upgrade_schema
 with app.app_context():
     db.create_all()
+    upgrade_schema()
 print("Base de datos inicializada.")
@@ -0,0 +1,132 @@
+import os
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from flask import current_app
+from models import db, ImportJob
+from utils import import_manifest_file, import_error_message
+
+# Mensaje de las cargas que quedaron sin terminar al detenerse su proceso
+INTERRUPTED_JOB_ERROR = ('La carga se interrumpió porque se reinició el '
+                         'servidor. Los bloques ya importados se conservan; '
+                         'vuelva a cargar el archivo para completarla.')
+
+
+def init_jobs(app):
+    """
+    Crea el pool de hilos local que ejecuta las cargas de manifiestos en
+    segundo plano (IMPORT_WORKERS hilos por proceso) y da por fallidas las
+    cargas que un reinicio dejó a medias.
+    """
+    app.extensions['import_jobs'] = ThreadPoolExecutor(
+        max_workers=app.config.get('IMPORT_WORKERS', 1),
+        thread_name_prefix='import-job')
+    with app.app_context():
+        recovered = recover_import_jobs()
+    if recovered:
+        app.logger.warning('%d cargas interrumpidas marcadas como fallidas',
+                           recovered)
+
+
+def job_worker() -> str:
+    """Identificador 'host:pid' del proceso actual para ImportJob.worker."""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _worker_alive(worker: str) -> bool:
+    # Solo se puede comprobar un proceso de este mismo host; el pid del
+    # proceso actual no puede tener cargas propias al arrancar (pid reusado)
+    host, _, pid = (worker or '').rpartition(':')
+    if host != socket.gethostname():
+        return bool(host)
+    if not pid.isdigit() or int(pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def recover_import_jobs() -> int:
+    """
+    Marca como fallidas las cargas en cola o en curso cuyo proceso ya no
+    existe: el pool de hilos es local al proceso, así que nadie las
+    terminaría y su estado quedaría en 'queued'/'running' para siempre. Las
+    de otros procesos vivos (otros workers de gunicorn) no se tocan.
+    Devuelve el número de cargas marcadas.
+    """
+    jobs = ImportJob.query.filter(
+        ImportJob.status.in_(('queued', 'running'))).all()
+    interrupted = [job for job in jobs if not _worker_alive(job.worker)]
+    for job in interrupted:
+        job.status = 'failed'
+        job.error = INTERRUPTED_JOB_ERROR
+        job.finished_at = datetime.utcnow()
+    db.session.commit()
+    return len(interrupted)
+
+
+def submit_import_job(job: ImportJob, stream, extension: str):
+    """
+    Encola la carga de un ImportJob ya guardado (estado 'queued') desde el
+    búfer del archivo cargado (ver upload_stream.detach_stream). El trabajo
+    cierra el búfer al terminar.
+    """
+    app = current_app._get_current_object()
+    try:
+        app.extensions['import_jobs'].submit(_run_import_job, app, job.id,
+                                             stream, extension)
+    except Exception:
+        stream.close()
+        raise
+
+
+def _run_import_job(app, job_id: int, stream, extension: str):
+    # El archivo temporal del búfer (si lo hay) se borra al cerrarlo
+    with stream, app.app_context():
+        job = db.session.get(ImportJob, job_id)
+        job.status = 'running'
+        job.started_at = datetime.utcnow()
+        db.session.commit()
+
+        def save_progress(importer):
+            # Se guarda en la misma transacción que el bloque importado
+            job.rows_processed = importer.n_rows
+            job.n_added_guia = importer.n_added_guia
+            job.n_added_session_status = importer.n_added_session_status
+            job.n_ignored_guia = importer.n_ignored_guia
+
+        try:
+            stats = import_manifest_file(stream, extension, job.session_id,
+                                         app.config, on_chunk=save_progress,
+                                         sha256=job.sha256,
+                                         filename=job.filename)
+        except Exception as e:
+            app.logger.exception('Falló la carga %s', job_id)
+            db.session.rollback()
+            job.status = 'failed'
+            job.error = import_error_message(e)
+        else:
+            job.status = 'done'
+            job.n_added_guia = stats['n_added_guia']
+            job.n_added_session_status = stats['n_added_session_status']
+            job.n_ignored_guia = stats['n_ignored_guia']
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+
+
+def job_to_dict(job: ImportJob) -> dict:
+    return {
+        'id': job.id,
+        'session_id': job.session_id,
+        'filename': job.filename,
+        'status': job.status,
+        'rows_processed': job.rows_processed,
+        'n_added_guia': job.n_added_guia,
+        'n_added_session_status': job.n_added_session_status,
+        'n_ignored_guia': job.n_ignored_guia,
+        'error': job.error,
+    }
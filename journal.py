@@ -0,0 +1,326 @@
+import atexit
+import fcntl
+import glob
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+from itertools import groupby
+from flask import current_app
+from sqlalchemy.exc import OperationalError, InterfaceError
+from models import db, Session
+
+
+class ScanJournalError(Exception):
+    """
+    El escaneo no se pudo anotar en el diario (error de escritura o fsync,
+    o espera mayor que SCAN_JOURNAL_TIMEOUT): hay que escanear de forma
+    síncrona.
+    """
+
+
+class ScanJournal:
+    """
+    Diario de escaneos del proceso (modo SCAN_WRITE_BEHIND): /scan responde
+    en cuanto el escaneo está escrito y sincronizado (fsync) en un archivo
+    de solo anexado, y un hilo lo aplica después a la base de datos en
+    transacciones agrupadas. Las escrituras de varios escaneos simultáneos
+    comparten un mismo fsync.
+    """
+
+    def __init__(self, app, path: str):
+        self.app = app
+        self.path = path
+        # Sin búfer de Python: tras un error de escritura no queda nada por
+        # escribir que se vuelque al cerrar el archivo
+        self._file = open(path, 'ab', buffering=0)
+        fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        _fsync_dir(os.path.dirname(path))
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._buffer = []
+        self._seq = 0  # Último escaneo anotado
+        self._written_seq = 0  # Último escaneo que tomó el hilo de escritura
+        self._durable_seq = 0  # Último escaneo sincronizado en disco
+        self._applied_seq = 0  # Último escaneo aplicado en la base de datos
+        self._pending = set()  # (session_id, guia_id) recibidas sin aplicar
+        self._to_apply = queue.Queue()
+        # Error de escritura del diario: a partir de él todo escaneo nuevo
+        # se hace de forma síncrona
+        self._error = None
+        self._durable_size = os.fstat(self._file.fileno()).st_size
+        threading.Thread(target=self._write_loop, name='scan-journal-writer',
+                         daemon=True).start()
+        threading.Thread(target=self._apply_loop, name='scan-journal-apply',
+                         daemon=True).start()
+
+    def claim(self, session_id: int, guia_id: int) -> bool:
+        """
+        Marca la guía como recibida a falta de aplicar. Devuelve False si ya
+        lo estaba (un segundo escaneo antes de que se aplique el primero).
+        """
+        with self._cond:
+            if (session_id, guia_id) in self._pending:
+                return False
+            self._pending.add((session_id, guia_id))
+            return True
+
+    def release(self, session_id: int, guia_id: int):
+        """Deshace claim cuando el escaneo no llegó a anotarse."""
+        with self._cond:
+            self._pending.discard((session_id, guia_id))
+
+    def is_pending(self, session_id: int, guia_id: int) -> bool:
+        with self._cond:
+            return (session_id, guia_id) in self._pending
+
+    def append(self, session_id: int, code: str, code_type: str = None,
+               guia_id: int = None, scanned_at: datetime = None):
+        """
+        Anota un escaneo y espera a que esté sincronizado en disco. Lanza
+        ScanJournalError si el diario no puede escribirse o si la espera
+        supera SCAN_JOURNAL_TIMEOUT segundos.
+        """
+        entry = {
+            'client_id': f'journal-{uuid.uuid4().hex}',
+            'session_id': session_id,
+            'guia_id': guia_id,
+            'code': code,
+            'code_type': code_type,
+            'scanned_at': (scanned_at or datetime.utcnow()).isoformat(),
+        }
+        line = (json.dumps(entry) + '\n').encode()
+        deadline = time.monotonic() + self.app.config.get(
+            'SCAN_JOURNAL_TIMEOUT', 5)
+        with self._cond:
+            if self._error is not None:
+                raise ScanJournalError(str(self._error))
+            self._seq += 1
+            entry['seq'] = seq = self._seq
+            item = (entry, line)
+            self._buffer.append(item)
+            self._cond.notify_all()
+            while self._durable_seq < seq:
+                remaining = deadline - time.monotonic()
+                if self._error is not None or remaining <= 0:
+                    if item in self._buffer:
+                        # Aún no se escribió: no se aplicará. Si ya se está
+                        # escribiendo, el diario lo aplicará igualmente
+                        # (como un escaneo repetido, YA RECIBIDO).
+                        self._buffer.remove(item)
+                    raise ScanJournalError(
+                        str(self._error or 'tiempo de espera agotado'))
+                self._cond.wait(remaining)
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while not self._buffer:
+                    self._cond.wait()
+                batch, self._buffer = self._buffer, []
+                self._written_seq = batch[-1][0]['seq']
+            try:
+                with self._io_lock:
+                    data = memoryview(b''.join(line for _, line in batch))
+                    while data:
+                        data = data[self._file.write(data):]
+                    os.fsync(self._file.fileno())
+                    self._durable_size = self._file.tell()
+            except OSError as e:
+                self._fail(e)
+                return
+            with self._cond:
+                self._durable_seq = batch[-1][0]['seq']
+                self._cond.notify_all()
+            for entry, _ in batch:
+                self._to_apply.put(entry)
+
+    def _fail(self, error: OSError):
+        # Disco lleno o error de E/S: los escaneos que esperan su fsync y los
+        # siguientes pasan al escaneo síncrono. Se recorta lo escrito a
+        # medias para que el diario siga siendo legible al reaplicarlo.
+        self.app.logger.exception('Diario de escaneos %s: error de escritura; '
+                                  'se escaneará de forma síncrona', self.path)
+        with self._io_lock:
+            try:
+                os.ftruncate(self._file.fileno(), self._durable_size)
+            except OSError:
+                pass
+        with self._cond:
+            self._error = error
+            self._buffer = []
+            self._written_seq = self._durable_seq
+            self._cond.notify_all()
+
+    def _apply_loop(self):
+        max_items = self.app.config.get('SCAN_BATCH_MAX_ITEMS', 500)
+        while True:
+            entries = [self._to_apply.get()]
+            while len(entries) < max_items:
+                try:
+                    entries.append(self._to_apply.get_nowait())
+                except queue.Empty:
+                    break
+            apply_or_set_aside(self.app, entries)
+            with self._cond:
+                self._applied_seq = entries[-1]['seq']
+                for entry in entries:
+                    self._pending.discard((entry['session_id'],
+                                           entry.get('guia_id')))
+                if self._applied_seq == self._written_seq:
+                    # Todo lo anotado ya está en la base de datos
+                    with self._io_lock:
+                        os.ftruncate(self._file.fileno(), 0)
+                        self._durable_size = 0
+                self._cond.notify_all()
+
+    def close(self, timeout: float = 5):
+        """
+        Espera (hasta timeout segundos) a que se apliquen los escaneos
+        anotados; lo que quede se aplicará al arrancar de nuevo.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._buffer or self._applied_seq < self._written_seq:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+
+def _fsync_dir(path: str):
+    # Que la creación del archivo también sobreviva a un corte de luz
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def apply_entries(app, entries: list) -> Exception:
+    """
+    Aplica en una sola transacción una lista ordenada de escaneos del
+    diario. Si falla, deshace, registra el error y lo devuelve.
+    """
+    from routes.scan import process_scan_batch
+    with app.app_context():
+        try:
+            for session_id, items in groupby(entries,
+                                             lambda e: e['session_id']):
+                session = db.session.get(Session, session_id)
+                if session is None:
+                    app.logger.warning('Diario de escaneos: la sesión %s ya '
+                                       'no existe', session_id)
+                    continue
+                process_scan_batch(session, [
+                    dict(item,
+                         scanned_at=datetime.fromisoformat(item['scanned_at']))
+                    for item in items])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.exception('No se pudo aplicar el diario de escaneos')
+            return e
+    return None
+
+
+def _set_aside(app, entry: dict, error: Exception):
+    # Escaneos que no se pueden aplicar, para revisarlos a mano; fuera del
+    # patrón *.jsonl para que no se reapliquen al arrancar
+    path = os.path.join(app.config['SCAN_JOURNAL_DIR'], 'scan_journal.dead')
+    line = json.dumps(dict(entry, error=str(error))) + '\n'
+    with open(path, 'a', encoding='utf-8') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+    app.logger.error('Diario de escaneos: escaneo %s apartado en %s',
+                     entry.get('client_id'), path)
+
+
+def apply_or_set_aside(app, entries: list, wait_for_database: bool = True):
+    """
+    Aplica una lista ordenada de escaneos del diario. Los errores de
+    conexión con la base de datos se reintentan cada segundo (o se lanzan
+    con wait_for_database=False); con cualquier otro error el lote se
+    divide en mitades hasta aislar los escaneos que fallan, que tras
+    SCAN_JOURNAL_MAX_ATTEMPTS intentos se apartan en scan_journal.dead.
+    Reaplicar un escaneo ya guardado no lo duplica (client_id).
+    """
+    max_attempts = app.config.get('SCAN_JOURNAL_MAX_ATTEMPTS', 3)
+    attempts = 0
+    while True:
+        error = apply_entries(app, entries)
+        if error is None:
+            return
+        if isinstance(error, (OperationalError, InterfaceError)):
+            if not wait_for_database:
+                raise error
+        elif len(entries) > 1:
+            half = len(entries) // 2
+            apply_or_set_aside(app, entries[:half], wait_for_database)
+            apply_or_set_aside(app, entries[half:], wait_for_database)
+            return
+        else:
+            attempts += 1
+            if attempts >= max_attempts:
+                _set_aside(app, entries[0], error)
+                return
+        time.sleep(1)
+
+
+def _read_journal(f) -> list:
+    entries = []
+    for line in f:
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            # Última línea a medio escribir: nunca se confirmó al escáner
+            break
+    return entries
+
+
+def replay_journals(app):
+    """
+    Aplica los diarios que dejaron procesos terminados (los que no tienen
+    un proceso vivo que los bloquee) y los borra.
+    """
+    pattern = os.path.join(app.config['SCAN_JOURNAL_DIR'], '*.jsonl')
+    max_items = app.config.get('SCAN_BATCH_MAX_ITEMS', 500)
+    for path in sorted(glob.glob(pattern)):
+        with open(path, 'rb') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            entries = _read_journal(f)
+            for start in range(0, len(entries), max_items):
+                apply_or_set_aside(app, entries[start:start + max_items],
+                                   wait_for_database=False)
+            if entries:
+                app.logger.info('Diario de escaneos %s: %s escaneos '
+                                'reaplicados', path, len(entries))
+            os.remove(path)
+
+
+def init_journal(app):
+    """
+    Reaplica los diarios pendientes y, con SCAN_WRITE_BEHIND, abre el
+    diario de este proceso.
+    """
+    os.makedirs(app.config['SCAN_JOURNAL_DIR'], exist_ok=True)
+    replay_journals(app)
+    if not app.config.get('SCAN_WRITE_BEHIND'):
+        return
+    path = os.path.join(app.config['SCAN_JOURNAL_DIR'],
+                        f'scan_journal.{os.getpid()}.jsonl')
+    journal = ScanJournal(app, path)
+    app.extensions['scan_journal'] = journal
+    atexit.register(journal.close)
+
+
+def get_journal():
+    return current_app.extensions.get('scan_journal')
@@ -0,0 +1,248 @@
+import threading
+from collections import namedtuple
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session as OrmSession
+from models import db, Guia, Session, GuiaSessionStatus
+from utils import normalize_code
+from fuzzy import nearest_codes
+
+
+# Lo que el escáner necesita saber de una guía de la sesión sin ir a la BD
+ManifestEntry = namedtuple('ManifestEntry', [
+    'guia_id', 'status_id', 'status', 'tracking', 'guia_internacional',
+    'fecha_recibido'
+])
+
+_OPS_KEY = 'manifest_index_ops'
+
+
+class ManifestIndex:
+    """
+    Índice en memoria de las guías de una sesión, por código normalizado
+    de tracking y de guía internacional.
+    """
+
+    def __init__(self, session_id: int, version: int):
+        self.session_id = session_id
+        self.version = version
+        self.by_guia = {}
+        self.by_tracking = {}
+        self.by_guia_internacional = {}
+        # Caracteres de los códigos indexados (para las sugerencias)
+        self.alphabet = set()
+
+    def put(self, entry: ManifestEntry):
+        self.discard(entry.guia_id)
+        self.by_guia[entry.guia_id] = entry
+        tracking = normalize_code(entry.tracking)
+        guia_internacional = normalize_code(entry.guia_internacional)
+        if tracking:
+            self.by_tracking.setdefault(tracking, entry.guia_id)
+            self.alphabet.update(tracking)
+        if guia_internacional:
+            self.by_guia_internacional.setdefault(guia_internacional,
+                                                  entry.guia_id)
+            self.alphabet.update(guia_internacional)
+
+    def discard(self, guia_id: int):
+        entry = self.by_guia.pop(guia_id, None)
+        if not entry:
+            return
+        tracking = normalize_code(entry.tracking)
+        guia_internacional = normalize_code(entry.guia_internacional)
+        if self.by_tracking.get(tracking) == guia_id:
+            del self.by_tracking[tracking]
+        if self.by_guia_internacional.get(guia_internacional) == guia_id:
+            del self.by_guia_internacional[guia_internacional]
+
+    def lookup(self, code: str, code_type: str = None):
+        """
+        Devuelve la ManifestEntry del código (ya normalizado) o None.
+        """
+        guia_id = None
+        if code_type in (None, 'tracking'):
+            guia_id = self.by_tracking.get(code)
+        if guia_id is None and code_type in (None, 'guia_internacional'):
+            guia_id = self.by_guia_internacional.get(code)
+        return self.by_guia.get(guia_id) if guia_id is not None else None
+
+    def nearest(self, code: str, code_type: str = None,
+                limit: int = 3) -> list:
+        """
+        Hasta limit guías esperadas de la sesión (no 'NO ESPERADO') con un
+        código a distancia de edición 1 de code (ya normalizado), como
+        (campo, código, ManifestEntry). Primero las pendientes de recibir.
+        """
+        matches = {}
+        for field, codes in (('tracking', self.by_tracking),
+                             ('guia_internacional',
+                              self.by_guia_internacional)):
+            if code_type not in (None, field):
+                continue
+            for near in nearest_codes(code, codes, self.alphabet):
+                entry = self.by_guia.get(codes[near])
+                if entry and entry.status != 'NO ESPERADO':
+                    matches.setdefault(entry.guia_id, (field, near, entry))
+        return sorted(matches.values(), key=lambda match: (
+            match[2].status not in ('NO RECIBIDO', 'NO ESCANEADO'),
+            match[1]))[:limit]
+
+    def set_status(self, guia_id: int, status: str, fecha_recibido=None):
+        entry = self.by_guia.get(guia_id)
+        if entry:
+            changes = {'status': status}
+            if fecha_recibido is not None:
+                changes['fecha_recibido'] = fecha_recibido
+            self.by_guia[guia_id] = entry._replace(**changes)
+
+    def __len__(self):
+        return len(self.by_guia)
+
+
+_indexes = {}
+_lock = threading.RLock()
+
+
+def _build_index(session_id: int, version: int) -> ManifestIndex:
+    index = ManifestIndex(session_id, version)
+    rows = db.session.execute(
+        select(Guia.id, GuiaSessionStatus.id, GuiaSessionStatus.status,
+               Guia.tracking, Guia.guia_internacional, Guia.fecha_recibido)
+        .join(Guia, Guia.id == GuiaSessionStatus.guia_id)
+        .where(GuiaSessionStatus.session_id == session_id)
+    )
+    for row in rows:
+        index.put(ManifestEntry(*row))
+    return index
+
+
+def get_manifest_index(session: Session) -> ManifestIndex:
+    """
+    Devuelve el índice del proceso para la sesión, reconstruyéndolo solo si
+    otro proceso cambió el manifiesto (Session.manifest_version distinto).
+    """
+    with _lock:
+        index = _indexes.get(session.id)
+        if index is not None and index.version == session.manifest_version:
+            return index
+    index = _build_index(session.id, session.manifest_version)
+    with _lock:
+        _indexes[session.id] = index
+    return index
+
+
+def _pending_ops():
+    return db.session.info.setdefault(_OPS_KEY, [])
+
+
+def bump_manifest_version(*session_ids: int):
+    """
+    Incrementa Session.manifest_version dentro de la transacción actual para
+    que los demás procesos reconstruyan su índice de esas sesiones. Solo
+    hace falta si cambian o desaparecen guías ya indexadas (cargas,
+    ediciones, cambios masivos): una guía nueva en la sesión se añade con
+    record_entry, y los demás procesos la encuentran en la base de datos
+    cuando no está en su índice (ver routes.scan.process_scan).
+    """
+    for session_id in session_ids:
+        db.session.execute(
+            update(Session).where(Session.id == session_id)
+            .values(manifest_version=Session.manifest_version + 1)
+        )
+        new_version = db.session.execute(
+            select(Session.manifest_version).where(Session.id == session_id)
+        ).scalar()
+        _pending_ops().append(('version', session_id, new_version))
+
+
+def bump_manifest_version_for_guia(guia_id: int):
+    """
+    Igual que bump_manifest_version, para todas las sesiones que contienen
+    la guía (p. ej. al corregir sus códigos).
+    """
+    session_ids = db.session.execute(
+        select(GuiaSessionStatus.session_id)
+        .where(GuiaSessionStatus.guia_id == guia_id)
+    ).scalars().all()
+    bump_manifest_version(*session_ids)
+
+
+def record_entry(session_id: int, entry: ManifestEntry):
+    """
+    Añade o reemplaza una guía en el índice local al confirmar la transacción.
+    """
+    _pending_ops().append(('put', session_id, entry))
+
+
+def record_status(session_id: int, guia_id: int, status: str,
+                  fecha_recibido=None):
+    """
+    Actualiza el estado de una guía en el índice local al confirmar la
+    transacción.
+    """
+    _pending_ops().append(('status', session_id, guia_id, status,
+                           fecha_recibido))
+
+
+def record_guia(guia: Guia):
+    """
+    Refleja en todos los índices locales los códigos actuales de una guía.
+    """
+    _pending_ops().append(('guia', guia.id, guia.tracking,
+                           guia.guia_internacional))
+
+
+def invalidate(session_id: int = None):
+    """
+    Descarta el índice local de una sesión (o todos) tras confirmar.
+    """
+    _pending_ops().append(('drop', session_id))
+
+
+def _apply_ops(ops):
+    with _lock:
+        # Si otro proceso cambió el manifiesto entre medias, el índice local
+        # ya no es fiable: se descarta y se reconstruirá al próximo uso.
+        for op in ops:
+            if op[0] == 'version':
+                _, session_id, new_version = op
+                index = _indexes.get(session_id)
+                if index is not None and index.version == new_version - 1:
+                    index.version = new_version
+                else:
+                    _indexes.pop(session_id, None)
+        for op in ops:
+            kind = op[0]
+            if kind == 'put':
+                index = _indexes.get(op[1])
+                if index is not None:
+                    index.put(op[2])
+            elif kind == 'status':
+                index = _indexes.get(op[1])
+                if index is not None:
+                    index.set_status(*op[2:])
+            elif kind == 'guia':
+                _, guia_id, tracking, guia_internacional = op
+                for index in _indexes.values():
+                    entry = index.by_guia.get(guia_id)
+                    if entry:
+                        index.put(entry._replace(
+                            tracking=tracking,
+                            guia_internacional=guia_internacional))
+            elif kind == 'drop':
+                if op[1] is None:
+                    _indexes.clear()
+                else:
+                    _indexes.pop(op[1], None)
+
+
+@event.listens_for(OrmSession, 'after_commit')
+def _after_commit(orm_session):
+    ops = orm_session.info.pop(_OPS_KEY, None)
+    if ops:
+        _apply_ops(ops)
+
+
+@event.listens_for(OrmSession, 'after_rollback')
+def _after_rollback(orm_session):
+    orm_session.info.pop(_OPS_KEY, None)
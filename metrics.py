@@ -0,0 +1,357 @@
+import bisect
+import fcntl
+import glob
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from flask import Response, current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session as OrmSession
+
+
+# Métricas de la aplicación en formato de texto de Prometheus, sin
+# dependencias: cada proceso acumula las suyas en memoria y las vuelca
+# periódicamente en METRICS_DIR; /metrics suma las de todos los procesos
+# vivos del host (workers de gunicorn).
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                    10.0)
+_SQL_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                1.0)
+_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+# nombre: (tipo, ayuda, etiquetas, buckets o cómo se suman los gauges)
+METRICS = {
+    'http_requests_total': (
+        'counter', 'Peticiones HTTP atendidas',
+        ('endpoint', 'method', 'status'), None),
+    'http_request_duration_seconds': (
+        'histogram', 'Duración de las peticiones HTTP (hasta el final de la '
+        'respuesta)', ('endpoint', 'method'), _LATENCY_BUCKETS),
+    'sql_statements_per_request': (
+        'histogram', 'Sentencias SQL ejecutadas por petición',
+        ('endpoint',), _COUNT_BUCKETS),
+    'sql_seconds_per_request': (
+        'histogram', 'Tiempo en sentencias SQL por petición',
+        ('endpoint',), _LATENCY_BUCKETS),
+    'sql_statement_duration_seconds': (
+        'histogram', 'Duración de cada sentencia SQL',
+        ('operation',), _SQL_BUCKETS),
+    'db_commits_total': (
+        'counter', 'Commits de sesiones de SQLAlchemy', (), None),
+    'db_rollbacks_total': (
+        'counter', 'Rollbacks de sesiones de SQLAlchemy', (), None),
+    'import_rows_total': (
+        'counter', 'Filas de manifiestos importadas', (), None),
+    'import_seconds_total': (
+        'counter', 'Tiempo dedicado a importar manifiestos', (), None),
+    'import_rows_per_second': (
+        'gauge', 'Filas por segundo de la última carga de manifiesto',
+        (), 'max'),
+    # Sin la sesión como etiqueta: cada día crearía series nuevas
+    'scans_total': (
+        'counter', 'Escaneos por resultado', ('result',), None),
+    'scans_per_minute': (
+        'gauge', 'Escaneos del último minuto por sesión',
+        ('session_id',), 'sum'),
+}
+
+_lock = threading.Lock()
+# {nombre: {etiquetas (tupla): valor o [buckets..., suma, cuenta]}}
+_values = {name: {} for name in METRICS}
+# {session_id: deque de instantes de escaneo del último minuto}
+_recent_scans = {}
+_last_dump = 0.0
+
+
+def inc(name: str, value: float = 1, *labels):
+    with _lock:
+        series = _values[name]
+        series[labels] = series.get(labels, 0) + value
+
+
+def set_gauge(name: str, value: float, *labels):
+    with _lock:
+        _values[name][labels] = value
+
+
+def observe(name: str, value: float, *labels):
+    buckets = METRICS[name][3]
+    with _lock:
+        series = _values[name].get(labels)
+        if series is None:
+            # Un contador por bucket (no acumulados), la suma y la cuenta
+            series = _values[name][labels] = [0] * (len(buckets) + 3)
+        series[bisect.bisect_left(buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+
+def record_scan(session_id: int, code: str, result: dict):
+    """
+    Cuenta un escaneo por resultado (estado, 'unknown' o 'error') y
+    registra una muestra de ellos (SCAN_LOG_SAMPLE_RATE) en nivel INFO.
+    """
+    if result.get('status'):
+        outcome = result['status']
+    elif result.get('error') == 'unknown_package_detected':
+        outcome = 'unknown'
+    else:
+        outcome = 'error'
+    inc('scans_total', 1, outcome)
+    with _lock:
+        _recent_scans.setdefault(session_id, deque()).append(time.time())
+    log_event('scan', logging.INFO,
+              current_app.config.get('SCAN_LOG_SAMPLE_RATE', 1.0),
+              session_id=session_id, code=code, result=outcome)
+
+
+def record_import(rows: int, seconds: float):
+    inc('import_rows_total', rows)
+    inc('import_seconds_total', seconds)
+    if seconds > 0:
+        set_gauge('import_rows_per_second', rows / seconds)
+
+
+def log_event(event_name: str, level: int = logging.INFO,
+              sample_rate: float = 1.0, **fields):
+    """
+    Registra un evento como una línea JSON ({"event": ..., campos}) con el
+    nivel indicado. Con sample_rate < 1 solo se registra esa fracción de
+    los eventos (p. ej. uno de cada cien escaneos).
+    """
+    logger = current_app.logger
+    if not logger.isEnabledFor(level):
+        return
+    if sample_rate < 1:
+        if random.random() >= sample_rate:
+            return
+        fields['sample_rate'] = sample_rate
+    logger.log(level, json.dumps(dict(event=event_name, **fields),
+                                 default=str, ensure_ascii=False))
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_statement(conn, cursor, statement, parameters, context,
+                     executemany):
+    conn.info.setdefault('metrics_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _end_statement(conn, cursor, statement, parameters, context,
+                   executemany):
+    starts = conn.info.get('metrics_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    operation = statement.lstrip().split(None, 1)[0].upper() \
+        if statement.strip() else 'OTHER'
+    if operation not in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH'):
+        operation = 'OTHER'
+    observe('sql_statement_duration_seconds', elapsed, operation)
+    if has_request_context() and 'metrics_sql' in g:
+        g.metrics_sql[0] += 1
+        g.metrics_sql[1] += elapsed
+
+
+@event.listens_for(Engine, 'handle_error')
+def _discard_statement(exception_context):
+    # La sentencia falló: after_cursor_execute no se llamará
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('metrics_start'):
+        conn.info['metrics_start'].pop()
+
+
+@event.listens_for(OrmSession, 'after_commit')
+def _count_commit(orm_session):
+    inc('db_commits_total')
+
+
+@event.listens_for(OrmSession, 'after_rollback')
+def _count_rollback(orm_session):
+    inc('db_rollbacks_total')
+
+
+def _snapshot() -> dict:
+    now = time.time()
+    with _lock:
+        for session_id, instants in list(_recent_scans.items()):
+            while instants and instants[0] < now - 60:
+                instants.popleft()
+            if instants:
+                _values['scans_per_minute'][(str(session_id),)] = \
+                    len(instants)
+            else:
+                del _recent_scans[session_id]
+                _values['scans_per_minute'].pop((str(session_id),), None)
+        return {name: [[list(labels), value]
+                       for labels, value in series.items()]
+                for name, series in _values.items()}
+
+
+def _dump(directory: str):
+    # Se reescribe el mismo archivo bajo un flock exclusivo (los lectores
+    # usan uno compartido): reemplazarlo con os.replace obliga en ext4 a
+    # vaciar los datos a disco en cada volcado
+    global _last_dump
+    _last_dump = time.monotonic()
+    data = json.dumps(_snapshot())
+    path = os.path.join(directory, f'metrics.{os.getpid()}.json')
+    try:
+        f = open(path, 'r+')
+    except FileNotFoundError:
+        os.makedirs(directory, exist_ok=True)
+        f = open(path, 'a+')
+    with f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+        f.write(data)
+        f.truncate()
+        f.flush()
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge(directory: str) -> dict:
+    merged = {name: {} for name in METRICS}
+    for path in glob.glob(os.path.join(directory, 'metrics.*.json')):
+        pid = int(path.rsplit('.', 2)[-2])
+        if pid != os.getpid() and not _process_alive(pid):
+            # Proceso terminado: sus contadores se reinician (Prometheus
+            # lo trata como un reinicio del contador)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            continue
+        try:
+            with open(path) as f:
+                fcntl.flock(f, fcntl.LOCK_SH)
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, series in snapshot.items():
+            if name not in METRICS:
+                continue
+            kind, _, label_names, merge = METRICS[name]
+            target = merged[name]
+            for labels, value in series:
+                labels = tuple(labels)
+                if len(labels) != len(label_names):
+                    # Volcado de una versión con otras etiquetas
+                    continue
+                current = target.get(labels)
+                if current is None:
+                    target[labels] = value
+                elif kind == 'histogram':
+                    target[labels] = [a + b for a, b in zip(current, value)]
+                elif kind == 'gauge' and merge == 'max':
+                    target[labels] = max(current, value)
+                else:
+                    target[labels] = current + value
+    return merged
+
+
+def _format_labels(names, values, extra: str = '') -> str:
+    pairs = [
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def render(merged: dict) -> str:
+    """
+    Texto de exposición de Prometheus (versión 0.0.4) de las métricas.
+    """
+    lines = []
+    for name, (kind, help_text, label_names, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in sorted(merged[name].items()):
+            if kind != 'histogram':
+                lines.append(
+                    f'{name}{_format_labels(label_names, labels)} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), value[:-2]):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f'{name}_bucket'
+                             f'{_format_labels(label_names, labels, le)} '
+                             f'{cumulative}')
+            lines.append(f'{name}_sum{_format_labels(label_names, labels)} '
+                         f'{value[-2]}')
+            lines.append(f'{name}_count{_format_labels(label_names, labels)} '
+                         f'{value[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def init_metrics(app):
+    """
+    Mide cada petición (latencia por endpoint hasta terminar la respuesta,
+    incluidas las descargas en streaming, y sentencias SQL y su tiempo) y
+    publica todas las métricas en /metrics. Se llama antes de registrar los
+    blueprints para medir también la carga de la sesión del día.
+    """
+    app.logger.setLevel(app.config['LOG_LEVEL'])
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    directory = app.config['METRICS_DIR']
+
+    @app.before_request
+    def _start_request_metrics():
+        g.metrics_start = time.perf_counter()
+        g.metrics_sql = [0, 0.0]
+
+    @app.after_request
+    def _response_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _finish_request_metrics(exc):
+        start = g.pop('metrics_start', None)
+        sql_count, sql_seconds = g.pop('metrics_sql', (0, 0.0))
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        endpoint = request.endpoint or 'none'
+        status = 500 if exc is not None else g.pop('metrics_status', 500)
+        inc('http_requests_total', 1, endpoint, request.method, str(status))
+        observe('http_request_duration_seconds', elapsed, endpoint,
+                request.method)
+        observe('sql_statements_per_request', sql_count, endpoint)
+        observe('sql_seconds_per_request', sql_seconds, endpoint)
+        if elapsed >= app.config['SLOW_REQUEST_SECONDS']:
+            log_event('slow_request', logging.WARNING, endpoint=endpoint,
+                      method=request.method, status=status,
+                      seconds=round(elapsed, 4), sql_statements=sql_count,
+                      sql_seconds=round(sql_seconds, 4))
+        if time.monotonic() - _last_dump >= app.config['METRICS_DUMP_SECONDS']:
+            try:
+                _dump(directory)
+            except OSError:
+                app.logger.exception('No se pudieron guardar las métricas')
+
+    def metrics_view():
+        _dump(directory)
+        return Response(render(_merge(directory)),
+                        mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
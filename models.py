@@ -1,4 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import validates
 from datetime import datetime, date  # noqa: F401
 
 db = SQLAlchemy()
@@ -9,6 +10,18 @@ class Guia(db.Model):
     tracking = db.Column(db.String(120), unique=False, nullable=True) # noqa: E501
     guia_internacional = db.Column(db.String(50), unique=False, nullable=True) # noqa: E501
     fecha_recibido = db.Column(db.DateTime, default=datetime.utcnow)
+    # Versiones normalizadas de los códigos; son las que usan las búsquedas
+    # del escáner y la carga masiva (ver utils.find_guia).
+    tracking_norm = db.Column(db.String(120), nullable=True, index=True)
+    guia_internacional_norm = db.Column(db.String(50), nullable=True,
+                                        index=True)
+
+    @validates('tracking', 'guia_internacional')
+    def _sync_normalized_code(self, key, value):
+        # Mantener la columna normalizada sincronizada con cada asignación
+        from utils import normalize_code
+        setattr(self, f'{key}_norm', normalize_code(value))
+        return value
 
     # Añadir una restricción para asegurar que al menos uno de los dos campos
     # no sea nulo. Esto se manejará a nivel de aplicación/formulario,
@@ -22,9 +35,16 @@ class Session(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     session_date = db.Column(db.Date, unique=True, nullable=False)
     is_closed = db.Column(db.Boolean, default=False, nullable=False)
+    # Contadores mantenidos en cada cambio de estado (ver session_counters.py)
+    total_packages = db.Column(db.Integer, default=0, nullable=False)
     total_scanned_packages = db.Column(db.Integer, default=0, nullable=False)
     unknown_packages = db.Column(db.Integer, default=0, nullable=False)
     missing_packages = db.Column(db.Integer, default=0, nullable=False)
+    not_scanned_packages = db.Column(db.Integer, default=0, nullable=False)
+    # Se incrementa con cada cambio del manifiesto de la sesión (carga,
+    # registro, edición) para invalidar los índices en memoria de los demás
+    # procesos (ver manifest_index.py).
+    manifest_version = db.Column(db.Integer, default=0, nullable=False)
 
 
 class GuiaSessionStatus(db.Model):
@@ -41,7 +61,10 @@ class GuiaSessionStatus(db.Model):
     guia = db.relationship('Guia', backref='session_statuses')
 
     __table_args__ = (db.UniqueConstraint('session_id', 'guia_id',
-                                          name='_session_guia_uc'),)
+                                          name='_session_guia_uc'),
+                      # Orden y paginación por cursor de /registros
+                      db.Index('ix_guia_session_status_session_ts',
+                               'session_id', 'timestamp_status_change', 'id'),)
 
 
 class Registro(db.Model):
@@ -53,3 +76,80 @@ class Registro(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     guia = db.relationship('Guia', backref='registros')
     session = db.relationship('Session', backref='registros')
+
+
+class ImportJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.Integer, db.ForeignKey('session.id'),
+                           nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.String(10), default='queued', nullable=False)
+    # 'queued', 'running', 'done', 'failed'
+    rows_processed = db.Column(db.Integer, default=0, nullable=False)
+    n_added_guia = db.Column(db.Integer, default=0, nullable=False)
+    n_added_session_status = db.Column(db.Integer, default=0, nullable=False)
+    n_ignored_guia = db.Column(db.Integer, default=0, nullable=False)
+    error = db.Column(db.Text, nullable=True)
+    sha256 = db.Column(db.String(64), nullable=True)  # Del archivo cargado
+    # Proceso que ejecuta la carga ('host:pid'), ver jobs.recover_import_jobs
+    worker = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow,
+                           nullable=False)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    session = db.relationship('Session', backref='import_jobs')
+
+
+class ImportHistory(db.Model):
+    # Cargas de manifiestos terminadas en cada sesión, por el SHA-256 del
+    # archivo; un archivo idéntico devuelve el resultado guardado y uno
+    # parecido solo procesa las filas nuevas (ver import_history.py)
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.Integer, db.ForeignKey('session.id'),
+                           nullable=False)
+    sha256 = db.Column(db.String(64), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    rows = db.Column(db.Integer, default=0, nullable=False)
+    n_added_guia = db.Column(db.Integer, default=0, nullable=False)
+    n_added_session_status = db.Column(db.Integer, default=0, nullable=False)
+    n_ignored_guia = db.Column(db.Integer, default=0, nullable=False)
+    n_unchanged_rows = db.Column(db.Integer, default=0, nullable=False)
+    # Huellas (uint64 ordenados) de las filas ya cargadas en la sesión; solo
+    # la carga más reciente de la sesión las conserva
+    row_digests = db.Column(db.LargeBinary, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow,
+                           nullable=False)
+
+    session = db.relationship('Session', backref='import_history')
+
+    __table_args__ = (db.Index('ix_import_history_session_sha256',
+                               'session_id', 'sha256'),)
+
+
+class ProcessedScan(db.Model):
+    # Escaneos de /scan/batch ya aplicados, por el client_id que genera el
+    # escáner; permite reenviar un lote sin duplicar escaneos
+    id = db.Column(db.Integer, primary_key=True)
+    client_id = db.Column(db.String(64), unique=True, nullable=False)
+    session_id = db.Column(db.Integer, db.ForeignKey('session.id'),
+                           nullable=False)
+    code = db.Column(db.String(120), nullable=False)
+    client_ts = db.Column(db.String(40), nullable=True)
+    result = db.Column(db.Text, nullable=True)  # Respuesta del escaneo (JSON)
+    # Índice para borrar los antiguos (ver routes.scan._prune_processed_scans)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow,
+                           nullable=False, index=True)
+
+
+class SessionEvent(db.Model):
+    # Bandeja de salida de cambios de una sesión (contadores y estados) que
+    # /session/<id>/events envía a las páginas abiertas (ver session_events.py)
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.Integer, db.ForeignKey('session.id'),
+                           nullable=False, index=True)
+    kind = db.Column(db.String(10), nullable=False)
+    # 'delta', 'counters', 'status'
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    created_at = db.Column(db.DateTime, default=datetime.utcnow,
+                           nullable=False)
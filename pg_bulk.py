@@ -0,0 +1,211 @@
+import io
+import queue
+import threading
+from datetime import datetime
+from sqlalchemy import func, text
+from models import db, Guia, GuiaSessionStatus
+from exporter import EXPORT_COLUMNS
+
+
+# Carga masiva y exportación con COPY en PostgreSQL (psycopg2). En SQLite
+# y otros motores se usan las consultas de SQLAlchemy de siempre.
+
+_STAGE_DDL = """
+    CREATE TEMP TABLE IF NOT EXISTS manifest_stage (
+        tracking text,
+        guia_internacional text,
+        tracking_norm text,
+        guia_internacional_norm text
+    )"""
+
+_COPY_STAGE = """
+    COPY manifest_stage (tracking, guia_internacional, tracking_norm,
+                         guia_internacional_norm)
+    FROM STDIN WITH (FORMAT csv)"""
+
+# Guías existentes (la más antigua por tracking): actualizar la guía
+# internacional si cambió
+_UPDATE_EXISTING = """
+    WITH matched AS (
+        SELECT DISTINCT ON (g.tracking_norm) g.id, g.tracking_norm
+        FROM guia g
+        JOIN manifest_stage s ON s.tracking_norm = g.tracking_norm
+        ORDER BY g.tracking_norm, g.id
+    )
+    UPDATE guia
+    SET guia_internacional = s.guia_internacional,
+        guia_internacional_norm = s.guia_internacional_norm
+    FROM matched m
+    JOIN manifest_stage s ON s.tracking_norm = m.tracking_norm
+    WHERE guia.id = m.id
+      AND guia.guia_internacional IS DISTINCT FROM s.guia_internacional
+    RETURNING guia.id"""
+
+_INSERT_NEW = """
+    INSERT INTO guia (tracking, guia_internacional, tracking_norm,
+                      guia_internacional_norm)
+    SELECT s.tracking, s.guia_internacional, s.tracking_norm,
+           s.guia_internacional_norm
+    FROM manifest_stage s
+    WHERE NOT EXISTS (
+        SELECT 1 FROM guia g WHERE g.tracking_norm = s.tracking_norm)"""
+
+_INSERT_SESSION_STATUS = """
+    INSERT INTO guia_session_status (session_id, guia_id, status,
+                                     timestamp_status_change)
+    SELECT DISTINCT ON (g.tracking_norm) :session_id, g.id, 'NO RECIBIDO',
+           :now
+    FROM guia g
+    JOIN manifest_stage s ON s.tracking_norm = g.tracking_norm
+    ORDER BY g.tracking_norm, g.id
+    ON CONFLICT (session_id, guia_id) DO NOTHING"""
+
+_DATETIME_FORMAT = 'YYYY-MM-DD HH24:MI:SS'
+
+
+def copy_supported(orm_session) -> bool:
+    """
+    Indica si la sesión trabaja sobre PostgreSQL con psycopg2 (COPY).
+    """
+    dialect = orm_session.get_bind().dialect
+    return dialect.name == 'postgresql' and dialect.driver == 'psycopg2'
+
+
+def _dbapi_connection(orm_session):
+    # Conexión de psycopg2 de la transacción actual de la sesión
+    return orm_session.connection().connection.dbapi_connection
+
+
+def copy_manifest_chunk(session_id: int, chunk) -> tuple:
+    """
+    Carga un bloque ya sanitizado y sin duplicados (DataFrame con tracking,
+    guia_internacional y sus columnas _norm) con COPY a una tabla temporal y lo
+    combina con guia y guia_session_status con tres sentencias por
+    conjuntos, dentro de la transacción actual. Devuelve (guías nuevas,
+    guías añadidas a la sesión, ids de las guías existentes actualizadas).
+    """
+    data = io.StringIO()
+    chunk[['tracking', 'guia_internacional', 'tracking_norm',
+           'guia_internacional_norm']].to_csv(data, header=False, index=False)
+    data.seek(0)
+
+    db.session.execute(text(_STAGE_DDL))
+    cursor = _dbapi_connection(db.session).cursor()
+    try:
+        cursor.copy_expert(_COPY_STAGE, data)
+    finally:
+        cursor.close()
+
+    updated_ids = db.session.execute(text(_UPDATE_EXISTING)).scalars().all()
+    n_added_guia = db.session.execute(text(_INSERT_NEW)).rowcount
+    added = db.session.execute(text(_INSERT_SESSION_STATUS), {
+        'session_id': session_id, 'now': datetime.utcnow()}).rowcount
+    db.session.execute(text('TRUNCATE manifest_stage'))
+    return n_added_guia, added, updated_ids
+
+
+def export_columns() -> tuple:
+    """
+    Columnas de EXPORT_COLUMNS ya formateadas en SQL como exporter.export_row
+    (fechas 'YYYY-MM-DD HH:MM:SS' y 'N/A' para los vacíos).
+    """
+    return (
+        func.coalesce(func.nullif(Guia.tracking, ''), 'N/A'),
+        func.coalesce(func.nullif(Guia.guia_internacional, ''), 'N/A'),
+        func.coalesce(func.to_char(Guia.fecha_recibido, _DATETIME_FORMAT),
+                      'N/A'),
+        GuiaSessionStatus.status,
+        func.coalesce(func.to_char(GuiaSessionStatus.timestamp_status_change,
+                                   _DATETIME_FORMAT), 'N/A'),
+    )
+
+
+class _CopyCancelled(Exception):
+    pass
+
+
+class _ChunkWriter:
+    """
+    Destino de COPY ... TO STDOUT: agrupa lo recibido en bloques de
+    flush_size bytes y los pasa a la cola que lee el generador.
+    """
+
+    def __init__(self, chunks: queue.Queue, stop: threading.Event,
+                 flush_size: int):
+        self._chunks = chunks
+        self._stop = stop
+        self._flush_size = flush_size
+        self._buffer = []
+        self._size = 0
+
+    def put(self, item):
+        while True:
+            if self._stop.is_set():
+                raise _CopyCancelled()
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def write(self, data):
+        self._buffer.append(data)
+        self._size += len(data)
+        if self._size >= self._flush_size:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self.put(b''.join(self._buffer))
+            self._buffer = []
+            self._size = 0
+
+
+def stream_copy_csv(orm_session, statement, flush_size: int = 64 * 1024):
+    """
+    Genera el CSV de la exportación (con BOM, como exporter.stream_csv) con
+    COPY (consulta) TO STDOUT. COPY escribe desde un hilo en una cola
+    acotada, así el servidor no adelanta más de unos bloques al cliente.
+    """
+    dbapi_connection = _dbapi_connection(orm_session)
+    compiled = statement.compile(dialect=orm_session.get_bind().dialect)
+    cursor = dbapi_connection.cursor()
+    query = cursor.mogrify(str(compiled), compiled.params)
+    copy_sql = b'COPY (' + query + b') TO STDOUT WITH (FORMAT csv)'
+
+    chunks = queue.Queue(maxsize=8)
+    stop = threading.Event()
+    writer = _ChunkWriter(chunks, stop, flush_size)
+
+    def run_copy():
+        try:
+            cursor.copy_expert(copy_sql, writer)
+            writer.flush()
+            writer.put(None)
+        except _CopyCancelled:
+            pass
+        except Exception as e:
+            try:
+                writer.put(e)
+            except _CopyCancelled:
+                pass
+        finally:
+            cursor.close()
+
+    yield ('\ufeff' + ','.join(EXPORT_COLUMNS) + '\n').encode()
+    thread = threading.Thread(target=run_copy, name='export-copy',
+                              daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = chunks.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Si el cliente corta la descarga, COPY se interrumpe en la
+        # siguiente escritura
+        stop.set()
+        thread.join()
@@ -1,17 +1,38 @@
-import os
-import pandas as pd
 from flask import (
-    Blueprint, render_template, request, redirect, url_for, flash, g
+    Blueprint, render_template, request, redirect, url_for, flash, g,
+    current_app, jsonify
 )
 from werkzeug.utils import secure_filename
-from models import db, Guia, GuiaSessionStatus
-from utils import sanitize_string, allowed_file
+from models import db, GuiaSessionStatus, ImportJob
+from utils import allowed_file, process_excel_upload, upload_extension
+from upload_stream import upload_sha256, detach_stream
+from jobs import submit_import_job, job_to_dict, job_worker
 from config import Config
+from manifest_index import bump_manifest_version, invalidate
+from session_counters import get_session_counts, recompute_session_counters
+from db_profile import report_session
+from import_history import (
+    find_identical_import, history_stats, clear_import_history
+)
 
 
 main_bp = Blueprint('main', __name__)
 
 
+def _import_summary(session_date, stats) -> str:
+    message = (f'Guías cargadas para la sesión del {session_date}. '
+               f'{stats["n_added_guia"]} nuevas guías añadidas, '
+               f'{stats["n_added_session_status"]} guías esperadas cargadas. '
+               f'{stats["n_ignored_guia"]} guías ignoradas (duplicados en Excel o ya en sesión).')
+    if stats.get('n_unchanged_rows'):
+        message += (f' {stats["n_unchanged_rows"]} filas sin cambios '
+                    'respecto a cargas anteriores.')
+    if stats.get('duplicate_of'):
+        message = ('Este archivo ya se había cargado en la sesión y no se '
+                   'volvió a procesar. ' + message)
+    return message
+
+
 @main_bp.route('/', methods=['GET'])
 def index():
     current_session = getattr(g, 'session', None)
@@ -19,8 +40,8 @@ def index():
                      'not_registered_packages': 0,
                      'missing_to_scan_packages': 0}
     if current_session:
-        from routes.records import get_updated_counts_for_session
-        footer_counts = get_updated_counts_for_session(current_session.id)
+        footer_counts = get_session_counts(current_session.id,
+                                           report_session())
 
     return render_template('index.html',
                            current_session=current_session,
@@ -49,67 +70,70 @@ def upload():
             flash('La sesión actual está cerrada. No se pueden cargar más guías.', 'danger')
             return render_template('upload.html', current_session=current_session)
 
-        filepath = os.path.join(Config.UPLOAD_FOLDER, secure_filename(file.filename))
-        file.save(filepath)
-
-        try:
-            if filepath.endswith('.csv'):
-                df = pd.read_csv(filepath)
-            else:
-                df = pd.read_excel(filepath)
-        except Exception as e:
-            flash(f'Error al leer el archivo Excel: {e}', 'danger')
-            return render_template('upload.html', current_session=current_session)
-
-        n_added_guia = 0
-        n_ignored_guia = 0
-        n_added_session_status = 0
-
-        for _, row in df.iterrows():
-            tracking = sanitize_string(str(row.get('TRACKING', '')).strip())
-            guia_internacional = sanitize_string(str(row.get('GUIA INTERNACIONAL', '')).strip())
-
-            if not (tracking and guia_internacional):
-                n_ignored_guia += 1
-                continue
-
-            guia = Guia.query.filter_by(tracking=tracking).first()
-            if not guia:
-                guia = Guia(tracking=tracking, guia_internacional=guia_internacional, fecha_recibido=None)
-                db.session.add(guia)
-                db.session.flush()
-                n_added_guia += 1
-            else:
-                if guia.guia_internacional != guia_internacional:
-                    guia.guia_internacional = guia_internacional
-                existing_guia_status = GuiaSessionStatus.query.filter_by(session_id=current_session.id, guia_id=guia.id).first()
-                if existing_guia_status:
-                    n_ignored_guia += 1
-                    continue
-
-            guia_status = GuiaSessionStatus(session_id=current_session.id, guia_id=guia.id, status='NO RECIBIDO')
-            db.session.add(guia_status)
-            n_added_session_status += 1
-
+        if not current_app.config['IMPORT_ASYNC']:
+            result = process_excel_upload(file, current_session, current_app.config)
+            if 'error' in result:
+                flash(result['error'], 'danger')
+                return render_template('upload.html', current_session=current_session)
+            flash(_import_summary(current_session.session_date, result), 'success')
+            return redirect(url_for('main.upload'))
+
+        # Carga en segundo plano: se responde enseguida con el id del trabajo
+        sha256 = upload_sha256(file)
+        previous = find_identical_import(current_session.id, sha256)
+        if previous is not None:
+            # Archivo idéntico a una carga anterior: su resultado, sin trabajo
+            result = dict(history_stats(previous), duplicate_of=previous.id)
+            message = _import_summary(current_session.session_date, result)
+            if request.accept_mimetypes.best == 'application/json':
+                return jsonify(dict(result, message=message))
+            flash(message, 'info')
+            return redirect(url_for('main.upload'))
+
+        job = ImportJob(session_id=current_session.id,
+                        filename=secure_filename(file.filename),
+                        sha256=sha256, worker=job_worker())
+        db.session.add(job)
         db.session.commit()
-        flash(f'Guías cargadas para la sesión del {current_session.session_date}. '
-              f'{n_added_guia} nuevas guías añadidas, '
-              f'{n_added_session_status} guías esperadas cargadas. '
-              f'{n_ignored_guia} guías ignoradas (duplicados en Excel o ya en sesión).',
-              'success')
-        return redirect(url_for('main.upload'))
+        submit_import_job(job, detach_stream(file), upload_extension(file))
+
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify({
+                'job_id': job.id,
+                'status_url': url_for('main.import_job_status', job_id=job.id)
+            }), 202
+        return redirect(url_for('main.upload', job_id=job.id))
 
     # Calcular los contadores para el footer
     footer_counts = {'total_pending_packages': 0,
                      'not_registered_packages': 0,
                      'missing_to_scan_packages': 0}
     if current_session:
-        from routes.records import get_updated_counts_for_session
-        footer_counts = get_updated_counts_for_session(current_session.id)
+        footer_counts = get_session_counts(current_session.id)
+
+    job = None
+    job_id = request.args.get('job_id', type=int)
+    if job_id:
+        job = db.session.get(ImportJob, job_id)
 
     return render_template('upload.html',
                            current_session=current_session,
-                           footer_counts=footer_counts)
+                           footer_counts=footer_counts,
+                           job=job)
+
+
+@main_bp.route('/upload/jobs/<int:job_id>', methods=['GET'])
+def import_job_status(job_id):
+    job = db.session.get(ImportJob, job_id)
+    if not job:
+        return jsonify({'error': 'Carga no encontrada.'}), 404
+
+    response_data = job_to_dict(job)
+    if job.status == 'done':
+        response_data['message'] = _import_summary(job.session.session_date,
+                                                   response_data)
+        response_data.update(get_session_counts(job.session_id))
+    return jsonify(response_data)
 
 
 @main_bp.route('/delete_current_excel', methods=['POST'])
@@ -119,6 +143,10 @@ def delete_current_excel():
     current_session = getattr(g, 'session', None)
     if current_session:
         GuiaSessionStatus.query.filter_by(session_id=current_session.id).delete()
+        clear_import_history(current_session.id)
+        recompute_session_counters(current_session.id)
+        bump_manifest_version(current_session.id)
+        invalidate(current_session.id)
         db.session.commit()
         flash('Todas las guías cargadas para la sesión actual han sido eliminadas.', 'success')
     else:
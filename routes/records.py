@@ -1,72 +1,140 @@
-import os
-import pandas as pd
 from flask import (
     Blueprint, render_template, request, redirect, url_for, flash,
-    send_from_directory, g, jsonify
+    g, jsonify, current_app, Response, stream_with_context
 )
 from datetime import datetime
+from sqlalchemy import or_, and_, select, update
+from sqlalchemy.orm import contains_eager
 from models import db, Guia, GuiaSessionStatus, Session
-from config import Config
 from utils import sanitize_string
+from search import code_contains
+from exporter import EXPORT_FORMATS, EXPORT_WRITERS
+from pg_bulk import copy_supported, export_columns, stream_copy_csv
+from manifest_index import (
+    bump_manifest_version, bump_manifest_version_for_guia, invalidate,
+    record_status, record_guia
+)
+from session_counters import (
+    COUNTER_COLUMNS, record_transition, session_counts,
+    recompute_session_counters, get_session_counts
+)
+from db_profile import report_session
 
 
-# Función auxiliar para obtener los conteos actualizados (similar a la de scan.py)
-def get_updated_counts_for_session(session_id):
-    total_scanned = GuiaSessionStatus.query.filter_by(session_id=session_id, status='RECIBIDO').count()
-    total_packages = GuiaSessionStatus.query.filter_by(session_id=session_id).count()
-    not_registered = GuiaSessionStatus.query.filter_by(session_id=session_id, status='NO ESPERADO').count()
-    return {
-        'total_scanned_packages': total_scanned,
-        'total_packages': total_packages,
-        'not_registered_packages': not_registered
-    }
+records_bp = Blueprint('records', __name__)
 
+# Estados que se pueden asignar a una guía desde la vista de registros
+GUIA_STATUSES = ('RECIBIDO', 'NO RECIBIDO', 'NO ESPERADO', 'NO ESCANEADO')
 
-records_bp = Blueprint('records', __name__)
+
+def _guia_conditions(args) -> list:
+    """
+    Condiciones sobre Guia de los filtros de tracking y guía internacional.
+    """
+    tracking = args.get('tracking', '').strip()
+    guia_internacional = args.get('guia_internacional', '').strip()
+
+    conditions = []
+    if tracking:
+        conditions.append(code_contains('tracking', tracking))
+    if guia_internacional:
+        conditions.append(
+            code_contains('guia_internacional', guia_internacional))
+    return conditions
+
+
+def _apply_filters(query, args):
+    """
+    Aplica a una consulta sobre GuiaSessionStatus unida con Guia los
+    filtros de tracking, guía internacional y estado de la petición.
+    """
+    status_filter = args.get('status', '').strip()
+
+    query = query.filter(*_guia_conditions(args))
+    if status_filter:
+        query = query.filter(GuiaSessionStatus.status == status_filter)
+    return query
+
+
+def _encode_cursor(row) -> str:
+    return f'{row.timestamp_status_change.isoformat()}_{row.id}'
+
+
+def _decode_cursor(cursor: str):
+    """
+    Devuelve (timestamp_status_change, id) de un cursor de /registros, o
+    None si no es válido (se muestra la primera página).
+    """
+    try:
+        timestamp, status_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(timestamp), int(status_id)
+    except (AttributeError, ValueError):
+        return None
 
 
 @records_bp.route('/registros', methods=['GET'])
 def registros():
-    sessions = Session.query.order_by(Session.session_date.desc()).all()
+    # Lecturas con la sesión de informes: no ocupan conexiones de escritura.
+    # Las sesiones se leen como filas con sus contadores (el selector, la
+    # sesión elegida y el footer salen de la misma consulta)
+    reports = report_session()
+    sessions = reports.query(
+        Session.id, Session.session_date, Session.is_closed,
+        *(getattr(Session, column) for column in COUNTER_COLUMNS)
+    ).order_by(Session.session_date.desc()).all()
+    sessions_by_id = {s.id: s for s in sessions}
 
     session_id = request.args.get('session_id', type=int)
     current_session = None
     if session_id:
-        current_session = Session.query.get(session_id)
+        current_session = sessions_by_id.get(session_id)
     elif g.session:
-        current_session = g.session
+        current_session = sessions_by_id.get(g.session.id, g.session)
     elif sessions:
         current_session = sessions[0]
 
     guia_statuses = []
+    next_cursor = None
     footer_counts = {'total_pending_packages': 0,
                      'not_registered_packages': 0,
                      'missing_to_scan_packages': 0}
 
     if current_session:
-        query = GuiaSessionStatus.query.filter_by(
-            session_id=current_session.id).join(Guia)
-
-        tracking = request.args.get('tracking', '').strip()
-        guia_internacional = request.args.get('guia_internacional', '').strip()
-        status_filter = request.args.get('status', '').strip()
-
-        if tracking:
-            query = query.filter(Guia.tracking.ilike(f'%{tracking}%'))
-        if guia_internacional:
-            query = query.filter(
-                Guia.guia_internacional.ilike(f'%{guia_internacional}%'))
-        if status_filter:
-            query = query.filter(GuiaSessionStatus.status == status_filter)
-
+        # Solo las columnas que muestra la tabla, en una consulta con join
+        # (sin cargar gs.guia fila a fila)
+        query = reports.query(
+            GuiaSessionStatus.id, GuiaSessionStatus.guia_id,
+            GuiaSessionStatus.session_id, GuiaSessionStatus.status,
+            GuiaSessionStatus.timestamp_status_change, Guia.tracking,
+            Guia.guia_internacional, Guia.fecha_recibido
+        ).join(Guia, Guia.id == GuiaSessionStatus.guia_id).filter(
+            GuiaSessionStatus.session_id == current_session.id)
+        query = _apply_filters(query, request.args)
+
+        # Paginación por cursor sobre (timestamp_status_change, id): cada
+        # página sigue donde terminó la anterior usando el índice, sin OFFSET
+        cursor = _decode_cursor(request.args.get('cursor'))
+        if cursor:
+            timestamp, status_id = cursor
+            query = query.filter(or_(
+                GuiaSessionStatus.timestamp_status_change < timestamp,
+                and_(GuiaSessionStatus.timestamp_status_change == timestamp,
+                     GuiaSessionStatus.id < status_id)))
+
+        page_size = current_app.config.get('RECORDS_PAGE_SIZE', 100)
         guia_statuses = query.order_by(
-            GuiaSessionStatus.timestamp_status_change.desc()).all()
+            GuiaSessionStatus.timestamp_status_change.desc(),
+            GuiaSessionStatus.id.desc()).limit(page_size + 1).all()
+        if len(guia_statuses) > page_size:
+            guia_statuses = guia_statuses[:page_size]
+            next_cursor = _encode_cursor(guia_statuses[-1])
 
-        # Obtener los conteos para el footer de la sesión actual
-        footer_counts = get_updated_counts_for_session(current_session.id)
+        # Conteos para el footer de la sesión actual
+        footer_counts = session_counts(current_session)
 
     return render_template('registros.html',
                            guia_statuses=guia_statuses,
+                           next_cursor=next_cursor,
                            sessions=sessions,
                            current_session=current_session,
                            selected_session_id=(current_session.id
@@ -81,51 +149,45 @@ def export():
         flash('Debe seleccionar una sesión para exportar.', 'danger')
         return redirect(url_for('records.registros'))
 
-    current_session = Session.query.get(session_id)
+    reports = report_session()
+    current_session = reports.get(Session, session_id)
     if not current_session:
         flash('Sesión no encontrada.', 'danger')
         return redirect(url_for('records.registros'))
 
-    query = GuiaSessionStatus.query.filter_by(
-        session_id=current_session.id).join(Guia)
-
-    tracking = request.args.get('tracking', '').strip()
-    guia_internacional = request.args.get('guia_internacional', '').strip()
-    status_filter = request.args.get('status', '').strip()
+    export_format = request.args.get('format', 'xlsx')
+    if export_format not in EXPORT_WRITERS:
+        flash('Formato de exportación no válido.', 'danger')
+        return redirect(url_for('records.registros', session_id=session_id))
+
+    # Solo las columnas exportadas, leídas por lotes del cursor del servidor
+    # y escritas directamente en la respuesta (sin DataFrame ni archivo),
+    # con la conexión de solo lectura del bind de informes. En PostgreSQL
+    # el CSV lo genera el propio servidor con COPY.
+    use_copy = export_format == 'csv' and copy_supported(reports)
+    columns = export_columns() if use_copy else (
+        Guia.tracking, Guia.guia_internacional, Guia.fecha_recibido,
+        GuiaSessionStatus.status, GuiaSessionStatus.timestamp_status_change)
+    query = reports.query(*columns).join(
+        Guia, Guia.id == GuiaSessionStatus.guia_id).filter(
+        GuiaSessionStatus.session_id == current_session.id)
+    query = _apply_filters(query, request.args).order_by(
+        GuiaSessionStatus.timestamp_status_change.desc(),
+        GuiaSessionStatus.id.desc())
+    if use_copy:
+        body = stream_copy_csv(reports, query.statement)
+    else:
+        body = EXPORT_WRITERS[export_format](query.yield_per(1000))
 
-    if tracking:
-        query = query.filter(Guia.tracking.ilike(f'%{tracking}%'))
-    if guia_internacional:
-        query = query.filter(
-            Guia.guia_internacional.ilike(f'%{guia_internacional}%'))
-    if status_filter:
-        query = query.filter(GuiaSessionStatus.status == status_filter)
-
-    guia_statuses = query.order_by(
-        GuiaSessionStatus.timestamp_status_change.desc()).all()
-
-    data = []
-    for gs in guia_statuses:
-        fecha_recibido_str = (gs.guia.fecha_recibido.strftime('%Y-%m-%d %H:%M:%S')  # noqa: E501
-                              if gs.guia.fecha_recibido else 'N/A')
-        data.append({
-            'Tracking': gs.guia.tracking or 'N/A',
-            'Guía Internacional': gs.guia.guia_internacional or 'N/A',
-            'Fecha Recibido (Guía)': fecha_recibido_str,
-            'Estado Sesión': gs.status,
-            'Fecha y Hora Estado': gs.timestamp_status_change.strftime(
-                '%Y-%m-%d %H:%M:%S')
-        })
-
-    df = pd.DataFrame(data)
     filename = (
         f'guias_sesion_{current_session.session_date.strftime("%Y%m%d")}'
-        '.xlsx'
+        f'.{export_format}'
+    )
+    return Response(
+        stream_with_context(body),
+        mimetype=EXPORT_FORMATS[export_format],
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
     )
-    filepath = os.path.join(Config.EXPORT_FOLDER, filename)
-    df.to_excel(filepath, index=False)
-    return send_from_directory(Config.EXPORT_FOLDER, filename,
-                               as_attachment=True)
 
 
 @records_bp.route(
@@ -133,12 +195,15 @@ def export():
     methods=['GET', 'POST']
 )
 def edit_guia_status(guia_id, session_id):
-    guia_status = GuiaSessionStatus.query.filter_by(
-        guia_id=guia_id, session_id=session_id).first_or_404()
-    guia = Guia.query.get(guia_id)
-    current_session = Session.query.get(session_id)
-    # Obtener los conteos para el footer de la sesión actual
-    footer_counts = get_updated_counts_for_session(session_id)
+    # Estado, guía y sesión (con sus contadores) en una sola consulta
+    guia_status = GuiaSessionStatus.query.join(
+        GuiaSessionStatus.guia).join(GuiaSessionStatus.session).options(
+        contains_eager(GuiaSessionStatus.guia),
+        contains_eager(GuiaSessionStatus.session)
+    ).filter(GuiaSessionStatus.guia_id == guia_id,
+             GuiaSessionStatus.session_id == session_id).first_or_404()
+    guia = guia_status.guia
+    current_session = guia_status.session
 
     if request.method == 'POST':
         try:
@@ -153,15 +218,14 @@ def edit_guia_status(guia_id, session_id):
             changes_made = False
 
             # Manejar actualización de estado
-            if new_status and new_status in [
-                'RECIBIDO', 'NO RECIBIDO', 'NO ESPERADO', 'NO ESCANEADO'
-            ] and guia_status.status != new_status:
+            if new_status and new_status in GUIA_STATUSES \
+                    and guia_status.status != new_status:
+                record_transition(session_id, guia_status.status, new_status,
+                                  guia_id=guia_id)
                 guia_status.status = new_status
                 guia_status.timestamp_status_change = datetime.utcnow()
                 changes_made = True
-            elif new_status and new_status not in [
-                'RECIBIDO', 'NO RECIBIDO', 'NO ESPERADO', 'NO ESCANEADO'
-            ]:
+            elif new_status and new_status not in GUIA_STATUSES:
                 return jsonify({'error': 'Estado no válido.'}), 400
 
             # Manejar actualización de tracking
@@ -183,8 +247,12 @@ def edit_guia_status(guia_id, session_id):
                     'guia_internacional': guia.guia_internacional
                 })
 
-            db.session.commit()
+            db.session.flush()
+            bump_manifest_version_for_guia(guia.id)
+            record_status(session_id, guia.id, guia_status.status)
+            record_guia(guia)
 
+            # Antes del commit, que expira los objetos (evita recargarlos)
             response_data = {
                 'success': True,
                 'message': 'Guía actualizada exitosamente.',
@@ -193,16 +261,108 @@ def edit_guia_status(guia_id, session_id):
                 'guia_internacional': guia.guia_internacional,
                 'redirect_to_records': True  # Señal para el frontend
             }
+            db.session.commit()
             return jsonify(response_data)
         except Exception as e:
             db.session.rollback()  # Revertir cualquier cambio en caso de error
             return jsonify({'error': f'Error interno del servidor: {str(e)}'}), 500
     else:  # Esto maneja el método GET
+        # Conteos para el footer de la sesión de la guía
+        footer_counts = session_counts(current_session)
         return render_template('edit_guia_status.html', guia_status=guia_status,
                                guia=guia, current_session=current_session,
                                footer_counts=footer_counts)
 
 
+@records_bp.route('/registros/bulk_status', methods=['POST'])
+def bulk_edit_status():
+    """
+    Cambia el estado de varias guías de una sesión: las de guia_ids o, sin
+    guia_ids, todas las que cumplen los filtros de /registros (filters; sin
+    ningún filtro hace falta "all": true para cambiar toda la sesión).
+    Un solo UPDATE por conjuntos y un recálculo de los contadores de la
+    sesión, que se devuelven en la respuesta.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Datos no proporcionados.'}), 400
+
+    new_status = data.get('new_status')
+    if new_status not in GUIA_STATUSES:
+        return jsonify({'error': 'Estado no válido.'}), 400
+
+    try:
+        session_id = int(data.get('session_id'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Sesión no válida.'}), 400
+    if not db.session.get(Session, session_id):
+        return jsonify({'error': 'Sesión no encontrada.'}), 404
+
+    # Solo las filas que cambian de estado (las demás conservan su fecha)
+    statement = update(GuiaSessionStatus).where(
+        GuiaSessionStatus.session_id == session_id,
+        GuiaSessionStatus.status != new_status)
+
+    guia_ids = data.get('guia_ids')
+    if guia_ids is not None:
+        if not isinstance(guia_ids, list) or not guia_ids or \
+                not all(isinstance(i, int) and not isinstance(i, bool)
+                        for i in guia_ids):
+            return jsonify({'error': 'No se seleccionaron guías.'}), 400
+        max_items = current_app.config.get('BULK_STATUS_MAX_ITEMS', 1000)
+        if len(guia_ids) > max_items:
+            return jsonify({'error': ('La selección supera el máximo de '
+                                      f'{max_items} guías.')}), 400
+        statement = statement.where(GuiaSessionStatus.guia_id.in_(guia_ids))
+    else:
+        filters = data.get('filters')
+        if not isinstance(filters, dict):
+            return jsonify({'error': 'No se seleccionaron guías.'}), 400
+        filters = {key: str(value) for key, value in filters.items()
+                   if value is not None}
+        conditions = _guia_conditions(filters)
+        status_filter = filters.get('status', '').strip()
+        if not conditions and not status_filter and data.get('all') is not True:
+            # Sin filtros cambiarían todas las guías de la sesión: solo si
+            # se pide de forma explícita
+            return jsonify({'error': ('Indique al menos un filtro para '
+                                      'cambiar todas las guías de la '
+                                      'sesión.')}), 400
+        if conditions:
+            statement = statement.where(GuiaSessionStatus.guia_id.in_(
+                select(Guia.id).where(*conditions)))
+        if status_filter:
+            statement = statement.where(
+                GuiaSessionStatus.status == status_filter)
+
+    try:
+        updated = db.session.execute(
+            statement.values(status=new_status,
+                             timestamp_status_change=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if updated:
+            # Contadores con una consulta agrupada (publica 'counters') e
+            # índices del escáner de la sesión reconstruidos al próximo uso
+            recompute_session_counters(session_id)
+            bump_manifest_version(session_id)
+            invalidate(session_id)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    response_data = {
+        'success': True,
+        'updated': updated,
+        'message': (f'{updated} guías actualizadas a {new_status}.'
+                    if updated else
+                    'No se detectaron cambios para guardar.')
+    }
+    response_data.update(get_session_counts(session_id))
+    return jsonify(response_data)
+
+
 @records_bp.route('/update_guia_fields', methods=['POST'])
 def update_guia_fields():
     try:
@@ -221,7 +381,7 @@ def update_guia_fields():
         if not guia_id or not scanned_code or not field_type:
             return jsonify({'error': ('Datos incompletos para la actualización.')}), 400
 
-        guia = Guia.query.get(guia_id)
+        guia = db.session.get(Guia, guia_id)
         if not guia:
             return jsonify({'error': 'Guía no encontrada.'}), 404
 
@@ -268,14 +428,18 @@ def update_guia_fields():
         else:
             return jsonify({'error': 'Tipo de campo no válido.'}), 400
 
-        db.session.commit()
+        db.session.flush()
+        bump_manifest_version_for_guia(guia.id)
+        record_guia(guia)
 
-        return jsonify({
+        response_data = {
             'success': True,
             'message': message,
             'tracking': guia.tracking,
             'guia_internacional': guia.guia_internacional
-        })
+        }
+        db.session.commit()
+        return jsonify(response_data)
 
     except Exception as e:
         db.session.rollback()
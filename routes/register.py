@@ -2,7 +2,9 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from datetime import datetime
 from models import db, Guia, Registro, GuiaSessionStatus
 from forms import GuiaForm
-from utils import sanitize_string
+from utils import sanitize_string, find_guia
+from manifest_index import ManifestEntry, record_entry
+from session_counters import record_transition
 
 
 register_bp = Blueprint('register', __name__)
@@ -45,10 +47,10 @@ def register():
 
         existing_guia = None
         if tracking:
-            existing_guia = Guia.query.filter_by(tracking=tracking).first()
+            existing_guia = find_guia(tracking, 'tracking')
         if not existing_guia and guia_internacional:
-            existing_guia = Guia.query.filter_by(
-                guia_internacional=guia_internacional).first()
+            existing_guia = find_guia(guia_internacional,
+                                      'guia_internacional')
 
         if existing_guia:
             # Si la guía ya existe globalmente, no permitir registro manual global
@@ -76,6 +78,12 @@ def register():
         registro = Registro(guia_id=guia.id, session_id=g.session.id,
                             tipo='entrada')
         db.session.add(registro)
+        db.session.flush()
+        record_transition(g.session.id, None, 'NO ESPERADO',
+                          guia_id=guia.id)
+        record_entry(g.session.id, ManifestEntry(
+            guia.id, guia_status.id, guia_status.status, guia.tracking,
+            guia.guia_internacional, guia.fecha_recibido))
         db.session.commit()
 
         # Comentario: En futuras sesiones, este código volverá a ser NO ESPERADO hasta que se autorice manualmente de nuevo.
@@ -1,11 +1,248 @@
-from flask import Blueprint, request, jsonify, g
-from datetime import datetime
-from models import db, Guia, Registro, GuiaSessionStatus
-from utils import sanitize_string
+import json
+from flask import Blueprint, request, jsonify, g, current_app
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, insert, delete, bindparam
+from models import db, Guia, Registro, GuiaSessionStatus, ProcessedScan
+from utils import sanitize_string, find_guia, insert_ignore
+from manifest_index import (
+    ManifestEntry, get_manifest_index, bump_manifest_version, record_entry,
+    record_status, invalidate
+)
+from session_counters import get_session_counts, record_transition
+from journal import get_journal, ScanJournalError
+from metrics import record_scan
 
 
 scan_bp = Blueprint('scan', __name__)
 
+# Cada cuántos client_id guardados por el proceso se borran los antiguos
+# (PROCESSED_SCAN_RETENTION_DAYS)
+_PRUNE_EVERY = 1000
+_claimed_since_prune = 0
+
+
+def _format_dt(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S') if value else ''
+
+
+def _unknown_response(scanned_code: str, suggestions: list = None) -> dict:
+    response_data = {
+        'error': 'unknown_package_detected',
+        'code': scanned_code,
+        'message': (f'El código "{scanned_code}" no corresponde a una guía '
+                    'conocida o esperada en esta sesión.')
+    }
+    if suggestions:
+        response_data['suggestions'] = suggestions
+    return response_data
+
+
+def _suggestions(index, scanned_code: str, code_type: str = None) -> list:
+    """
+    Guías esperadas con un código a un carácter del escaneado (posible
+    lectura errónea de una etiqueta dañada), para que el operador elija.
+    """
+    limit = current_app.config.get('SCAN_SUGGESTIONS_LIMIT', 3)
+    if not limit:
+        return []
+    return [{
+        'code': code,
+        'code_type': field,
+        'tracking': entry.tracking,
+        'guia_internacional': entry.guia_internacional,
+        'status': entry.status,
+    } for field, code, entry in index.nearest(scanned_code, code_type, limit)]
+
+
+def entry_response(entry: ManifestEntry, status: str, now: datetime) -> dict:
+    """
+    Respuesta del escáner para una guía de la sesión según el resultado del
+    escaneo: 'RECIBIDO' (recién recibida), 'NO ESPERADO' o 'YA RECIBIDO'.
+    """
+    name = entry.guia_internacional or entry.tracking
+    response_data = {
+        'tracking': entry.tracking,
+        'guia_internacional': entry.guia_internacional,
+        'fecha_recibido': _format_dt(entry.fecha_recibido),
+        'tipo': 'entrada',
+        'timestamp': _format_dt(now),
+        'status': status,
+    }
+    if status == 'RECIBIDO':
+        response_data.update({
+            'fecha_recibido': _format_dt(now),
+            'message': f'Guía {name} registrada exitosamente.'
+        })
+    elif status == 'NO ESPERADO':
+        response_data['message'] = (
+            f'La guía {name} es NO ESPERADO en esta sesión. Si deseas '
+            'marcarla como RECIBIDO, hazlo desde la vista de edición.')
+    else:
+        response_data['message'] = (f'La guía {name} ya fue marcada como '
+                                    'RECIBIDO en esta sesión.')
+    return response_data
+
+
+def process_scan(current_session, scanned_code: str, code_type: str = None,
+                 index=None, now: datetime = None) -> dict:
+    """
+    Clasifica y aplica el escaneo de un código ya sanitizado dentro de la
+    transacción actual, sin hacer commit. Devuelve los datos de respuesta
+    (sin los conteos de la sesión). index permite reutilizar el mismo índice
+    del manifiesto para varios escaneos de una transacción; now, fijar la
+    hora del escaneo (p. ej. al aplicar el diario de escaneos).
+    """
+    # Clasificar el código contra el índice en memoria de la sesión
+    # (sin code_type se busca en ambos campos, comportamiento por defecto
+    # del escáner)
+    if index is None:
+        index = get_manifest_index(current_session)
+    entry = index.lookup(scanned_code, code_type)
+
+    if not entry:
+        # No está en el manifiesto de la sesión: comprobar si la guía existe
+        # globalmente (búsqueda indexada)
+        guia = find_guia(scanned_code, code_type)
+
+        # Si la guía no existe en la base de datos, es un paquete completamente desconocido
+        if not guia:
+            return _unknown_response(
+                scanned_code, _suggestions(index, scanned_code, code_type))
+
+        guia_session_status = GuiaSessionStatus.query.filter_by(
+            session_id=current_session.id, guia_id=guia.id).first()
+        if guia_session_status:
+            # Ya está en la sesión pero el índice local aún no la incluía
+            # (p. ej. una carga que otro proceso está confirmando por bloques)
+            entry = ManifestEntry(
+                guia.id, guia_session_status.id, guia_session_status.status,
+                guia.tracking, guia.guia_internacional, guia.fecha_recibido)
+            record_entry(current_session.id, entry)
+        else:
+            # Si la guía existe en la base de datos pero no está asociada a la sesión actual.
+            # Creamos un GuiaSessionStatus para ella con estado 'NO ESPERADO'
+            # y le damos la opción al usuario de registrarla.
+            guia_session_status = GuiaSessionStatus(
+                session_id=current_session.id,
+                guia_id=guia.id,
+                status='NO ESPERADO',
+                timestamp_status_change=datetime.utcnow()
+            )
+            db.session.add(guia_session_status)
+            db.session.flush()
+            record_transition(current_session.id, None, 'NO ESPERADO',
+                              guia_id=guia.id)
+            # Guía nueva en la sesión: solo el índice local (ver
+            # bump_manifest_version)
+            record_entry(current_session.id, ManifestEntry(
+                guia.id, guia_session_status.id, guia_session_status.status,
+                guia.tracking, guia.guia_internacional, guia.fecha_recibido))
+
+            message = (f'La guía "{scanned_code}" fue encontrada en la base de datos '
+                       'pero no estaba asociada a la sesión actual. Se ha registrado '
+                       'como "NO ESPERADO" en esta sesión.')
+            return {
+                'error': 'unknown_package_detected',
+                'code': scanned_code,
+                'message': message
+            }
+
+    now = now or datetime.utcnow()
+
+    # UPDATE condicional sobre el estado conocido: si un escaneo o una
+    # edición concurrente ya lo cambió no se modifica ninguna fila (un doble
+    # escaneo no duplica el Registro) y se relee el estado real.
+    status = entry.status
+    received = False
+    for _ in range(3):
+        if status in (None, 'RECIBIDO', 'NO ESPERADO'):
+            break
+        result = db.session.execute(
+            update(GuiaSessionStatus)
+            .where(GuiaSessionStatus.id == entry.status_id,
+                   GuiaSessionStatus.status == status)
+            .values(status='RECIBIDO', timestamp_status_change=now)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            received = True
+            break
+        status = db.session.execute(
+            select(GuiaSessionStatus.status)
+            .where(GuiaSessionStatus.id == entry.status_id)
+        ).scalar()
+        if status is None:
+            invalidate(current_session.id)
+        else:
+            record_status(current_session.id, entry.guia_id, status)
+
+    if received:
+        # Actualizar la fecha de recibido de la guía y registrar la entrada
+        db.session.execute(
+            update(Guia).where(Guia.id == entry.guia_id)
+            .values(fecha_recibido=now)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.execute(insert(Registro).values(
+            guia_id=entry.guia_id, session_id=current_session.id,
+            tipo='entrada', timestamp=now))
+        record_transition(current_session.id, status, 'RECIBIDO',
+                          guia_id=entry.guia_id)
+        record_status(current_session.id, entry.guia_id, 'RECIBIDO', now)
+        return entry_response(entry, 'RECIBIDO', now)
+    elif status == 'NO ESPERADO':
+        # Si es NO ESPERADO, no permitir cambiar a RECIBIDO desde el escaneo
+        # Pero sí incrementar el contador de escaneos exitosos (total_scanned_packages)
+        # Creamos un registro de escaneo exitoso para depuración
+        db.session.execute(insert(Registro).values(
+            guia_id=entry.guia_id, session_id=current_session.id,
+            tipo='entrada', timestamp=now))
+        return entry_response(entry, 'NO ESPERADO', now)
+    elif status is None:
+        # La guía se quitó de la sesión mientras tanto
+        return _unknown_response(scanned_code)
+    return entry_response(entry, 'YA RECIBIDO', now)
+
+
+def _journal_scan(journal, current_session, scanned_code: str,
+                  code_type: str = None):
+    """
+    Modo SCAN_WRITE_BEHIND: clasifica el código con el índice en memoria,
+    lo anota en el diario y responde sin esperar a la base de datos (el hilo
+    del diario aplica el escaneo después). Devuelve None si el código no
+    está en el índice o no se pudo anotar, y hay que escanearlo de forma
+    síncrona.
+    """
+    entry = get_manifest_index(current_session).lookup(scanned_code,
+                                                       code_type)
+    if entry is None:
+        return None
+    now = datetime.utcnow()
+    session_id = current_session.id
+    if entry.status in ('NO RECIBIDO', 'NO ESCANEADO'):
+        if not journal.claim(session_id, entry.guia_id):
+            return entry_response(entry, 'YA RECIBIDO', now)
+        try:
+            journal.append(session_id, scanned_code, code_type,
+                           entry.guia_id, now)
+        except ScanJournalError:
+            # Sin diario (disco lleno, error de E/S): escaneo síncrono
+            journal.release(session_id, entry.guia_id)
+            return None
+        except BaseException:
+            journal.release(session_id, entry.guia_id)
+            raise
+        return entry_response(entry, 'RECIBIDO', now)
+    if entry.status == 'NO ESPERADO':
+        # Se anota igualmente: el escaneo deja su Registro de entrada
+        try:
+            journal.append(session_id, scanned_code, code_type,
+                           entry.guia_id, now)
+        except ScanJournalError:
+            return None
+        return entry_response(entry, 'NO ESPERADO', now)
+    return entry_response(entry, 'YA RECIBIDO', now)
+
 
 @scan_bp.route('/scan', methods=['POST'])
 def scan():
@@ -21,132 +258,155 @@ def scan():
     if not scanned_code:
         return jsonify({'error': 'No se proporcionó ningún código para escanear.'}), 400
 
-    guia = None
-    if code_type == 'tracking':
-        guia = Guia.query.filter_by(tracking=scanned_code).first()
-    elif code_type == 'guia_internacional':
-        guia = Guia.query.filter_by(guia_internacional=scanned_code).first()
-    else: # Si no se especifica el tipo, buscar en ambos (comportamiento por defecto del escáner)
-        guia = Guia.query.filter(
-            (Guia.tracking == scanned_code) |
-            (Guia.guia_internacional == scanned_code)
-        ).first()
-
-    guia_session_status = None
-    if guia:
-        guia_session_status = GuiaSessionStatus.query.filter_by(
-            session_id=g.session.id, guia_id=guia.id).first()
-        print(f"DEBUG: Guia encontrada: {guia.tracking or guia.guia_internacional}, "
-              f"Status en sesión: {guia_session_status.status if guia_session_status else 'No asociado a sesión'}")
-
-    # Función auxiliar para obtener los conteos actualizados
-    def get_updated_counts():
-        total_scanned = GuiaSessionStatus.query.filter_by(session_id=g.session.id, status='RECIBIDO').count()
-        total_packages = GuiaSessionStatus.query.filter_by(session_id=g.session.id).count()
-        not_registered = GuiaSessionStatus.query.filter_by(session_id=g.session.id, status='NO ESPERADO').count()
-        missing_to_scan = GuiaSessionStatus.query.filter_by(session_id=g.session.id, status='NO RECIBIDO').count()
-        return {
-            'total_scanned_packages': total_scanned,
-            'total_packages': total_packages,
-            'not_registered_packages': not_registered,
-            'missing_to_scan_packages': missing_to_scan
-        }
-
-    # Si la guía no existe en la base de datos, es un paquete completamente desconocido
-    if not guia:
-        message = (f'El código "{scanned_code}" no corresponde a una guía '
-                   'conocida o esperada en esta sesión.')
-        return jsonify({
-            'error': 'unknown_package_detected',
-            'code': scanned_code,
-            'message': message
-        })
+    session_id = g.session.id
+    journal = get_journal()
+    if journal is not None:
+        response_data = _journal_scan(journal, g.session, scanned_code,
+                                      code_type)
+        if response_data is not None:
+            record_scan(session_id, scanned_code, response_data)
+            response_data.update(get_session_counts(session_id))
+            return jsonify(response_data)
 
-    # Si la guía existe, verificar su estado en la sesión actual
-    guia_session_status = GuiaSessionStatus.query.filter_by(
-        session_id=g.session.id, guia_id=guia.id).first()
+    # Todo el escaneo es una única transacción con un solo commit
+    try:
+        response_data = process_scan(g.session, scanned_code, code_type)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
 
-    # Si la guía existe en la base de datos pero no está asociada a la sesión actual.
-    if not guia_session_status:
-        # Creamos un GuiaSessionStatus para ella con estado 'NO ESPERADO'
-        # y le damos la opción al usuario de registrarla.
-        guia_session_status = GuiaSessionStatus(
-            session_id=g.session.id,
-            guia_id=guia.id,
-            status='NO ESPERADO',
-            timestamp_status_change=datetime.utcnow()
+    record_scan(session_id, scanned_code, response_data)
+    if 'error' not in response_data:
+        response_data.update(get_session_counts(session_id))
+    return jsonify(response_data)
+
+
+def _stored_results(client_ids) -> dict:
+    """
+    {client_id: respuesta} de los escaneos de /scan/batch ya aplicados.
+    """
+    if not client_ids:
+        return {}
+    rows = db.session.execute(
+        select(ProcessedScan.client_id, ProcessedScan.result)
+        .where(ProcessedScan.client_id.in_(client_ids))
+    )
+    return {client_id: json.loads(result) if result else {}
+            for client_id, result in rows}
+
+
+def _claim_scan(client_id: str, session_id: int, item: dict) -> bool:
+    """
+    Reserva el client_id de un escaneo dentro de la transacción actual.
+    Devuelve False si otro envío del mismo escaneo ya lo reservó.
+    """
+    return insert_ignore(ProcessedScan, [{
+        'client_id': client_id,
+        'session_id': session_id,
+        'code': str(item.get('code') or '')[:120],
+        'client_ts': str(item.get('client_ts') or '')[:40] or None,
+    }], ['client_id']) == 1
+
+
+def process_scan_batch(current_session, items: list) -> list:
+    """
+    Aplica dentro de la transacción actual, sin hacer commit, una lista
+    ordenada de escaneos {code, code_type, client_ts, client_id}. Los
+    client_id ya aplicados devuelven la respuesta guardada (replayed) en
+    lugar de escanearse otra vez. Un scanned_at de tipo datetime (solo
+    desde el diario de escaneos) fija la hora del escaneo.
+    """
+    session_id = current_session.id
+    results = []
+    new_results = []
+    stored = _stored_results({str(item['client_id'])[:64]
+                              for item in items if item.get('client_id')})
+    index = get_manifest_index(current_session)
+    for item in items:
+        client_id = str(item.get('client_id') or '')[:64] or None
+        if client_id and client_id not in stored and \
+                not _claim_scan(client_id, session_id, item):
+            stored.update(_stored_results([client_id]))
+        if client_id in stored:
+            results.append(dict(stored[client_id], client_id=client_id,
+                                replayed=True))
+            continue
+
+        scanned_code = sanitize_string(str(item.get('code') or '').strip())
+        scanned_at = item.get('scanned_at')
+        if scanned_code:
+            result = process_scan(
+                current_session, scanned_code, item.get('code_type'), index,
+                scanned_at if isinstance(scanned_at, datetime) else None)
+        else:
+            result = {'error': 'No se proporcionó ningún código '
+                               'para escanear.'}
+        if client_id:
+            stored[client_id] = result
+            new_results.append({'b_client_id': client_id,
+                                'b_result': json.dumps(result)})
+        results.append(dict(result, client_id=client_id, replayed=False))
+
+    if new_results:
+        processed = ProcessedScan.__table__
+        db.session.execute(
+            update(processed)
+            .where(processed.c.client_id == bindparam('b_client_id'))
+            .values(result=bindparam('b_result')),
+            new_results
         )
-        db.session.add(guia_session_status)
-        db.session.commit()
+        _prune_processed_scans(len(new_results))
+    return results
 
-        message = (f'La guía "{scanned_code}" fue encontrada en la base de datos '
-                   'pero no estaba asociada a la sesión actual. Se ha registrado '
-                   'como "NO ESPERADO" en esta sesión.')
-        return jsonify({
-            'error': 'unknown_package_detected',
-            'code': scanned_code,
-            'message': message
-        })
 
-    # Si la guía existe y está asociada a la sesión
-    if guia_session_status.status == 'RECIBIDO':
-        response_data = {
-            'tracking': guia.tracking,
-            'guia_internacional': guia.guia_internacional,
-            'fecha_recibido': (guia.fecha_recibido.strftime('%Y-%m-%d %H:%M:%S')
-                               if guia.fecha_recibido else ''),
-            'tipo': 'entrada',
-            'timestamp': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
-            'status': 'YA RECIBIDO',
-            'message': (f'La guía {guia.guia_internacional or guia.tracking} ya '
-                        'fue marcada como RECIBIDO en esta sesión.')
-        }
-        response_data.update(get_updated_counts())
-        return jsonify(response_data)
-    elif guia_session_status.status == 'NO ESPERADO':
-        # Si es NO ESPERADO, no permitir cambiar a RECIBIDO desde el escaneo
-        # Pero sí incrementar el contador de escaneos exitosos (total_scanned_packages)
-        # Creamos un registro de escaneo exitoso para depuración
-        registro = Registro(guia_id=guia.id, session_id=g.session.id, tipo='entrada')
-        db.session.add(registro)
-        db.session.commit()
-        response_data = {
-            'tracking': guia.tracking,
-            'guia_internacional': guia.guia_internacional,
-            'fecha_recibido': (guia.fecha_recibido.strftime('%Y-%m-%d %H:%M:%S')
-                               if guia.fecha_recibido else ''),
-            'tipo': 'entrada',
-            'timestamp': registro.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-            'status': 'NO ESPERADO',
-            'message': (f'La guía {guia.guia_internacional or guia.tracking} es NO ESPERADO en esta sesión. Si deseas marcarla como RECIBIDO, hazlo desde la vista de edición.')
-        }
-        response_data.update(get_updated_counts())
-        return jsonify(response_data)
-    else:  # Si el estado actual NO es RECIBIDO ni NO ESPERADO (es decir, NO RECIBIDO, NO ESCANEADO, etc.)
-        guia_session_status.status = 'RECIBIDO'
-        guia_session_status.timestamp_status_change = datetime.utcnow()
-        # Actualizar la fecha de recibido de la guía
-        guia.fecha_recibido = datetime.utcnow()
-        db.session.commit()
+def _prune_processed_scans(n_claimed: int):
+    # Un reenvío del escáner llega en minutos u horas; pasado el plazo de
+    # retención el client_id ya no hace falta
+    global _claimed_since_prune
+    _claimed_since_prune += n_claimed
+    if _claimed_since_prune < _PRUNE_EVERY:
+        return
+    _claimed_since_prune = 0
+    days = current_app.config.get('PROCESSED_SCAN_RETENTION_DAYS', 7)
+    db.session.execute(delete(ProcessedScan).where(
+        ProcessedScan.created_at < datetime.utcnow() - timedelta(days=days)))
+
+
+@scan_bp.route('/scan/batch', methods=['POST'])
+def scan_batch():
+    """
+    Aplica en una sola transacción una lista ordenada de escaneos
+    (ver process_scan_batch).
+    """
+    if not g.session:
+        return jsonify({'error': 'No hay una sesión activa. '
+                                 'Por favor, inicie una sesión primero.'}), 400
+
+    data = request.get_json(silent=True)
+    items = data.get('scans') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items or \
+            not all(isinstance(item, dict) for item in items):
+        return jsonify({'error': 'No se proporcionaron escaneos.'}), 400
+    max_items = current_app.config.get('SCAN_BATCH_MAX_ITEMS', 500)
+    if len(items) > max_items:
+        return jsonify({'error': ('El lote supera el máximo de '
+                                  f'{max_items} escaneos.')}), 400
 
-        registro = Registro(guia_id=guia.id, session_id=g.session.id,
-                            tipo='entrada')
-        db.session.add(registro)
+    session_id = g.session.id
+    try:
+        results = process_scan_batch(g.session, items)
         db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
 
-        response_data = {
-            'tracking': guia.tracking,
-            'guia_internacional': guia.guia_internacional,
-            'fecha_recibido': (guia.fecha_recibido.strftime('%Y-%m-%d %H:%M:%S')
-                               if guia.fecha_recibido else ''),
-            'tipo': 'entrada',
-            'timestamp': registro.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-            'status': 'RECIBIDO',
-            'message': (f'Guía {guia.guia_internacional or guia.tracking} '
-                        'registrada exitosamente.')
-        }
-        response_data.update(get_updated_counts())
-        return jsonify(response_data)
+    for item, result in zip(items, results):
+        if not result['replayed']:
+            record_scan(session_id, str(item.get('code') or ''), result)
+    response_data = {'results': results}
+    response_data.update(get_session_counts(session_id))
+    return jsonify(response_data)
 
 
 @scan_bp.route('/register_unknown', methods=['POST'])
@@ -164,10 +424,7 @@ def register_unknown():
         return jsonify({'error': 'No se proporcionó ningún código para registrar.'}), 400
 
     # Verificar si la guía ya existe (podría haber sido creada por otro escaneo concurrente)
-    guia = Guia.query.filter(
-        (Guia.tracking == scanned_code) |
-        (Guia.guia_internacional == scanned_code)
-    ).first()
+    guia = find_guia(scanned_code)
 
     if not guia:
         if code_type == 'tracking':
@@ -182,41 +439,41 @@ def register_unknown():
 
 
     # Siempre registrar como NO ESPERADO, sin importar si es tracking o guía
+    status_changed = False
     if not guia_session_status:
-        guia_status = GuiaSessionStatus(session_id=g.session.id,
-                                        guia_id=guia.id,
-                                        status='NO ESPERADO',
-                                        timestamp_status_change=datetime.utcnow())
-        db.session.add(guia_status)
-        db.session.commit()
-    else:
-        if guia_session_status.status != 'NO ESPERADO':
-            guia_session_status.status = 'NO ESPERADO'
-            guia_session_status.timestamp_status_change = datetime.utcnow()
-            db.session.commit()
+        guia_session_status = GuiaSessionStatus(
+            session_id=g.session.id,
+            guia_id=guia.id,
+            status='NO ESPERADO',
+            timestamp_status_change=datetime.utcnow())
+        db.session.add(guia_session_status)
+        record_transition(g.session.id, None, 'NO ESPERADO',
+                          guia_id=guia.id)
+    elif guia_session_status.status != 'NO ESPERADO':
+        record_transition(g.session.id, guia_session_status.status,
+                          'NO ESPERADO', guia_id=guia.id)
+        guia_session_status.status = 'NO ESPERADO'
+        guia_session_status.timestamp_status_change = datetime.utcnow()
+        status_changed = True
+    db.session.flush()
 
+    # Reflejar el cambio en el índice del manifiesto de este proceso; los
+    # demás solo lo reconstruyen si cambió una guía que ya tenían indexada
+    session_id = g.session.id
+    if status_changed:
+        bump_manifest_version(session_id)
+    record_entry(g.session.id, ManifestEntry(
+        guia.id, guia_session_status.id, guia_session_status.status,
+        guia.tracking, guia.guia_internacional, guia.fecha_recibido))
 
     # No crear un registro de tipo 'entrada' para NO ESPERADO, solo marcar el estado
     db.session.commit()
 
-    # Función auxiliar para obtener los conteos actualizados
-    def get_updated_counts():
-        total_scanned = GuiaSessionStatus.query.filter_by(session_id=g.session.id, status='RECIBIDO').count()
-        total_packages = GuiaSessionStatus.query.filter_by(session_id=g.session.id).count()
-        not_registered = GuiaSessionStatus.query.filter_by(session_id=g.session.id, status='NO ESPERADO').count()
-        missing_to_scan = GuiaSessionStatus.query.filter_by(session_id=g.session.id, status='NO RECIBIDO').count()
-        return {
-            'total_scanned_packages': total_scanned,
-            'total_packages': total_packages,
-            'not_registered_packages': not_registered,
-            'missing_to_scan_packages': missing_to_scan
-        }
-
     response_data = {
         'message': (f'Paquete desconocido "{scanned_code}" '
                     'registrado como NO ESPERADO.'),
         'tracking': guia.tracking,
         'guia_internacional': guia.guia_internacional
     }
-    response_data.update(get_updated_counts())
+    response_data.update(get_session_counts(session_id))
     return jsonify(response_data)
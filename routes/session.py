@@ -1,7 +1,18 @@
-from flask import Blueprint, redirect, url_for, flash, request, session, g, render_template
-from datetime import datetime, date
+from flask import (
+    Blueprint, redirect, url_for, flash, request, session, g, render_template,
+    Response, stream_with_context, abort, current_app
+)
+from datetime import datetime
 from models import db, Session, GuiaSessionStatus
+from sqlalchemy import update
 from sqlalchemy.orm import joinedload # Importar joinedload
+from manifest_index import bump_manifest_version, invalidate
+from session_counters import (
+    recompute_session_counters, preview_close_counters, counts_from_values,
+    get_session_counts
+)
+from session_cache import get_current_session, signal_session_change
+from session_events import stream_session_events
 
 
 session_bp = Blueprint('session', __name__)
@@ -9,18 +20,12 @@ session_bp = Blueprint('session', __name__)
 
 @session_bp.before_app_request
 def load_current_session():
-    # Siempre tener una sesión abierta (la de hoy, o crearla si no existe)
-    today = date.today()
-    session = Session.query.filter_by(session_date=today).first()
-    if not session:
-        session = Session(session_date=today, is_closed=False)
-        db.session.add(session)
-        db.session.commit()
-    # Si la sesión está cerrada, la reabrimos automáticamente
-    if session.is_closed:
-        session.is_closed = False
-        db.session.commit()
-    g.session = session
+    # Los archivos estáticos no necesitan la sesión
+    if request.endpoint and request.endpoint.rsplit('.', 1)[-1] == 'static':
+        return
+    # Siempre tener una sesión abierta (la de hoy, creada o reabierta si
+    # hace falta); se guarda en memoria del proceso (ver session_cache.py)
+    g.session = get_current_session()
 
 
 @session_bp.route('/end_session', methods=['GET', 'POST'])
@@ -35,33 +40,66 @@ def end_session():
             confirmation_date = datetime.strptime(confirmation_date_str, '%Y-%m-%d').date()
         except ValueError:
             flash('Formato de fecha incorrecto. Use YYYY-MM-DD.', 'danger')
-            return render_template('end_session.html', current_session=g.session)
+            return _render_end_session()
 
         if confirmation_date != g.session.session_date:
             flash('La fecha ingresada no coincide con la fecha de la sesión actual.', 'danger')
-            return render_template('end_session.html', current_session=g.session)
-
-        # Actualizar todos los estados 'NO RECIBIDO' a 'NO ESCANEADO' en la base de datos
-        guia_statuses = GuiaSessionStatus.query.filter_by(session_id=g.session.id, status='NO RECIBIDO').all()
-        for gs in guia_statuses:
-            gs.status = 'NO ESCANEADO'
-            gs.timestamp_status_change = datetime.utcnow()
-
-        # Calcular el resumen de la sesión
-        total_scanned = GuiaSessionStatus.query.filter_by(session_id=g.session.id, status='RECIBIDO').count()
-        unknown = GuiaSessionStatus.query.filter_by(session_id=g.session.id, status='NO ESPERADO').count()
-        missing = GuiaSessionStatus.query.filter_by(session_id=g.session.id, status='NO ESCANEADO').count()
-
-        g.session.total_scanned_packages = total_scanned
-        g.session.unknown_packages = unknown
-        g.session.missing_packages = missing
+            return _render_end_session()
+
+        # Un solo UPDATE de 'NO RECIBIDO' a 'NO ESCANEADO' y una consulta
+        # agrupada para los contadores de Session, en la misma transacción
+        session_id = g.session.id
+        session_date = g.session.session_date
+        db.session.execute(
+            update(GuiaSessionStatus)
+            .where(GuiaSessionStatus.session_id == session_id,
+                   GuiaSessionStatus.status == 'NO RECIBIDO')
+            .values(status='NO ESCANEADO',
+                    timestamp_status_change=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        recompute_session_counters(session_id)
         g.session.is_closed = True
+        bump_manifest_version(session_id)
+        invalidate(session_id)
         db.session.commit()
+        signal_session_change()
 
+        summary = _summary(get_session_counts(session_id))
         session.pop('session_id', None)
-        flash((f'Sesión del {g.session.session_date} finalizada exitosamente. '
-               'Guías no recibidas marcadas como "NO ESCANEADO".'), 'success')
+        flash((f'Sesión del {session_date} finalizada exitosamente. '
+               'Guías no recibidas marcadas como "NO ESCANEADO". '
+               f'Escaneados: {summary["total_scanned"]}, desconocidos: '
+               f'{summary["unknown"]}, faltantes: {summary["missing"]}.'),
+              'success')
         return redirect(url_for('records.registros'))
 
-    # GET: mostrar confirmación
-    return render_template('end_session.html', current_session=g.session)
+    # GET: mostrar confirmación con el resumen previsto (sin modificar nada)
+    return _render_end_session()
+
+
+def _summary(counts: dict) -> dict:
+    return {'total_scanned': counts['total_scanned_packages'],
+            'unknown': counts['not_registered_packages'],
+            'missing': counts['total_pending_packages']}
+
+
+def _render_end_session():
+    summary = _summary(counts_from_values(
+        preview_close_counters(g.session.id)))
+    return render_template('end_session.html', current_session=g.session,
+                           summary=summary, preview=True)
+
+
+@session_bp.route('/session/<int:session_id>/events')
+def session_events(session_id):
+    """
+    Stream SSE con los contadores y cambios de estado de la sesión.
+    """
+    if not current_app.config.get('SESSION_EVENTS_ENABLED', True) or \
+            not db.session.get(Session, session_id):
+        abort(404)
+    return Response(stream_with_context(stream_session_events(session_id)),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache',
+                             'X-Accel-Buffering': 'no'})
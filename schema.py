@@ -0,0 +1,88 @@
+from sqlalchemy import inspect, text, select, update, bindparam, or_
+from models import db, Guia
+from search import install_search_index
+
+
+def _add_missing_columns(conn):
+    """
+    Añade con ALTER TABLE las columnas de los modelos que aún no existen en
+    una base de datos creada con una versión anterior. Devuelve las
+    columnas añadidas como pares (tabla, columna).
+    """
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+    added = set()
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {c['name'] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = (f'ALTER TABLE {table.name} ADD COLUMN {column.name} '
+                   f'{column.type.compile(dialect=conn.dialect)}')
+            if column.default is not None and column.default.is_scalar:
+                ddl += f' DEFAULT {column.default.arg!r}'
+                if not column.nullable:
+                    ddl += ' NOT NULL'
+            conn.execute(text(ddl))
+            added.add((table.name, column.name))
+    return added
+
+
+def _create_missing_indexes(conn):
+    """
+    Crea los índices declarados en los modelos que falten en tablas ya
+    existentes (db.create_all solo los crea junto con la tabla).
+    """
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
+def _backfill_normalized_codes(conn, batch_size=1000):
+    """
+    Rellena Guia.tracking_norm / Guia.guia_internacional_norm para las guías
+    creadas antes de que existieran esas columnas.
+    """
+    from utils import normalize_code
+    guia = Guia.__table__
+    pending = select(guia.c.id, guia.c.tracking, guia.c.guia_internacional)\
+        .where(or_(
+            (guia.c.tracking_norm.is_(None) & guia.c.tracking.isnot(None)),
+            (guia.c.guia_internacional_norm.is_(None) &
+             guia.c.guia_internacional.isnot(None))
+        )).order_by(guia.c.id)
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            pending.where(guia.c.id > last_id).limit(batch_size)).all()
+        if not rows:
+            break
+        conn.execute(
+            update(guia).where(guia.c.id == bindparam('b_id')).values(
+                tracking_norm=bindparam('b_tracking'),
+                guia_internacional_norm=bindparam('b_guia')),
+            [{'b_id': r.id,
+              'b_tracking': normalize_code(r.tracking),
+              'b_guia': normalize_code(r.guia_internacional)} for r in rows]
+        )
+        last_id = rows[-1].id
+
+
+def upgrade_schema():
+    """
+    Actualiza una base de datos existente (p. ej. un app.db antiguo) al
+    esquema actual de los modelos. Es idempotente y se ejecuta al arrancar.
+    """
+    with db.engine.begin() as conn:
+        added = _add_missing_columns(conn)
+        _create_missing_indexes(conn)
+        _backfill_normalized_codes(conn)
+        install_search_index(conn)
+
+    # Los contadores de Session solo se rellenaban al cerrar la sesión
+    if ('session', 'total_packages') in added:
+        from session_counters import recompute_session_counters
+        recompute_session_counters()
+        db.session.commit()
@@ -0,0 +1,112 @@
+import sqlite3
+from sqlalchemy import text, select, column, table
+from sqlalchemy.exc import DBAPIError
+from models import Guia
+
+
+# Columnas de Guia con búsqueda por subcadena
+SEARCH_COLUMNS = ('tracking', 'guia_internacional')
+
+# Los trigramas necesitan al menos 3 caracteres; con menos se usa ILIKE
+MIN_TERM_LENGTH = 3
+
+# Índice de búsqueda disponible en este proceso: 'fts5', 'pg_trgm' o None
+_backend = None
+
+_guia_search = table('guia_search', column('rowid'),
+                     *(column(name) for name in SEARCH_COLUMNS))
+
+_SQLITE_TRIGGERS = {
+    'guia_search_ai': """
+        CREATE TRIGGER IF NOT EXISTS guia_search_ai AFTER INSERT ON guia BEGIN
+            INSERT INTO guia_search(rowid, tracking, guia_internacional)
+            VALUES (new.id, new.tracking, new.guia_internacional);
+        END""",
+    'guia_search_ad': """
+        CREATE TRIGGER IF NOT EXISTS guia_search_ad AFTER DELETE ON guia BEGIN
+            INSERT INTO guia_search(guia_search, rowid, tracking,
+                                    guia_internacional)
+            VALUES ('delete', old.id, old.tracking, old.guia_internacional);
+        END""",
+    'guia_search_au': """
+        CREATE TRIGGER IF NOT EXISTS guia_search_au
+        AFTER UPDATE OF tracking, guia_internacional ON guia BEGIN
+            INSERT INTO guia_search(guia_search, rowid, tracking,
+                                    guia_internacional)
+            VALUES ('delete', old.id, old.tracking, old.guia_internacional);
+            INSERT INTO guia_search(rowid, tracking, guia_internacional)
+            VALUES (new.id, new.tracking, new.guia_internacional);
+        END""",
+}
+
+
+def _install_fts5(conn) -> bool:
+    # El tokenizador trigram existe desde SQLite 3.34
+    if sqlite3.sqlite_version_info < (3, 34, 0):
+        return False
+    exists = conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' "
+        "AND name = 'guia_search'")).first()
+    if not exists:
+        # detail='none': sin posiciones; LIKE usa los trigramas para acotar
+        # las filas y vuelve a comprobar el valor. El índice es menor y las
+        # inserciones de la carga masiva más baratas.
+        conn.execute(text(
+            'CREATE VIRTUAL TABLE guia_search USING fts5('
+            'tracking, guia_internacional, '
+            "content='guia', content_rowid='id', tokenize='trigram', "
+            "detail='none')"))
+    for ddl in _SQLITE_TRIGGERS.values():
+        conn.execute(text(ddl))
+    if not exists:
+        # Indexar las guías que ya existían
+        conn.execute(text(
+            "INSERT INTO guia_search(guia_search) VALUES ('rebuild')"))
+    return True
+
+
+def _install_pg_trgm(conn) -> bool:
+    # Sin la extensión instalada en el servidor (o sin permisos para
+    # crearla) la búsqueda sigue funcionando con ILIKE sin índice
+    try:
+        with conn.begin_nested():
+            conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+    except DBAPIError:
+        return False
+    for name in SEARCH_COLUMNS:
+        conn.execute(text(
+            f'CREATE INDEX IF NOT EXISTS ix_guia_{name}_trgm '
+            f'ON guia USING gin ({name} gin_trgm_ops)'))
+    return True
+
+
+def install_search_index(conn):
+    """
+    Crea (si falta) el índice de trigramas para buscar por subcadena en los
+    códigos de las guías: tabla FTS5 con triggers en SQLite, índices GIN de
+    pg_trgm en PostgreSQL. Es idempotente; se llama desde upgrade_schema.
+    """
+    global _backend
+    dialect = conn.dialect.name
+    if dialect == 'sqlite' and _install_fts5(conn):
+        _backend = 'fts5'
+    elif dialect == 'postgresql' and _install_pg_trgm(conn):
+        _backend = 'pg_trgm'
+    else:
+        _backend = None
+
+
+def code_contains(name: str, term: str):
+    """
+    Condición "el código de la guía contiene term" (sin distinguir
+    mayúsculas, como ILIKE '%term%') para la columna name de Guia, servida
+    por el índice de trigramas cuando lo hay.
+    """
+    pattern = f'%{term}%'
+    if _backend == 'fts5' and len(term) >= MIN_TERM_LENGTH:
+        # LIKE sobre la tabla FTS5 trigram usa su índice
+        return Guia.id.in_(
+            select(_guia_search.c.rowid)
+            .where(_guia_search.c[name].like(pattern)))
+    # En PostgreSQL el índice GIN de pg_trgm sirve directamente a ILIKE
+    return getattr(Guia, name).ilike(pattern)
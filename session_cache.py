@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import date
+from flask import current_app
+from sqlalchemy import select, update
+from sqlalchemy.orm import make_transient_to_detached
+from models import db, Session
+from utils import insert_ignore
+
+
+# Datos de la sesión del día que se guardan por proceso
+CachedSession = namedtuple('CachedSession', [
+    'id', 'session_date', 'is_closed', 'expires_at', 'signal'
+])
+
+_cached = None
+_lock = threading.Lock()
+
+
+def get_or_create_session(day: date = None) -> Session:
+    """
+    Devuelve la sesión del día (hoy por defecto), creándola si no existe y
+    reabriéndola si está cerrada. Es segura con varios workers a la vez
+    (p. ej. a medianoche): la creación es un INSERT que ignora el conflicto
+    con la restricción única de session_date.
+    """
+    day = day or date.today()
+    row = db.session.execute(
+        select(Session.id, Session.is_closed)
+        .where(Session.session_date == day)
+    ).first()
+    if row is None:
+        insert_ignore(Session, [{'session_date': day, 'is_closed': False}],
+                      ['session_date'])
+    elif row.is_closed:
+        db.session.execute(
+            update(Session).where(Session.id == row.id)
+            .values(is_closed=False)
+            .execution_options(synchronize_session=False)
+        )
+    if row is None or row.is_closed:
+        db.session.commit()
+    return Session.query.filter_by(session_date=day).one()
+
+
+def get_current_session() -> Session:
+    """
+    Sesión del día para la petición actual. El id, la fecha y el estado se
+    guardan en memoria del proceso hasta SESSION_CACHE_TTL segundos, hasta
+    el cambio de fecha o hasta que otro proceso del host cierre la sesión
+    (SESSION_CACHE_SIGNAL_FILE); mientras tanto no se consulta la base de
+    datos (el resto de columnas se cargan solo si se usan, p. ej.
+    manifest_version).
+    """
+    global _cached
+    today = date.today()
+    now = time.monotonic()
+    signal = _signal_mtime()
+    with _lock:
+        cached = _cached
+    if cached is None or cached.session_date != today or \
+            cached.expires_at <= now or cached.signal != signal:
+        session = get_or_create_session(today)
+        ttl = current_app.config.get('SESSION_CACHE_TTL', 60)
+        with _lock:
+            _cached = CachedSession(session.id, session.session_date,
+                                    session.is_closed, now + ttl, signal)
+        return session
+
+    session = Session(id=cached.id, session_date=cached.session_date,
+                      is_closed=cached.is_closed)
+    make_transient_to_detached(session)
+    return db.session.merge(session, load=False)
+
+
+def forget_current_session():
+    """
+    Descarta la sesión guardada en este proceso (p. ej. al cerrarla) para
+    que la próxima petición la vuelva a leer.
+    """
+    global _cached
+    with _lock:
+        _cached = None
+
+
+def signal_session_change():
+    """
+    Avisa a todos los procesos del host de que la sesión cambió (p. ej. se
+    cerró) para que la vuelvan a leer en su próxima petición. Los de otros
+    hosts la releen al pasar SESSION_CACHE_TTL.
+    """
+    forget_current_session()
+    path = current_app.config['SESSION_CACHE_SIGNAL_FILE']
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, 'a').close()
+
+
+def _signal_mtime():
+    try:
+        return os.stat(
+            current_app.config['SESSION_CACHE_SIGNAL_FILE']).st_mtime_ns
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,146 @@
+from collections import Counter
+from sqlalchemy import select, update, func
+from models import db, Session, GuiaSessionStatus
+from session_events import (
+    record_counter_deltas, record_counters, record_status_change
+)
+
+
+# Columnas de Session que cuenta cada estado de GuiaSessionStatus.
+# Todas las filas cuentan además en Session.total_packages.
+STATUS_COUNTER_COLUMNS = {
+    'RECIBIDO': ('total_scanned_packages',),
+    'NO ESPERADO': ('unknown_packages',),
+    'NO RECIBIDO': ('missing_packages',),
+    'NO ESCANEADO': ('missing_packages', 'not_scanned_packages'),
+}
+
+COUNTER_COLUMNS = ('total_packages', 'total_scanned_packages',
+                   'unknown_packages', 'missing_packages',
+                   'not_scanned_packages')
+
+
+def _columns_for(status):
+    if status is None:
+        return ()
+    return ('total_packages',) + STATUS_COUNTER_COLUMNS.get(status, ())
+
+
+def record_transitions(session_id: int, transitions: dict):
+    """
+    Aplica a los contadores de la sesión, dentro de la transacción actual,
+    un conjunto de cambios de estado {(estado_anterior, estado_nuevo): n}.
+    None como estado anterior es una fila nueva; como estado nuevo, borrada.
+    """
+    deltas = Counter()
+    for (old_status, new_status), count in transitions.items():
+        for column in _columns_for(old_status):
+            deltas[column] -= count
+        for column in _columns_for(new_status):
+            deltas[column] += count
+    values = {column: getattr(Session, column) + delta
+              for column, delta in deltas.items() if delta}
+    if values:
+        db.session.execute(
+            update(Session).where(Session.id == session_id).values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        record_counter_deltas(session_id, deltas)
+
+
+def record_transition(session_id: int, old_status, new_status, count: int = 1,
+                      guia_id: int = None):
+    """
+    Igual que record_transitions para un único cambio de estado. Con guia_id
+    publica además el cambio de estado de esa guía (ver session_events.py).
+    """
+    if old_status != new_status and count:
+        record_transitions(session_id, {(old_status, new_status): count})
+        if guia_id is not None:
+            record_status_change(session_id, guia_id, old_status, new_status)
+
+
+def counts_from_values(values: dict) -> dict:
+    """
+    Convierte los contadores de una sesión ({columna: valor}) en el
+    diccionario que usan los footers y las respuestas del escáner.
+    """
+    return {
+        'total_scanned_packages': values['total_scanned_packages'],
+        'total_packages': values['total_packages'],
+        'not_registered_packages': values['unknown_packages'],
+        'missing_to_scan_packages': (values['missing_packages'] -
+                                     values['not_scanned_packages']),
+        'total_pending_packages': values['missing_packages']
+    }
+
+
+def session_counts(session) -> dict:
+    """
+    Conteos de una sesión ya leída (objeto Session o fila con las columnas
+    de COUNTER_COLUMNS), sin otra consulta.
+    """
+    return counts_from_values({column: getattr(session, column)
+                               for column in COUNTER_COLUMNS})
+
+
+def get_session_counts(session_id: int, orm_session=None) -> dict:
+    """
+    Lee los contadores mantenidos en la fila de la sesión (una sola consulta).
+    orm_session permite leerlos con otra sesión (p. ej. la de informes).
+    """
+    row = (orm_session or db.session).execute(
+        select(*(getattr(Session, column) for column in COUNTER_COLUMNS))
+        .where(Session.id == session_id)
+    ).one_or_none()
+    values = row._asdict() if row else dict.fromkeys(COUNTER_COLUMNS, 0)
+    return counts_from_values(values)
+
+
+def _status_totals(session_id: int = None, status_map: dict = None) -> dict:
+    """
+    {session_id: Counter(columna: valor)} calculado desde GuiaSessionStatus
+    con una consulta agrupada por estado. status_map permite contar un
+    estado como otro (p. ej. NO RECIBIDO como NO ESCANEADO).
+    """
+    query = select(GuiaSessionStatus.session_id, GuiaSessionStatus.status,
+                   func.count()).group_by(GuiaSessionStatus.session_id,
+                                          GuiaSessionStatus.status)
+    session_ids = select(Session.id)
+    if session_id is not None:
+        query = query.where(GuiaSessionStatus.session_id == session_id)
+        session_ids = session_ids.where(Session.id == session_id)
+
+    status_map = status_map or {}
+    totals = {sid: Counter() for sid in db.session.execute(session_ids).scalars()}
+    for sid, status, count in db.session.execute(query):
+        for column in _columns_for(status_map.get(status, status)):
+            totals.setdefault(sid, Counter())[column] += count
+    return totals
+
+
+def recompute_session_counters(session_id: int = None) -> int:
+    """
+    Recalcula los contadores desde GuiaSessionStatus (una consulta agrupada)
+    para corregir desviaciones. Sin session_id recalcula todas las sesiones.
+    Devuelve el número de sesiones actualizadas; no hace commit.
+    """
+    totals = _status_totals(session_id)
+    for sid, counter in totals.items():
+        values = {column: counter[column] for column in COUNTER_COLUMNS}
+        db.session.execute(
+            update(Session).where(Session.id == sid).values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        record_counters(sid, values)
+    return len(totals)
+
+
+def preview_close_counters(session_id: int) -> dict:
+    """
+    Contadores ({columna: valor}) que tendría la sesión al finalizarla, con
+    las guías NO RECIBIDO contadas como NO ESCANEADO. No modifica nada.
+    """
+    counter = _status_totals(session_id, {'NO RECIBIDO': 'NO ESCANEADO'})\
+        .get(session_id, Counter())
+    return {column: counter[column] for column in COUNTER_COLUMNS}
@@ -0,0 +1,196 @@
+import json
+import os
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import event, select, insert, delete, func
+from sqlalchemy.orm import Session as OrmSession
+from models import db, Session, SessionEvent
+from db_profile import report_session
+
+
+_DELTAS_KEY = 'session_event_deltas'
+_EVENTS_KEY = 'session_events'
+_WRITTEN_KEY = 'session_events_written'
+
+# Cada cuántos eventos escritos por el proceso se borran los antiguos
+_PRUNE_EVERY = 1000
+_written_since_prune = 0
+
+
+def record_counter_deltas(session_id: int, deltas: dict):
+    """
+    Acumula cambios de los contadores de la sesión ({columna: delta}) para
+    publicarlos como un único evento 'delta' al confirmar la transacción.
+    """
+    pending = db.session.info.setdefault(_DELTAS_KEY, {})
+    pending.setdefault(session_id, Counter()).update(deltas)
+
+
+def record_counters(session_id: int, values: dict):
+    """
+    Publica al confirmar los contadores completos de la sesión (p. ej. tras
+    recalcularlos); las páginas los reemplazan en lugar de sumarlos.
+    """
+    db.session.info.setdefault(_EVENTS_KEY, []).append(
+        (session_id, 'counters', dict(values)))
+
+
+def record_status_change(session_id: int, guia_id: int, old_status,
+                         new_status):
+    """
+    Publica al confirmar el cambio de estado de una guía en la sesión.
+    """
+    db.session.info.setdefault(_EVENTS_KEY, []).append(
+        (session_id, 'status', {'guia_id': guia_id,
+                                'old_status': old_status,
+                                'status': new_status}))
+
+
+@event.listens_for(OrmSession, 'before_commit')
+def _write_events(orm_session):
+    # Los eventos se escriben en la misma transacción que los cambios
+    deltas = orm_session.info.pop(_DELTAS_KEY, None) or {}
+    events = orm_session.info.pop(_EVENTS_KEY, None) or []
+    rows = [{'session_id': sid, 'kind': 'delta',
+             'payload': json.dumps({k: v for k, v in counter.items() if v})}
+            for sid, counter in deltas.items() if any(counter.values())]
+    rows += [{'session_id': sid, 'kind': kind, 'payload': json.dumps(payload)}
+             for sid, kind, payload in events]
+    if not rows:
+        return
+    now = datetime.utcnow()
+    for row in rows:
+        row['created_at'] = now
+    orm_session.execute(insert(SessionEvent), rows)
+    orm_session.info[_WRITTEN_KEY] = True
+
+    global _written_since_prune
+    _written_since_prune += len(rows)
+    if _written_since_prune >= _PRUNE_EVERY:
+        _written_since_prune = 0
+        retention = current_app.config.get('SESSION_EVENTS_RETENTION', 3600)
+        orm_session.execute(delete(SessionEvent).where(
+            SessionEvent.created_at < now - timedelta(seconds=retention)))
+
+
+@event.listens_for(OrmSession, 'after_commit')
+def _signal_events(orm_session):
+    if orm_session.info.pop(_WRITTEN_KEY, False):
+        _touch_signal()
+
+
+@event.listens_for(OrmSession, 'after_rollback')
+def _discard_events(orm_session):
+    for key in (_DELTAS_KEY, _EVENTS_KEY, _WRITTEN_KEY):
+        orm_session.info.pop(key, None)
+
+
+def _signal_path() -> str:
+    return current_app.config['SESSION_EVENTS_SIGNAL_FILE']
+
+
+def _touch_signal():
+    # Cambiar la fecha de modificación despierta a los streams de todos los
+    # procesos del host, que la consultan periódicamente
+    path = _signal_path()
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, 'a').close()
+
+
+def _signal_mtime():
+    try:
+        return os.stat(_signal_path()).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _sse(kind: str, data: dict, event_id: int = None) -> str:
+    message = f'event: {kind}\ndata: {json.dumps(data)}\n\n'
+    if event_id is not None:
+        message = f'id: {event_id}\n{message}'
+    return message
+
+
+def _snapshot(session_id: int):
+    """
+    Contadores de la sesión y último id de evento, en una sola consulta para
+    que sean coherentes entre sí.
+    """
+    from session_counters import COUNTER_COLUMNS, counts_from_values
+    reports = report_session()
+    last_id = select(func.max(SessionEvent.id)).scalar_subquery()
+    row = reports.execute(
+        select(last_id, *(getattr(Session, c) for c in COUNTER_COLUMNS))
+        .where(Session.id == session_id)
+    ).one_or_none()
+    reports.rollback()  # No mantener abierta la transacción de lectura
+    if row is None:
+        return None, None
+    return counts_from_values(dict(zip(COUNTER_COLUMNS, row[1:]))), row[0] or 0
+
+
+def _new_events(session_id: int, last_id: int) -> list:
+    reports = report_session()
+    rows = reports.execute(
+        select(SessionEvent.id, SessionEvent.kind, SessionEvent.payload)
+        .where(SessionEvent.session_id == session_id,
+               SessionEvent.id > last_id)
+        .order_by(SessionEvent.id)
+    ).all()
+    reports.rollback()
+    return rows
+
+
+def _to_message(event_row) -> str:
+    from session_counters import COUNTER_COLUMNS, counts_from_values
+    payload = json.loads(event_row.payload)
+    if event_row.kind in ('delta', 'counters'):
+        # counts_from_values es lineal: sirve igual para deltas
+        payload = counts_from_values(
+            {c: payload.get(c, 0) for c in COUNTER_COLUMNS})
+    return _sse(event_row.kind, payload, event_row.id)
+
+
+def stream_session_events(session_id: int, poll_interval: float = 0.25,
+                          resync_interval: float = 15):
+    """
+    Generador SSE de los eventos de una sesión: primero los contadores
+    actuales ('counters'), luego cada evento nuevo ('delta', 'counters',
+    'status'). Cada resync_interval segundos sin eventos reenvía los
+    contadores, que sirven de latido y corrigen cualquier evento perdido.
+    La conexión se cierra tras SESSION_EVENTS_STREAM_SECONDS; EventSource
+    se reconecta solo.
+    """
+    counts, last_id = _snapshot(session_id)
+    if counts is None:
+        return
+    yield 'retry: 2000\n' + _sse('counters', counts, last_id)
+
+    duration = current_app.config.get('SESSION_EVENTS_STREAM_SECONDS', 300)
+    deadline = time.monotonic() + duration
+    last_sent = time.monotonic()
+    seen_mtime = _signal_mtime()
+    while time.monotonic() < deadline:
+        time.sleep(poll_interval)
+        mtime = _signal_mtime()
+        resync = time.monotonic() - last_sent >= resync_interval
+        if mtime == seen_mtime and not resync:
+            continue
+        seen_mtime = mtime
+        rows = _new_events(session_id, last_id)
+        if rows:
+            last_id = rows[-1].id
+            last_sent = time.monotonic()
+            yield ''.join(_to_message(row) for row in rows)
+        elif resync:
+            counts, snapshot_id = _snapshot(session_id)
+            if counts is None:
+                return
+            last_id = max(last_id, snapshot_id)
+            last_sent = time.monotonic()
+            yield _sse('counters', counts, last_id)
@@ -0,0 +1,71 @@
+from contextlib import contextmanager
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class SQLBudgetExceeded(RuntimeError):
+    pass
+
+
+# Contadores abiertos con count_statements en este proceso
+_counters = []
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context,
+                     executemany):
+    for counter in _counters:
+        counter.append(statement)
+    if has_request_context() and 'sql_statements' in g:
+        g.sql_statements.append(statement)
+
+
+@contextmanager
+def count_statements():
+    """
+    Lista de las sentencias SQL ejecutadas (en cualquier engine) dentro del
+    bloque with, p. ej. para comprobar cuántas consultas hace una función.
+    """
+    statements = []
+    _counters.append(statements)
+    try:
+        yield statements
+    finally:
+        _counters.remove(statements)
+
+
+def _budget():
+    budgets = current_app.config['SQL_QUERY_BUDGETS']
+    return budgets.get(f'{request.endpoint}:{request.method}',
+                       budgets.get(request.endpoint))
+
+
+def init_sql_budget(app):
+    """
+    Cuenta las sentencias SQL de cada petición, desde que empieza la vista
+    hasta que termina la respuesta (incluida una exportación en streaming),
+    y las compara con SQL_QUERY_BUDGETS ({endpoint: máximo}, o
+    {'endpoint:MÉTODO': máximo} para un método concreto). Por encima del
+    presupuesto se registra un aviso o, con SQL_QUERY_BUDGET_STRICT (en las
+    pruebas), se lanza SQLBudgetExceeded. Se llama tras registrar los
+    blueprints para no contar la carga de la sesión del día.
+    """
+    @app.before_request
+    def _start_sql_count():
+        if _budget() is not None:
+            g.sql_statements = []
+
+    @app.teardown_request
+    def _check_sql_budget(exc):
+        statements = g.pop('sql_statements', None)
+        if statements is None or exc is not None:
+            return
+        budget = _budget()
+        if len(statements) <= budget:
+            return
+        message = (f'{request.method} {request.endpoint} ejecutó '
+                   f'{len(statements)} sentencias SQL (presupuesto {budget})')
+        if current_app.config.get('SQL_QUERY_BUDGET_STRICT'):
+            raise SQLBudgetExceeded(message + ':\n' + '\n'.join(statements))
+        current_app.logger.warning(message)
@@ -113,64 +113,149 @@ function submitManual() {
     document.getElementById("codigo-input").value = ''; // Limpiar input
 }
 
-function submitCode(code) {
+// Cola local de escaneos: se guarda en localStorage y se envía por lotes a
+// /scan/batch. Si no hay conexión los escaneos quedan en la cola y se
+// reenvían al reconectar; el client_id evita que un reenvío se aplique dos
+// veces en el servidor.
+const SCAN_QUEUE_KEY = 'scanQueue';
+const SCAN_BATCH_SIZE = 50;
+const SCAN_FLUSH_DELAY_MS = 300;
+const SCAN_RETRY_DELAY_MS = 5000;
+let scanFlushTimeout = null;
+let scanFlushInFlight = false;
+
+function loadScanQueue() {
+    try {
+        return JSON.parse(localStorage.getItem(SCAN_QUEUE_KEY)) || [];
+    } catch (e) {
+        return [];
+    }
+}
+
+function saveScanQueue(queue) {
+    try {
+        localStorage.setItem(SCAN_QUEUE_KEY, JSON.stringify(queue));
+    } catch (e) {
+        console.error("scanner.js: No se pudo guardar la cola de escaneos:", e);
+    }
+}
+
+function newClientId() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+}
+
+function scheduleScanFlush(delay = SCAN_FLUSH_DELAY_MS) {
+    clearTimeout(scanFlushTimeout);
+    scanFlushTimeout = setTimeout(flushScanQueue, delay);
+}
+
+function submitCode(code, codeType = null) {
     // Si el código es igual al último exitoso y el mensaje está visible, no vuelvas a mostrar el mensaje
     if (code === lastSuccessCode && successMessageVisible) {
         return;
     }
-    fetch('/scan', {
+    const queue = loadScanQueue();
+    queue.push({
+        code: code,
+        code_type: codeType,
+        client_ts: new Date().toISOString(),
+        client_id: newClientId()
+    });
+    saveScanQueue(queue);
+    scheduleScanFlush();
+}
+
+function flushScanQueue() {
+    if (scanFlushInFlight) {
+        return;
+    }
+    const queue = loadScanQueue();
+    if (!queue.length) {
+        return;
+    }
+    if (!navigator.onLine) {
+        showScannerStatus(`Sin conexión: ${queue.length} escaneo(s) pendiente(s) de enviar.`, 'warning');
+        return;
+    }
+    const batch = queue.slice(0, SCAN_BATCH_SIZE);
+    scanFlushInFlight = true;
+    fetch('/scan/batch', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ code: code }) // Enviar un solo código
+        body: JSON.stringify({ scans: batch })
     })
     .then(res => {
         if (!res.ok) {
-            // Si la respuesta no es OK (ej. 404, 500), intentar leer el mensaje de error del backend
-            return res.json().then(errData => {
-                throw new Error(errData.message || 'Error desconocido del servidor.');
-            }).catch(() => {
-                // Si no se puede parsear el JSON de error, es un error de comunicación genérico
-                throw new Error('Error de comunicación con el servidor.');
-            });
+            throw new Error(`Error del servidor (${res.status}).`);
         }
-        return res.json(); // Si la respuesta es OK, parsear el JSON normalmente
+        return res.json();
     })
     .then(data => {
-        if (data.error) {
-            showError(data.message || data.error);
-            if (data.error === 'unknown_package_detected') {
-                showUnknownPackagePrompt(code, data.message);
-            }
-        } else {
-            // Actualizar los contadores del footer en tiempo real
-            if (data.total_scanned_packages !== undefined) {
-                const footerEscaneados = document.getElementById('footer-escaneados');
-                if (footerEscaneados) footerEscaneados.textContent = data.total_scanned_packages;
-            }
-            if (data.total_packages !== undefined && data.total_scanned_packages !== undefined) {
-                const footerFaltantes = document.getElementById('footer-faltantes');
-                if (footerFaltantes) footerFaltantes.textContent = (data.total_packages - data.total_scanned_packages);
+        // Quitar de la cola solo los escaneos confirmados por el servidor
+        const sent = new Set(batch.map(item => item.client_id));
+        saveScanQueue(loadScanQueue().filter(item => !sent.has(item.client_id)));
+        updateFooterCounts(data);
+        (data.results || []).forEach((result, i) => {
+            if (!result.replayed) {
+                handleScanResult(batch[i].code, result);
             }
-            if (data.not_registered_packages !== undefined) {
-                const footerNoEsperados = document.getElementById('footer-no-esperados');
-                if (footerNoEsperados) footerNoEsperados.textContent = data.not_registered_packages;
-            }
-            lastSuccessCode = code;
-            successMessageVisible = true;
-            showSuccess(data.message);
-            if (html5QrCodeInstance) {
-                setTimeout(() => {
-                    html5QrCodeInstance.resume();
-                }, 1000);
-            }
-        }
+        });
     })
     .catch(error => {
-        // Capturar errores lanzados por el bloque .then() o errores de red
-        showError(error.message || 'Error de comunicación con el servidor.');
+        // Se conservan en la cola y se reintenta más tarde
+        const pending = loadScanQueue().length;
+        showScannerStatus(`${error.message || 'Error de comunicación con el servidor.'} ${pending} escaneo(s) pendiente(s); se reintentará automáticamente.`, 'warning');
+        scheduleScanFlush(SCAN_RETRY_DELAY_MS);
+    })
+    .finally(() => {
+        scanFlushInFlight = false;
+        if (loadScanQueue().length && navigator.onLine) {
+            scheduleScanFlush();
+        }
     });
 }
 
+function updateFooterCounts(data) {
+    // Actualizar los contadores del footer en tiempo real
+    if (data.total_scanned_packages !== undefined) {
+        const footerEscaneados = document.getElementById('footer-escaneados');
+        if (footerEscaneados) footerEscaneados.textContent = data.total_scanned_packages;
+    }
+    if (data.total_packages !== undefined && data.total_scanned_packages !== undefined) {
+        const footerFaltantes = document.getElementById('footer-faltantes');
+        if (footerFaltantes) footerFaltantes.textContent = (data.total_packages - data.total_scanned_packages);
+    }
+    if (data.not_registered_packages !== undefined) {
+        const footerNoEsperados = document.getElementById('footer-no-esperados');
+        if (footerNoEsperados) footerNoEsperados.textContent = data.not_registered_packages;
+    }
+}
+
+function handleScanResult(code, data) {
+    if (data.error) {
+        showError(data.message || data.error);
+        if (data.error === 'unknown_package_detected') {
+            showUnknownPackagePrompt(code, data.message, data.suggestions);
+        }
+        return;
+    }
+    lastSuccessCode = code;
+    successMessageVisible = true;
+    showSuccess(data.message);
+    if (html5QrCodeInstance) {
+        setTimeout(() => {
+            html5QrCodeInstance.resume();
+        }, 1000);
+    }
+}
+
+// Reenviar la cola al recuperar la conexión o al volver a cargar la página
+window.addEventListener('online', () => flushScanQueue());
+document.addEventListener('DOMContentLoaded', () => flushScanQueue());
+
 // Función para mostrar mensaje de éxito (ahora recibe el mensaje y opcionalmente el ID del div)
 function showSuccess(message, messageDivId = 'scan-message') {
     const msg = document.getElementById(messageDivId);
@@ -217,12 +302,18 @@ function showRegisterPrompt(tracking, guia_internacional, message, messageDivId
     window.location.href = url;
 }
 
-function showUnknownPackagePrompt(code, message, messageDivId = 'scan-message') {
+function showUnknownPackagePrompt(code, message, suggestions = [], messageDivId = 'scan-message') {
     const msg = document.getElementById(messageDivId);
     if (msg) {
+        // Guías esperadas a un carácter del código leído (etiqueta dañada)
+        const suggestionButtons = (suggestions || []).map(s => `
+            <button class="btn btn-success" onclick="confirmSuggestedCode('${s.code}', '${s.code_type}')">${s.code} (${s.status})</button>`).join('');
+        const suggestionsHtml = suggestionButtons ? `
+                <p class="mb-2">¿Quisiste decir?</p>
+                <div class="d-flex flex-wrap justify-content-center gap-2 mb-3">${suggestionButtons}</div>` : '';
         msg.innerHTML = `
             <div class="alert alert-warning text-center">
-                <p>${message}</p>
+                <p>${message}</p>${suggestionsHtml}
                 <p>¿Deseas registrar este paquete desconocido (<strong>${code}</strong>)?</p>
                 <div id="unknown-actions" class="d-flex flex-wrap justify-content-center gap-2 mt-3">
                     <button class="btn btn-info" onclick="confirmUnknownTracking('${code}')">Registrar como Tracking</button>
@@ -351,6 +442,17 @@ function confirmUnknownPackage(code) {
     });
 }
 
+// Escanear la guía sugerida en lugar del código leído
+function confirmSuggestedCode(code, codeType) {
+    showScannerStatus(`Escaneando ${code}...`, 'info');
+    submitCode(code, codeType);
+    if (html5QrCodeInstance) {
+        html5QrCodeInstance.resume();
+    } else {
+        startScannerLogic('reader');
+    }
+}
+
 function cancelUnknownPackage() {
     showScannerStatus("Registro de paquete desconocido cancelado.", 'info');
     // Reanudar el escáner
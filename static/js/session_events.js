@@ -0,0 +1,42 @@
+// Contadores del footer en tiempo real: la página se suscribe a
+// /session/<id>/events (Server-Sent Events) y aplica los contadores
+// completos ('counters') o sus cambios ('delta') que publica el servidor
+// al escanear, registrar, editar o cargar guías en cualquier estación.
+// Los cambios de estado de cada guía se reenvían como el evento
+// 'session-status' del documento para que cada vista los use.
+(function () {
+    const footer = document.querySelector('.footer-counter[data-events-url]');
+    if (!footer || !window.EventSource) {
+        return;
+    }
+    let counts = null;
+
+    function renderCounts() {
+        const escaneados = document.getElementById('footer-escaneados');
+        const faltantes = document.getElementById('footer-faltantes');
+        const noEsperados = document.getElementById('footer-no-esperados');
+        if (escaneados) escaneados.textContent = counts.total_scanned_packages;
+        if (faltantes) faltantes.textContent = Math.max(counts.total_packages - counts.total_scanned_packages, 0);
+        if (noEsperados) noEsperados.textContent = counts.not_registered_packages;
+    }
+
+    const source = new EventSource(footer.dataset.eventsUrl);
+    source.addEventListener('counters', event => {
+        counts = JSON.parse(event.data);
+        renderCounts();
+    });
+    source.addEventListener('delta', event => {
+        if (!counts) {
+            return;
+        }
+        const delta = JSON.parse(event.data);
+        Object.keys(delta).forEach(key => {
+            counts[key] = (counts[key] || 0) + delta[key];
+        });
+        renderCounts();
+    });
+    source.addEventListener('status', event => {
+        document.dispatchEvent(new CustomEvent('session-status', { detail: JSON.parse(event.data) }));
+    });
+    window.addEventListener('beforeunload', () => source.close());
+})();
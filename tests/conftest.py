@@ -0,0 +1,73 @@
+import io
+import os
+import sys
+import tempfile
+import pytest
+
+# La aplicación se crea al importar app.py con la configuración del entorno:
+# base de datos SQLite en un archivo temporal (o la de DATABASE_URL si es
+# PostgreSQL) y carpetas de trabajo (instance/, exports/) fuera del repo.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORKDIR = tempfile.mkdtemp(prefix='escaneo-tests-')
+os.chdir(WORKDIR)
+if not os.environ.get('DATABASE_URL', '').startswith('postgresql'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(WORKDIR,
+                                                             'test.db')
+os.environ['IMPORT_ASYNC'] = '0'
+os.environ['SQL_QUERY_BUDGET_STRICT'] = '1'
+
+from app import app as flask_app  # noqa: E402
+from models import db  # noqa: E402
+import manifest_index  # noqa: E402
+from session_cache import forget_current_session  # noqa: E402
+
+
+def is_postgresql() -> bool:
+    return flask_app.config['SQLALCHEMY_DATABASE_URI'].startswith(
+        'postgresql')
+
+
+@pytest.fixture
+def app():
+    # Base de datos vacía y sin cachés del proceso en cada prueba
+    with flask_app.app_context():
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+    forget_current_session()
+    manifest_index._indexes.clear()
+    yield flask_app
+    with flask_app.app_context():
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def manifest_csv(rows) -> bytes:
+    """
+    Manifiesto CSV con las columnas de la carga masiva a partir de pares
+    (tracking, guía internacional).
+    """
+    lines = ['TRACKING,GUIA INTERNACIONAL']
+    lines += [f'{tracking},{guia}' for tracking, guia in rows]
+    return ('\n'.join(lines) + '\n').encode()
+
+
+@pytest.fixture
+def upload(client):
+    """
+    Carga un manifiesto (lista de pares tracking, guía internacional) en la
+    sesión del día con /upload.
+    """
+    def _upload(rows, filename='manifiesto.csv'):
+        response = client.post('/upload', data={
+            'excel_file': (io.BytesIO(manifest_csv(rows)), filename)
+        }, content_type='multipart/form-data')
+        assert response.status_code in (200, 302)
+        return response
+    return _upload
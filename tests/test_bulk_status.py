@@ -0,0 +1,57 @@
+from collections import Counter
+from models import db, Guia, GuiaSessionStatus
+from session_cache import get_or_create_session
+from session_counters import get_session_counts, recompute_session_counters
+
+
+def _setup(app, client, upload):
+    upload([('T1', 'G1'), ('T2', 'G2'), ('T3', 'G3'), ('X4', 'G4')])
+    client.post('/scan', json={'code': 'T1'})
+    with app.app_context():
+        return get_or_create_session().id
+
+
+def _statuses(app):
+    with app.app_context():
+        rows = db.session.query(Guia.tracking, GuiaSessionStatus.status).join(
+            Guia, Guia.id == GuiaSessionStatus.guia_id)
+        return dict(rows)
+
+
+def _post(client, session_id, **payload):
+    return client.post('/registros/bulk_status', json=dict(
+        payload, session_id=session_id, new_status='NO ESCANEADO'))
+
+
+def test_filter_path_updates_matches_and_recomputes_counters(app, client,
+                                                             upload):
+    session_id = _setup(app, client, upload)
+    response = _post(client, session_id, filters={
+        'tracking': 'T', 'status': 'NO RECIBIDO'})
+    data = response.json
+    assert data['updated'] == 2
+    assert _statuses(app) == {'T1': 'RECIBIDO', 'T2': 'NO ESCANEADO',
+                              'T3': 'NO ESCANEADO', 'X4': 'NO RECIBIDO'}
+
+    with app.app_context():
+        counts = get_session_counts(session_id)
+        # Los contadores mantenidos coinciden con un recálculo completo
+        recompute_session_counters(session_id)
+        assert get_session_counts(session_id) == counts
+        db.session.rollback()
+    assert {key: data[key] for key in counts} == counts
+    assert Counter(_statuses(app).values())['RECIBIDO'] == \
+        counts['total_scanned_packages'] == 1
+
+
+def test_filter_path_requires_a_filter_or_all(app, client, upload):
+    session_id = _setup(app, client, upload)
+    before = _statuses(app)
+    for filters in ({}, {'tracking': '', 'status': ' '}):
+        response = _post(client, session_id, filters=filters)
+        assert response.status_code == 400
+    assert _statuses(app) == before
+
+    response = _post(client, session_id, filters={}, all=True)
+    assert response.json['updated'] == 4
+    assert set(_statuses(app).values()) == {'NO ESCANEADO'}
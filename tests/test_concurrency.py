@@ -0,0 +1,76 @@
+import threading
+import pytest
+from conftest import is_postgresql
+from models import db, Registro
+from session_cache import get_current_session
+from session_counters import get_session_counts, recompute_session_counters
+
+pytestmark = pytest.mark.skipif(
+    is_postgresql(), reason='prueba del perfil de SQLite (WAL)')
+
+N_GUIAS = 300
+N_SCANNERS = 4
+N_READERS = 2
+
+
+def test_parallel_scans_and_reads(app, client, upload):
+    # Varias estaciones escanean (cada código lo escanean dos a la vez)
+    # mientras otras leen /registros y exportan, con la base de datos en
+    # archivo y el perfil de producción (WAL, busy_timeout)
+    upload([(f'T{i}', f'G{i}') for i in range(N_GUIAS)])
+    with app.app_context():
+        session_id = get_current_session().id
+    codes = [f'T{i}' for i in range(0, N_GUIAS, 2)]
+    errors = []
+    done = threading.Event()
+
+    def scanner(n):
+        scan_client = app.test_client()
+        try:
+            for i, code in enumerate(codes):
+                if i % N_SCANNERS not in (n, (n + 1) % N_SCANNERS):
+                    continue
+                response = scan_client.post('/scan', json={'code': code})
+                if response.status_code != 200 or 'error' in response.json:
+                    errors.append((code, response.status_code,
+                                   response.get_data(as_text=True)))
+        except Exception as e:
+            errors.append(('scan', repr(e)))
+
+    def reader():
+        read_client = app.test_client()
+        try:
+            while not done.is_set():
+                for url in ('/registros', '/registros?status=RECIBIDO',
+                            '/export?session_id=%d&format=csv' % session_id):
+                    response = read_client.get(url)
+                    response.get_data()
+                    response.close()
+                    if response.status_code != 200:
+                        errors.append((url, response.status_code))
+        except Exception as e:
+            errors.append(('read', repr(e)))
+
+    scanners = [threading.Thread(target=scanner, args=(n,))
+                for n in range(N_SCANNERS)]
+    readers = [threading.Thread(target=reader) for _ in range(N_READERS)]
+    for thread in readers + scanners:
+        thread.start()
+    for thread in scanners:
+        thread.join()
+    done.set()
+    for thread in readers:
+        thread.join()
+
+    assert not [e for e in errors if 'database is locked' in repr(e)]
+    assert errors == []
+    with app.app_context():
+        counts = get_session_counts(session_id)
+        assert counts['total_scanned_packages'] == len(codes)
+        assert counts['total_packages'] == N_GUIAS
+        # Un solo Registro por guía aunque se escaneara dos veces a la vez
+        assert Registro.query.filter_by(session_id=session_id).count() == \
+            len(codes)
+        recompute_session_counters(session_id)
+        db.session.commit()
+        assert get_session_counts(session_id) == counts
@@ -0,0 +1,35 @@
+import re
+from datetime import date
+from models import db, Session, GuiaSessionStatus
+from session_cache import get_or_create_session
+from session_counters import COUNTER_COLUMNS, preview_close_counters
+
+
+def test_close_counters_match_preview(app, client, upload):
+    upload([(f'T{i}', f'G{i}') for i in range(6)])
+    for code in ('T1', 'G2', 'ZZZ'):
+        client.post('/scan', json={'code': code})
+    client.post('/register_unknown', json={'code': 'ZZZ'})
+    with app.app_context():
+        session_id = get_or_create_session().id
+        preview = preview_close_counters(session_id)
+    assert preview['missing_packages'] == preview['not_scanned_packages'] == 4
+    assert preview['total_scanned_packages'] == 2
+    assert preview['unknown_packages'] == 1
+
+    # La página de confirmación muestra el resumen previsto
+    page = client.get('/end_session').get_data(as_text=True)
+    badges = re.findall(r'<span class="badge [^"]*">(\d+)</span>', page)
+    assert [int(b) for b in badges] == [preview['total_scanned_packages'],
+                                        preview['unknown_packages'],
+                                        preview['missing_packages']]
+
+    response = client.post('/end_session', data={
+        'confirmation_date': date.today().isoformat()})
+    assert response.status_code == 302
+    with app.app_context():
+        session = db.session.get(Session, session_id)
+        assert session.is_closed
+        assert {c: getattr(session, c) for c in COUNTER_COLUMNS} == preview
+        assert GuiaSessionStatus.query.filter_by(
+            session_id=session_id, status='NO RECIBIDO').count() == 0
@@ -0,0 +1,55 @@
+import csv
+import io
+import json
+import pytest
+from openpyxl import load_workbook
+from exporter import EXPORT_COLUMNS
+from session_cache import get_or_create_session
+
+N_GUIAS = 1200  # Más que un lote de yield_per y que un volcado del flujo
+
+
+@pytest.fixture
+def session_id(app, client, upload):
+    upload([(f'T{i}', f'G{i}') for i in range(N_GUIAS)])
+    client.post('/scan', json={'code': 'T5'})
+    with app.app_context():
+        return get_or_create_session().id
+
+
+def _export(client, session_id, export_format, query=''):
+    response = client.get(f'/export?session_id={session_id}'
+                          f'&format={export_format}{query}')
+    body = response.get_data()
+    response.close()
+    assert response.status_code == 200
+    return body
+
+
+def test_xlsx_export_opens_with_every_row(client, session_id):
+    body = _export(client, session_id, 'xlsx')
+    workbook = load_workbook(io.BytesIO(body), read_only=True)
+    rows = list(workbook.worksheets[0].iter_rows(values_only=True))
+    workbook.close()
+    assert list(rows[0]) == EXPORT_COLUMNS
+    assert len(rows) == N_GUIAS + 1
+    # Orden de /registros: el último cambio de estado primero
+    assert rows[1][0] == 'T5' and rows[1][3] == 'RECIBIDO'
+    assert {row[0] for row in rows[1:]} == {f'T{i}' for i in range(N_GUIAS)}
+
+
+def test_csv_and_ndjson_export_row_counts(client, session_id):
+    body = _export(client, session_id, 'csv')
+    rows = list(csv.DictReader(io.StringIO(body.decode('utf-8-sig'))))
+    assert len(rows) == N_GUIAS
+    assert sum(r['Estado Sesión'] == 'RECIBIDO' for r in rows) == 1
+
+    lines = _export(client, session_id, 'ndjson').decode().splitlines()
+    assert len(lines) == N_GUIAS
+    assert set(json.loads(lines[0])) == set(EXPORT_COLUMNS)
+
+
+def test_export_applies_filters(client, session_id):
+    body = _export(client, session_id, 'csv', '&status=RECIBIDO')
+    rows = list(csv.DictReader(io.StringIO(body.decode('utf-8-sig'))))
+    assert [r['Tracking'] for r in rows] == ['T5']
@@ -0,0 +1,50 @@
+import hashlib
+import io
+from datetime import date
+from models import db, Guia
+from import_history import find_identical_import
+from session_cache import get_or_create_session
+from utils import import_manifest_file
+from conftest import manifest_csv
+
+
+def _import(app, session_id, rows):
+    data = manifest_csv(rows)
+    return import_manifest_file(
+        io.BytesIO(data), 'csv', session_id, app.config,
+        sha256=hashlib.sha256(data).hexdigest(), filename='manifiesto.csv')
+
+
+def test_identical_upload_is_not_processed_again(app):
+    with app.app_context():
+        session_id = get_or_create_session(date(2024, 3, 1)).id
+        rows = [('T1', 'G1'), ('T2', 'G2')]
+        first = _import(app, session_id, rows)
+        again = _import(app, session_id, rows)
+        assert first['n_added_session_status'] == 2
+        assert again['duplicate_of'] is not None
+
+
+def test_other_session_import_invalidates_history(app):
+    # Otra sesión cambia con su carga (UPDATE de Core) la guía internacional
+    # de guías compartidas: la carga repetida del archivo original debe
+    # procesarse y devolver los valores del archivo
+    with app.app_context():
+        first = get_or_create_session(date(2024, 3, 1)).id
+        second = get_or_create_session(date(2024, 3, 2)).id
+        rows = [('T1', 'G1'), ('T2', 'G2'), ('T3', 'G3')]
+        _import(app, first, rows)
+        _import(app, second, [('T1', 'GX'), ('T2', 'GY')])
+        assert Guia.query.filter_by(tracking='T1').one() \
+            .guia_internacional == 'GX'
+
+        data = manifest_csv(rows)
+        assert find_identical_import(
+            first, hashlib.sha256(data).hexdigest()) is None
+        stats = _import(app, first, rows)
+        assert 'duplicate_of' not in stats
+        assert stats['n_unchanged_rows'] == 0
+        db.session.expire_all()
+        assert {g.tracking: g.guia_internacional
+                for g in Guia.query.all()} == {
+            'T1': 'G1', 'T2': 'G2', 'T3': 'G3'}
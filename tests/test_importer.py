@@ -0,0 +1,46 @@
+import hashlib
+import io
+from models import Guia, GuiaSessionStatus
+from session_cache import get_or_create_session
+from utils import import_manifest_file
+from conftest import manifest_csv
+
+
+def _import(app, session_id, rows):
+    data = manifest_csv(rows)
+    return import_manifest_file(
+        io.BytesIO(data), 'csv', session_id, app.config,
+        sha256=hashlib.sha256(data).hexdigest(), filename='manifiesto.csv')
+
+
+def _guias(app):
+    with app.app_context():
+        return {g.tracking: g.guia_internacional for g in Guia.query}
+
+
+def test_last_duplicate_wins_across_chunks(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'IMPORT_CHUNK_SIZE', 2)
+    with app.app_context():
+        session_id = get_or_create_session().id
+        stats = _import(app, session_id, [
+            ('T1', 'GA'), ('T2', 'G2'),  # Primer bloque
+            ('T3', 'G3'), ('T1', 'GB'),  # Segundo bloque
+            ('T1', 'GC'), ('T1', 'GD'),  # Tercero, duplicado en el bloque
+        ])
+        assert GuiaSessionStatus.query.count() == 3
+    assert _guias(app) == {'T1': 'GD', 'T2': 'G2', 'T3': 'G3'}
+    assert stats['n_added_guia'] == 3
+    assert stats['n_added_session_status'] == 3
+    assert stats['n_ignored_guia'] == 3
+
+
+def test_reimport_applies_last_duplicate(app, monkeypatch):
+    # La carga anterior dejó T1 -> GB; el archivo nuevo cambia T1 en el
+    # primer bloque y lo vuelve a GB en el segundo: prevalece la última
+    monkeypatch.setitem(app.config, 'IMPORT_CHUNK_SIZE', 2)
+    with app.app_context():
+        session_id = get_or_create_session().id
+        _import(app, session_id, [('T1', 'GB'), ('T2', 'G2')])
+        _import(app, session_id, [('T1', 'GA'), ('T2', 'G2'),
+                                  ('T3', 'G3'), ('T1', 'GB')])
+    assert _guias(app) == {'T1': 'GB', 'T2': 'G2', 'T3': 'G3'}
@@ -0,0 +1,34 @@
+from datetime import date
+from types import SimpleNamespace
+from models import db, Session
+from utils import insert_ignore
+
+
+def _rows(*days):
+    return [{'session_date': day, 'is_closed': False} for day in days]
+
+
+def test_insert_ignore_skips_existing_rows(app):
+    with app.app_context():
+        assert insert_ignore(Session, _rows(date(2024, 1, 1)),
+                             ['session_date']) == 1
+        assert insert_ignore(Session, _rows(date(2024, 1, 1),
+                                            date(2024, 1, 2)),
+                             ['session_date']) == 1
+        db.session.commit()
+        assert Session.query.count() == 2
+
+
+def test_insert_ignore_fallback_for_other_databases(app, monkeypatch):
+    # Un motor sin ON CONFLICT ni INSERT IGNORE: consulta previa por fila
+    with app.app_context():
+        monkeypatch.setattr(db.session, 'get_bind', lambda *a, **kw:
+                            SimpleNamespace(dialect=SimpleNamespace(
+                                name='mssql')))
+        assert insert_ignore(Session, _rows(date(2024, 2, 1)),
+                             ['session_date']) == 1
+        assert insert_ignore(Session, _rows(date(2024, 2, 1),
+                                            date(2024, 2, 2)),
+                             ['session_date']) == 1
+        db.session.commit()
+        assert Session.query.count() == 2
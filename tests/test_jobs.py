@@ -0,0 +1,76 @@
+import io
+import logging
+import os
+import subprocess
+import sys
+from datetime import date
+from sqlalchemy.exc import OperationalError
+import jobs
+from models import db, ImportJob
+from session_cache import get_or_create_session
+
+
+def _dead_pid() -> int:
+    # Pid de un proceso que ya terminó
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def _job(session_id, status='queued', worker=None):
+    job = ImportJob(session_id=session_id, filename='manifiesto.csv',
+                    status=status, worker=worker)
+    db.session.add(job)
+    db.session.commit()
+    return job.id
+
+
+def test_recover_fails_only_jobs_of_dead_processes(app):
+    host = jobs.job_worker().rpartition(':')[0]
+    with app.app_context():
+        session_id = get_or_create_session(date(2024, 3, 1)).id
+        legacy = _job(session_id)
+        dead = _job(session_id, 'running', f'{host}:{_dead_pid()}')
+        alive = _job(session_id, 'running', f'{host}:{os.getppid()}')
+        other_host = _job(session_id, 'queued', 'otro-host:1')
+        done = _job(session_id, 'done', f'{host}:{_dead_pid()}')
+
+        assert jobs.recover_import_jobs() == 2
+        status = {job.id: job for job in ImportJob.query}
+        for job_id in (legacy, dead):
+            assert status[job_id].status == 'failed'
+            assert status[job_id].error == jobs.INTERRUPTED_JOB_ERROR
+            assert status[job_id].finished_at is not None
+        assert status[alive].status == 'running'
+        assert status[other_host].status == 'queued'
+        assert status[done].status == 'done'
+
+
+def _run(app, stream, extension='xlsx'):
+    with app.app_context():
+        session_id = get_or_create_session(date(2024, 3, 1)).id
+        job_id = _job(session_id, worker=jobs.job_worker())
+    jobs._run_import_job(app, job_id, stream, extension)
+    with app.app_context():
+        return db.session.get(ImportJob, job_id)
+
+
+def test_unreadable_file_reports_read_error(app):
+    job = _run(app, io.BytesIO(b'no es un xlsx'))
+    assert job.status == 'failed'
+    assert job.error.startswith('Error al leer el archivo Excel')
+
+
+def test_database_error_is_logged_not_reported_as_read_error(
+        app, monkeypatch, caplog):
+    def failing_import(*args, **kwargs):
+        raise OperationalError('INSERT', {}, Exception('disk I/O error'))
+    monkeypatch.setattr(jobs, 'import_manifest_file', failing_import)
+
+    with caplog.at_level(logging.ERROR):
+        job = _run(app, io.BytesIO(b'TRACKING,GUIA INTERNACIONAL\n'), 'csv')
+    assert job.status == 'failed'
+    assert 'Error al leer' not in job.error
+    assert 'disk I/O error' not in job.error
+    record = next(r for r in caplog.records if 'Falló la carga' in r.message)
+    assert record.exc_info[0] is OperationalError
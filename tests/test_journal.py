@@ -0,0 +1,99 @@
+import errno
+import json
+import os
+import journal
+from models import db, Guia, Registro, GuiaSessionStatus
+from session_cache import get_or_create_session
+from session_counters import get_session_counts
+
+
+def _entries(app, trackings):
+    with app.app_context():
+        session_id = get_or_create_session().id
+        guias = {g.tracking: g.id for g in Guia.query}
+    return session_id, [{
+        'client_id': f'journal-{tracking}', 'session_id': session_id,
+        'guia_id': guias[tracking], 'code': tracking, 'code_type': None,
+        'scanned_at': '2024-03-01T10:00:00', 'seq': seq,
+    } for seq, tracking in enumerate(trackings, 1)]
+
+
+def _write_journal(app, entries, tail=b''):
+    path = os.path.join(app.config['SCAN_JOURNAL_DIR'],
+                        'scan_journal.999999.jsonl')
+    with open(path, 'wb') as f:
+        f.writelines((json.dumps(e) + '\n').encode() for e in entries)
+        f.write(tail)
+    return path
+
+
+def _state(app, session_id):
+    with app.app_context():
+        registros = {r.guia_id: 0 for r in Registro.query}
+        for r in Registro.query:
+            registros[r.guia_id] += 1
+        statuses = {s.guia_id: s.status for s in GuiaSessionStatus.query}
+        return registros, statuses, get_session_counts(session_id)
+
+
+def test_replay_twice_applies_each_scan_once(app, upload):
+    upload([('T1', 'G1'), ('T2', 'G2'), ('T3', 'G3')])
+    session_id, entries = _entries(app, ['T1', 'T2'])
+    # Última línea a medio escribir: nunca se confirmó al escáner
+    path = _write_journal(app, entries, tail=b'{"client_id": "jour')
+
+    journal.replay_journals(app)
+    assert not os.path.exists(path)
+    registros, statuses, counts = _state(app, session_id)
+    assert registros == {entries[0]['guia_id']: 1, entries[1]['guia_id']: 1}
+    assert sorted(statuses.values()) == ['NO RECIBIDO', 'RECIBIDO',
+                                         'RECIBIDO']
+    assert counts['total_scanned_packages'] == 2
+
+    # El proceso murió antes de borrar el diario: reaplicarlo no duplica
+    _write_journal(app, entries)
+    journal.replay_journals(app)
+    assert not os.path.exists(path)
+    assert _state(app, session_id) == (registros, statuses, counts)
+
+
+def test_failing_entry_is_set_aside(app, upload, monkeypatch):
+    monkeypatch.setattr(journal.time, 'sleep', lambda seconds: None)
+    upload([('T1', 'G1'), ('T2', 'G2'), ('T3', 'G3')])
+    session_id, entries = _entries(app, ['T1', 'T2', 'T3'])
+    entries[1]['scanned_at'] = 'no es una fecha'
+
+    journal.apply_or_set_aside(app, entries)
+    registros, statuses, counts = _state(app, session_id)
+    assert set(registros) == {entries[0]['guia_id'], entries[2]['guia_id']}
+    assert counts['total_scanned_packages'] == 2
+    dead = os.path.join(app.config['SCAN_JOURNAL_DIR'], 'scan_journal.dead')
+    with open(dead) as f:
+        set_aside = [json.loads(line) for line in f]
+    os.remove(dead)
+    assert [e['client_id'] for e in set_aside] == ['journal-T2']
+
+
+def test_write_error_falls_back_to_synchronous_scan(app, client, upload,
+                                                    monkeypatch, tmp_path):
+    upload([('T1', 'G1'), ('T2', 'G2')])
+    scan_journal = journal.ScanJournal(app, str(tmp_path / 'journal.jsonl'))
+
+    def disk_full(fd):
+        raise OSError(errno.ENOSPC, 'No space left on device')
+    monkeypatch.setattr(journal.os, 'fsync', disk_full)
+    app.extensions['scan_journal'] = scan_journal
+    try:
+        response = client.post('/scan', json={'code': 'T1'})
+        again = client.post('/scan', json={'code': 'T1'})
+    finally:
+        del app.extensions['scan_journal']
+
+    assert response.json['status'] == 'RECIBIDO'
+    assert again.json['status'] == 'YA RECIBIDO'
+    with app.app_context():
+        guia_id = Guia.query.filter_by(tracking='T1').one().id
+        assert Registro.query.filter_by(guia_id=guia_id).count() == 1
+        session_id = get_or_create_session().id
+    assert not scan_journal.is_pending(session_id, guia_id)
+    assert os.path.getsize(scan_journal.path) == 0
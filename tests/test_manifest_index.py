@@ -0,0 +1,46 @@
+import manifest_index
+from models import db, Session, Guia
+from session_cache import get_or_create_session
+
+
+def _version(app):
+    with app.app_context():
+        session = get_or_create_session()
+        return session.id, db.session.get(Session, session.id).manifest_version
+
+
+def test_new_entries_do_not_rebuild_other_indexes(app, client, upload):
+    upload([('T1', 'G1'), ('T2', 'G2')])
+    client.post('/scan', json={'code': 'T1'})
+    session_id, version = _version(app)
+    index = manifest_index._indexes[session_id]
+
+    response = client.post('/register_unknown', json={'code': 'NEW1'})
+    assert response.status_code == 200
+    assert _version(app) == (session_id, version)
+    assert manifest_index._indexes[session_id] is index
+    entry = index.lookup('NEW1')
+    assert entry.status == 'NO ESPERADO'
+
+    # Otro proceso sin la guía en su índice la encuentra en la base de datos
+    index.discard(entry.guia_id)
+    data = client.post('/scan', json={'code': 'NEW1'}).json
+    assert data['status'] == 'NO ESPERADO'
+    assert index.lookup('NEW1').guia_id == entry.guia_id
+    assert _version(app) == (session_id, version)
+
+
+def test_changed_entry_bumps_version(app, client, upload):
+    upload([('T1', 'G1'), ('T2', 'G2')])
+    client.post('/scan', json={'code': 'T1'})
+    session_id, version = _version(app)
+
+    # Una guía esperada registrada como NO ESPERADO cambia una entrada que
+    # los demás procesos ya tienen indexada
+    client.post('/register_unknown', json={'code': 'T2',
+                                           'code_type': 'tracking'})
+    assert _version(app) == (session_id, version + 1)
+    with app.app_context():
+        guia_id = Guia.query.filter_by(tracking='T2').one().id
+    assert manifest_index._indexes[session_id].by_guia[guia_id].status == \
+        'NO ESPERADO'
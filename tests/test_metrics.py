@@ -0,0 +1,39 @@
+import json
+import os
+import re
+
+
+def _scans_total(client) -> dict:
+    text = client.get('/metrics').get_data(as_text=True)
+    lines = [line for line in text.splitlines()
+             if line.startswith('scans_total')]
+    assert all('session_id' not in line for line in lines)
+    return {re.search(r'result="([^"]*)"', line).group(1):
+            float(line.rsplit(' ', 1)[1]) for line in lines}
+
+
+def test_scans_total_is_labelled_by_result_only(app, client, upload):
+    upload([('T1', 'G1')])
+    before = _scans_total(client)
+    client.post('/scan', json={'code': 'T1'})
+    client.post('/scan', json={'code': 'T1'})
+    client.post('/scan', json={'code': 'ZZZ'})
+    after = _scans_total(client)
+    for result in ('RECIBIDO', 'YA RECIBIDO', 'unknown'):
+        assert after[result] - before.get(result, 0) == 1
+
+
+def test_old_dumps_with_session_label_are_ignored(app, client):
+    # Volcado de otro proceso vivo con la etiqueta session_id anterior
+    os.makedirs(app.config['METRICS_DIR'], exist_ok=True)
+    path = os.path.join(app.config['METRICS_DIR'],
+                        f'metrics.{os.getppid()}.json')
+    with open(path, 'w') as f:
+        json.dump({'scans_total': [[['7', 'RECIBIDO'], 5],
+                                   [['RECIBIDO'], 2]]}, f)
+    try:
+        before = _scans_total(client)
+    finally:
+        os.remove(path)
+    after = _scans_total(client)
+    assert before['RECIBIDO'] - after.get('RECIBIDO', 0) == 2
@@ -0,0 +1,27 @@
+import pandas as pd
+from models import Guia
+from utils import normalize_code, normalize_codes, find_guia
+
+CODES = ['A #', ' a-1 ', '#B#', '  ', '#', 'Ñ.1,2', 'x\t#', 'C # D', '0123']
+
+
+def test_vectorized_normalization_matches_normalize_code():
+    vectorized = normalize_codes(pd.Series(CODES)).tolist()
+    assert vectorized == [normalize_code(code) or '' for code in CODES]
+
+
+def test_normalize_code_is_idempotent():
+    for code in CODES:
+        once = normalize_code(code)
+        assert normalize_code(once) == once
+
+
+def test_imported_codes_are_found_as_scanned(app, client, upload):
+    upload([('A #', 'G #1'), ('C # D', 'G2')])
+    with app.app_context():
+        for guia in Guia.query:
+            assert guia.tracking_norm == normalize_code(guia.tracking)
+        assert find_guia('A #').guia_internacional == 'G 1'
+        assert find_guia('G #1', 'guia_internacional').tracking == 'A '
+    assert client.post('/scan', json={'code': 'A #'}).json['status'] == \
+        'RECIBIDO'
@@ -0,0 +1,42 @@
+import csv
+import io
+import pytest
+from conftest import is_postgresql
+from models import db, Guia
+from pg_bulk import copy_supported
+from session_cache import get_current_session
+from session_counters import get_session_counts
+
+pytestmark = pytest.mark.skipif(
+    not is_postgresql(),
+    reason='necesita DATABASE_URL con una base de datos PostgreSQL')
+
+
+def test_manifest_import_and_export_with_copy(app, client, upload):
+    with app.app_context():
+        assert copy_supported(db.session)
+
+    # Guías nuevas, duplicados en el archivo y filas sin guía internacional
+    upload([('T1', 'G1'), ('T2', 'G2'), ('T2', 'G2b'), ('T3', ''),
+            ('T4', 'G4')])
+    # Segunda carga: guía internacional cambiada, guía ya en la sesión y
+    # guía nueva
+    upload([('T1', 'G1x'), ('T4', 'G4'), ('T5', 'G5')], 'segundo.csv')
+
+    with app.app_context():
+        session_id = get_current_session().id
+        guias = {g.tracking: g.guia_internacional for g in Guia.query}
+        counts = get_session_counts(session_id)
+    assert guias == {'T1': 'G1x', 'T2': 'G2b', 'T4': 'G4', 'T5': 'G5'}
+    assert counts['total_packages'] == 4
+    assert counts['total_pending_packages'] == 4
+
+    client.post('/scan', json={'code': 'T5'})
+    response = client.get(f'/export?session_id={session_id}&format=csv')
+    body = response.get_data()
+    response.close()
+    assert body.startswith('\ufeff'.encode())
+    rows = list(csv.DictReader(io.StringIO(body.decode('utf-8-sig'))))
+    assert sorted((r['Tracking'], r['Estado Sesión']) for r in rows) == [
+        ('T1', 'NO RECIBIDO'), ('T2', 'NO RECIBIDO'), ('T4', 'NO RECIBIDO'),
+        ('T5', 'RECIBIDO')]
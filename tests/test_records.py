@@ -0,0 +1,53 @@
+import html
+import re
+from models import GuiaSessionStatus
+from session_cache import get_or_create_session
+
+
+def _pages(client, url):
+    """Ids de guía de cada página de /registros siguiendo el cursor."""
+    pages = []
+    while url:
+        text = client.get(url).get_data(as_text=True)
+        pages.append([int(i) for i in
+                      re.findall(r'<tr data-guia-id="(\d+)"', text)])
+        link = re.search(r'href="([^"]*cursor=[^"]*)"[^>]*>Siguiente', text)
+        url = html.unescape(link.group(1)) if link else None
+    return pages
+
+
+def _expected_order(app, **filters):
+    with app.app_context():
+        session_id = get_or_create_session().id
+        rows = GuiaSessionStatus.query.filter_by(
+            session_id=session_id, **filters).order_by(
+            GuiaSessionStatus.timestamp_status_change.desc(),
+            GuiaSessionStatus.id.desc())
+        return session_id, [row.guia_id for row in rows]
+
+
+def test_keyset_pages_do_not_repeat_rows(app, client, upload, monkeypatch):
+    monkeypatch.setitem(app.config, 'RECORDS_PAGE_SIZE', 3)
+    # Carga en un solo bloque: muchas filas con la misma fecha de estado,
+    # que se ordenan por id
+    upload([(f'T{i}', f'G{i}') for i in range(10)])
+    for code in ('T2', 'T7'):
+        client.post('/scan', json={'code': code})
+    session_id, expected = _expected_order(app)
+
+    pages = _pages(client, f'/registros?session_id={session_id}')
+    assert [len(page) for page in pages] == [3, 3, 3, 1]
+    assert sum(pages, []) == expected
+
+
+def test_keyset_pages_with_filter(app, client, upload, monkeypatch):
+    monkeypatch.setitem(app.config, 'RECORDS_PAGE_SIZE', 2)
+    upload([(f'T{i}', f'G{i}') for i in range(7)])
+    client.post('/scan', json={'code': 'T3'})
+    session_id, expected = _expected_order(app, status='NO RECIBIDO')
+
+    pages = _pages(client, f'/registros?session_id={session_id}'
+                           '&status=NO+RECIBIDO')
+    flat = sum(pages, [])
+    assert len(flat) == len(set(flat)) == 6
+    assert flat == expected
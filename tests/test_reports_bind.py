@@ -0,0 +1,21 @@
+import pytest
+from datetime import date
+from sqlalchemy import insert, update
+from sqlalchemy.exc import DBAPIError
+from db_profile import report_session
+from models import db, Guia, Session
+
+
+def test_reports_bind_rejects_writes(app, upload):
+    upload([('T1', 'G1')])
+    with app.app_context():
+        reports = report_session()
+        assert reports is not db.session
+        # Las lecturas funcionan
+        assert reports.query(Guia.tracking).scalar() == 'T1'
+        for statement in (update(Guia).values(guia_internacional='GX'),
+                          insert(Session).values(session_date=date(2001, 1, 1))):
+            with pytest.raises(DBAPIError):
+                reports.execute(statement)
+            reports.rollback()
+        assert Guia.query.one().guia_internacional == 'G1'
@@ -0,0 +1,66 @@
+from contextlib import contextmanager
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession
+from sql_budget import count_statements
+
+
+@pytest.fixture
+def manifest(client, upload):
+    upload([('T1', 'G1'), ('T2', 'G2'), ('T3', 'G3')])
+    # Primer escaneo: carga el índice del manifiesto de la sesión
+    client.post('/scan', json={'code': 'T3'})
+
+
+@contextmanager
+def count_commits():
+    commits = []
+
+    def _count(orm_session):
+        commits.append(orm_session)
+    event.listen(OrmSession, 'after_commit', _count)
+    try:
+        yield commits
+    finally:
+        event.remove(OrmSession, 'after_commit', _count)
+
+
+def _scan(client, code):
+    with count_statements() as statements, count_commits() as commits:
+        response = client.post('/scan', json={'code': code})
+    return response.json, statements, commits
+
+
+def _starting(statements, prefix):
+    return [s for s in statements if s.lstrip().startswith(prefix)]
+
+
+@pytest.mark.parametrize('code', ['T1', 'G2'])
+def test_scan_expected_guia_statements(client, manifest, code):
+    data, statements, commits = _scan(client, code)
+    assert data['status'] == 'RECIBIDO'
+    # Manifest version, UPDATE condicional del estado, fecha_recibido,
+    # Registro, contadores, evento de la sesión y contadores de respuesta
+    assert len(statements) == 7
+    assert len(_starting(statements, 'UPDATE guia_session_status')) == 1
+    assert len(_starting(statements, 'INSERT INTO registro')) == 1
+    assert not _starting(statements, 'SELECT guia_session_status')
+    assert len(commits) == 1
+
+
+def test_scan_again_statements(client, manifest):
+    _scan(client, 'T1')
+    data, statements, commits = _scan(client, 'T1')
+    assert data['status'] == 'YA RECIBIDO'
+    assert len(statements) == 2
+    assert not _starting(statements, 'UPDATE')
+
+
+@pytest.mark.parametrize('code', ['ZZZ', 'T9'])
+def test_scan_unknown_code_statements(client, manifest, code):
+    data, statements, commits = _scan(client, code)
+    assert data['error'] == 'unknown_package_detected'
+    # Manifest version y búsqueda global de la guía; nada que escribir
+    assert len(statements) == 2
+    assert not _starting(statements, 'UPDATE')
+    assert not _starting(statements, 'INSERT')
@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta
+from models import db, Guia, Registro, ProcessedScan
+from session_cache import get_or_create_session
+from session_counters import get_session_counts
+import routes.scan
+
+
+BATCH = [{'code': 'T1', 'client_id': 'scan-1', 'client_ts': '10:00:00'},
+         {'code': 'ZZZ', 'client_id': 'scan-2', 'client_ts': '10:00:01'},
+         {'code': 'G2', 'client_id': 'scan-3', 'client_ts': '10:00:02'}]
+
+
+def test_resent_batch_is_applied_once(app, client, upload):
+    upload([('T1', 'G1'), ('T2', 'G2'), ('T3', 'G3')])
+    first = client.post('/scan/batch', json={'scans': BATCH}).json
+    second = client.post('/scan/batch', json={'scans': BATCH}).json
+
+    assert [r['replayed'] for r in first['results']] == [False] * 3
+    assert [r['replayed'] for r in second['results']] == [True] * 3
+    for before, after in zip(first['results'], second['results']):
+        assert after['client_id'] == before['client_id']
+        assert after.get('status') == before.get('status')
+        assert after.get('error') == before.get('error')
+    assert [r.get('status') for r in second['results']] == \
+        ['RECIBIDO', None, 'RECIBIDO']
+    assert second['results'][1]['error'] == 'unknown_package_detected'
+
+    with app.app_context():
+        session_id = get_or_create_session().id
+        assert get_session_counts(session_id)['total_scanned_packages'] == 2
+        t1 = Guia.query.filter_by(tracking='T1').one()
+        assert Registro.query.filter_by(guia_id=t1.id).count() == 1
+        assert Registro.query.count() == 2
+    assert second['total_scanned_packages'] == 2
+
+
+def test_batch_over_limit_is_rejected(app, client, upload, monkeypatch):
+    upload([('T1', 'G1')])
+    monkeypatch.setitem(app.config, 'SCAN_BATCH_MAX_ITEMS', 2)
+    response = client.post('/scan/batch', json={'scans': BATCH})
+    assert response.status_code == 400
+    with app.app_context():
+        assert ProcessedScan.query.count() == 0
+        assert Registro.query.count() == 0
+
+
+def test_old_client_ids_are_pruned(app, client, upload, monkeypatch):
+    upload([('T1', 'G1'), ('T2', 'G2'), ('T3', 'G3')])
+    with app.app_context():
+        session_id = get_or_create_session().id
+        db.session.add(ProcessedScan(
+            client_id='old', session_id=session_id, code='T3',
+            created_at=datetime.utcnow() - timedelta(days=30)))
+        db.session.commit()
+    monkeypatch.setattr(routes.scan, '_PRUNE_EVERY', 1)
+
+    client.post('/scan/batch', json={'scans': BATCH})
+    with app.app_context():
+        assert sorted(s.client_id for s in ProcessedScan.query) == \
+            ['scan-1', 'scan-2', 'scan-3']
@@ -0,0 +1,45 @@
+import re
+import search
+from models import Guia
+from session_cache import get_or_create_session
+
+
+def _found(app, client, **filters):
+    with app.app_context():
+        session_id = get_or_create_session().id
+    query = '&'.join(f'{key}={value}' for key, value in filters.items())
+    text = client.get(f'/registros?session_id={session_id}&{query}') \
+        .get_data(as_text=True)
+    ids = {int(i) for i in re.findall(r'<tr data-guia-id="(\d+)"', text)}
+    with app.app_context():
+        return {g.tracking for g in Guia.query if g.id in ids}
+
+
+def test_search_follows_edits(app, client, upload):
+    upload([('ABC123', 'GXA1'), ('QQQ999', 'GXB2'), ('XY', 'GXC3')])
+    assert _found(app, client, tracking='c12') == {'ABC123'}
+
+    with app.app_context():
+        guia = Guia.query.filter_by(tracking='ABC123').one()
+        url = f'/edit_guia_status/{guia.id}/{get_or_create_session().id}'
+    response = client.post(url, json={'tracking': 'ZZZ777',
+                                      'guia_internacional': 'GXA1'})
+    assert response.json['success']
+    assert _found(app, client, tracking='c12') == set()
+    assert _found(app, client, tracking='z777') == {'ZZZ777'}
+
+    # Cambio de la carga masiva (UPDATE de Core sin pasar por el ORM)
+    upload([('QQQ999', 'NEWGI55')], 'segundo.csv')
+    assert _found(app, client, guia_internacional='gi55') == {'QQQ999'}
+    assert _found(app, client, guia_internacional='gxb') == set()
+
+
+def test_short_terms_fall_back_to_ilike(app, client, upload):
+    upload([('ABC123', 'GXA1'), ('QQQ999', 'GXB2'), ('XY', 'GXC3')])
+    assert _found(app, client, tracking='xy') == {'XY'}
+    assert _found(app, client, tracking='9') == {'QQQ999'}
+
+    short = str(search.code_contains('tracking', 'xy'))
+    assert 'guia_search' not in short
+    if search._backend == 'fts5':
+        assert 'guia_search' in str(search.code_contains('tracking', 'xyz'))
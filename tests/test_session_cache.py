@@ -0,0 +1,34 @@
+from datetime import date
+import session_cache
+from models import db, Session
+
+
+def test_close_in_other_process_refreshes_cached_session(app, client,
+                                                         upload):
+    upload([('T1', 'G1')])
+    client.get('/')
+    stale = session_cache._cached
+    assert stale is not None and not stale.is_closed
+
+    response = client.post('/end_session', data={
+        'confirmation_date': date.today().isoformat()})
+    assert response.status_code == 302
+    with app.app_context():
+        assert db.session.get(Session, stale.id).is_closed
+
+    # Otro proceso del host aún guarda la sesión abierta: el aviso del
+    # cierre hace que la vuelva a leer en lugar de usar su copia
+    session_cache._cached = stale
+    with app.test_request_context('/'):
+        session = session_cache.get_current_session()
+        assert session.id == stale.id
+    assert session_cache._cached is not stale
+    assert session_cache._cached.signal != stale.signal
+
+
+def test_cached_session_is_reused_without_signal(app, client):
+    client.get('/')
+    cached = session_cache._cached
+    with app.test_request_context('/'):
+        session_cache.get_current_session()
+    assert session_cache._cached is cached
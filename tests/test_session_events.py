@@ -0,0 +1,42 @@
+import pytest
+from session_cache import get_current_session
+
+
+@pytest.fixture
+def pages(app, client, upload):
+    upload([('T1', 'G1')])
+    with app.app_context():
+        session_id = get_current_session().id
+    guia_page = client.get('/registros').get_data(as_text=True)
+    guia_id = guia_page.split('data-guia-id="', 1)[1].split('"', 1)[0]
+    return {
+        'index': '/',
+        'registros': '/registros',
+        'upload': '/upload',
+        'edit': f'/edit_guia_status/{guia_id}/{session_id}',
+    }, session_id
+
+
+def _html(client, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    return response.get_data(as_text=True)
+
+
+def test_live_events_only_on_scan_and_records_pages(client, pages):
+    urls, _ = pages
+    for name, url in urls.items():
+        html = _html(client, url)
+        live = name in ('index', 'registros')
+        assert ('data-events-url' in html) == live, name
+        assert ('js/session_events.js' in html) == live, name
+
+
+def test_live_events_disabled(app, client, pages, monkeypatch):
+    urls, session_id = pages
+    monkeypatch.setitem(app.config, 'SESSION_EVENTS_ENABLED', False)
+    for url in urls.values():
+        html = _html(client, url)
+        assert 'data-events-url' not in html
+        assert 'js/session_events.js' not in html
+    assert client.get(f'/session/{session_id}/events').status_code == 404
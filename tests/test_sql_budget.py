@@ -0,0 +1,89 @@
+import pytest
+from models import db, Guia, GuiaSessionStatus
+from sql_budget import SQLBudgetExceeded
+
+
+# SQL_QUERY_BUDGET_STRICT=1 (conftest): una ruta por encima de su
+# presupuesto de SQL_QUERY_BUDGETS lanza SQLBudgetExceeded
+
+@pytest.fixture
+def manifest(app, client, upload):
+    upload([(f'T{i}', f'G{i}') for i in range(250)])
+    for code in ('T1', 'G2'):
+        client.post('/scan', json={'code': code})
+    with app.app_context():
+        row = db.session.query(GuiaSessionStatus.session_id, Guia.id).join(
+            Guia, Guia.id == GuiaSessionStatus.guia_id).filter(
+            Guia.tracking == 'T5').one()
+    return {'session_id': row.session_id, 'guia_id': row.id}
+
+
+def _get(client, url):
+    response = client.get(url)
+    response.get_data()  # Las exportaciones se generan en flujo
+    response.close()
+    return response
+
+
+def test_index_within_budget(client, manifest):
+    assert _get(client, '/').status_code == 200
+
+
+@pytest.mark.parametrize('query', [
+    '', '&status=NO+RECIBIDO', '&tracking=T1', '&guia_internacional=G12',
+])
+def test_registros_within_budget(client, manifest, query):
+    response = _get(client, f'/registros?session_id='
+                            f'{manifest["session_id"]}{query}')
+    assert response.status_code == 200
+
+
+def test_registros_next_page_within_budget(client, manifest):
+    html = _get(client, f'/registros?session_id={manifest["session_id"]}') \
+        .get_data(as_text=True)
+    cursor = html.split('cursor=', 1)[1].split('&', 1)[0].split('"', 1)[0]
+    response = _get(client, f'/registros?session_id='
+                            f'{manifest["session_id"]}&cursor={cursor}')
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('export_format', ['xlsx', 'csv', 'ndjson'])
+def test_export_within_budget(client, manifest, export_format):
+    response = _get(client, f'/export?session_id={manifest["session_id"]}'
+                            f'&format={export_format}')
+    assert response.status_code == 200
+
+
+def test_edit_guia_status_within_budget(client, manifest):
+    url = f'/edit_guia_status/{manifest["guia_id"]}/{manifest["session_id"]}'
+    assert _get(client, url).status_code == 200
+    response = client.post(url, json={'new_status': 'RECIBIDO'})
+    assert response.json['success']
+    response = client.post(url, json={'tracking': 'T5x',
+                                      'guia_internacional': 'G5x'})
+    assert response.json['success']
+
+
+def test_update_guia_fields_within_budget(client, manifest):
+    response = client.post('/update_guia_fields', json={
+        'guia_id': manifest['guia_id'], 'scanned_code': 'T5y',
+        'field_type': 'both'})
+    assert response.json['success']
+
+
+def test_bulk_edit_status_within_budget(client, manifest):
+    response = client.post('/registros/bulk_status', json={
+        'session_id': manifest['session_id'], 'new_status': 'NO ESCANEADO',
+        'guia_ids': [manifest['guia_id'], manifest['guia_id'] + 1]})
+    assert response.json['updated'] == 2
+    response = client.post('/registros/bulk_status', json={
+        'session_id': manifest['session_id'], 'new_status': 'RECIBIDO',
+        'filters': {'tracking': 'T1', 'status': 'NO RECIBIDO'}})
+    assert response.json['success']
+
+
+def test_route_over_budget_raises(app, client, manifest, monkeypatch):
+    monkeypatch.setitem(app.config['SQL_QUERY_BUDGETS'],
+                        'records.registros', 1)
+    with pytest.raises(SQLBudgetExceeded):
+        _get(client, f'/registros?session_id={manifest["session_id"]}')
@@ -0,0 +1,33 @@
+from fuzzy import edit_neighbors
+
+
+def test_transposed_code_suggests_the_expected_guia(app, client, upload):
+    upload([('ABC12345', 'GI998877'), ('ABC99999', 'GI111111')])
+    data = client.post('/scan', json={'code': 'ABC21345'}).json
+    assert data['error'] == 'unknown_package_detected'
+    assert [(s['code'], s['code_type'], s['status'])
+            for s in data['suggestions']] == \
+        [('ABC12345', 'tracking', 'NO RECIBIDO')]
+
+    # Elegir la sugerencia escanea la guía esperada
+    chosen = data['suggestions'][0]
+    data = client.post('/scan', json={'code': chosen['code'],
+                                      'code_type': chosen['code_type']}).json
+    assert data['status'] == 'RECIBIDO'
+    assert data['tracking'] == 'ABC12345'
+
+
+def test_suggestions_only_at_distance_one(app, client, upload):
+    upload([('ABC12345', 'GI998877')])
+    # Dos caracteres cambiados: ninguna sugerencia
+    data = client.post('/scan', json={'code': 'ABC21354'}).json
+    assert 'suggestions' not in data
+    # Guía internacional con un carácter de menos
+    data = client.post('/scan', json={'code': 'GI99877'}).json
+    assert [s['code'] for s in data['suggestions']] == ['GI998877']
+
+
+def test_edit_neighbors_include_transpositions():
+    neighbors = edit_neighbors('AB12', 'AB12')
+    assert {'BA12', 'A1B2', 'AB21'} <= neighbors
+    assert 'AB12' not in neighbors
@@ -0,0 +1,41 @@
+import hashlib
+import io
+import pytest
+from werkzeug.datastructures import FileStorage
+from models import ImportHistory
+from upload_stream import HashingSpooledFile, upload_sha256
+from conftest import manifest_csv
+
+
+@pytest.mark.parametrize('spool_max_size', [8 * 1024 * 1024, 256])
+def test_upload_hash_matches_body(app, client, monkeypatch, spool_max_size):
+    # Con 256 bytes el búfer pasa a un archivo temporal durante la carga
+    monkeypatch.setitem(app.config, 'UPLOAD_SPOOL_MAX_SIZE', spool_max_size)
+    body = manifest_csv([(f'T{i}', f'G{i}') for i in range(200)])
+    response = client.post('/upload', data={
+        'excel_file': (io.BytesIO(body), 'manifiesto.csv')
+    }, content_type='multipart/form-data')
+    assert response.status_code in (200, 302)
+    with app.app_context():
+        history = ImportHistory.query.one()
+        assert history.sha256 == hashlib.sha256(body).hexdigest()
+        assert history.rows == 200
+
+
+def test_upload_sha256_without_hashing_buffer():
+    body = b'TRACKING,GUIA INTERNACIONAL\nT1,G1\n'
+    file = FileStorage(io.BytesIO(body), filename='manifiesto.csv')
+    assert upload_sha256(file) == hashlib.sha256(body).hexdigest()
+    # Vuelve al inicio para la importación
+    assert file.stream.read() == body
+
+
+def test_hashing_buffer_hashes_what_it_spools():
+    body = b''.join(f'T{i},G{i}\n'.encode() for i in range(100))
+    with HashingSpooledFile(max_size=64) as buffer:
+        for start in range(0, len(body), 50):
+            buffer.write(body[start:start + 50])
+        assert buffer._rolled  # Ya en el archivo temporal
+        assert buffer.sha256.hexdigest() == hashlib.sha256(body).hexdigest()
+        buffer.seek(0)
+        assert buffer.read() == body
@@ -0,0 +1,61 @@
+import hashlib
+import io
+import tempfile
+from flask import Request, current_app
+
+
+class HashingSpooledFile(tempfile.SpooledTemporaryFile):
+    """
+    Búfer de un archivo cargado: en memoria hasta max_size bytes y, a
+    partir de ahí, en un archivo temporal anónimo que desaparece al
+    cerrarlo (o si el proceso termina). Calcula el SHA-256 del contenido a
+    medida que el parser del formulario lo escribe.
+    """
+
+    def __init__(self, max_size: int, dir: str = None):
+        super().__init__(max_size=max_size, mode='w+b', dir=dir)
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        return super().write(data)
+
+
+class UploadRequest(Request):
+    """
+    Petición cuyos archivos se reciben en HashingSpooledFile con el umbral
+    UPLOAD_SPOOL_MAX_SIZE, en lugar del de 500KB de Werkzeug.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type,
+                         filename=None, content_length=None):
+        return HashingSpooledFile(current_app.config['UPLOAD_SPOOL_MAX_SIZE'],
+                                  current_app.config.get('UPLOAD_SPOOL_DIR'))
+
+
+def upload_sha256(file) -> str:
+    """
+    SHA-256 de un archivo cargado (FileStorage). Si no se recibió con
+    UploadRequest, se lee entero y se vuelve al inicio.
+    """
+    stream = file.stream
+    if isinstance(stream, HashingSpooledFile):
+        return stream.sha256.hexdigest()
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for block in iter(lambda: stream.read(1024 * 1024), b''):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def detach_stream(file):
+    """
+    Separa el búfer de un FileStorage para usarlo después de la petición
+    (Werkzeug cierra los archivos de request.files al terminarla). Quien lo
+    recibe debe cerrarlo.
+    """
+    stream = file.stream
+    file.stream = io.BytesIO()
+    stream.seek(0)
+    return stream
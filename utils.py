@@ -1,15 +1,119 @@
 import re
 import os
-import pandas as pd
 from datetime import date
+from flask import current_app
 from werkzeug.utils import secure_filename
+from sqlalchemy import select, insert
+from sqlalchemy.exc import IntegrityError
 from models import db, Guia, Registro, Session, GuiaSessionStatus
+from upload_stream import upload_sha256
+
+# Caracteres que elimina sanitize_string (también usado por la carga masiva
+# con las operaciones vectorizadas de pandas)
+SANITIZE_PATTERN = r'[^\w\s\-\.\,\áéíóúÁÉÍÓÚñÑ]'
+
 
 def sanitize_string(s: str) -> str:
     """
     Sanitiza una cadena, permitiendo solo letras, números y algunos símbolos.
     """
-    return re.sub(r'[^\w\s\-\.\,\áéíóúÁÉÍÓÚñÑ]', '', s)
+    return re.sub(SANITIZE_PATTERN, '', s)
+
+
+def normalize_code(code):
+    """
+    Normaliza un código de guía tal como se guarda en las columnas indexadas
+    (Guia.tracking_norm / Guia.guia_internacional_norm).
+    Devuelve None si el código queda vacío.
+    """
+    if code is None:
+        return None
+    # Espacios de los extremos también tras quitar caracteres: normalizar
+    # un código ya normalizado no lo cambia
+    return sanitize_string(str(code).strip()).strip() or None
+
+
+def normalize_codes(values):
+    """
+    Versión vectorizada de normalize_code para una Series de pandas de
+    texto (carga masiva); los códigos vacíos quedan como ''.
+    """
+    return values.str.strip().str.replace(SANITIZE_PATTERN, '',
+                                          regex=True).str.strip()
+
+
+def find_guia(code: str, code_type: str = None):
+    """
+    Busca una guía por su código normalizado usando los índices de Guia.
+    code_type puede ser 'tracking', 'guia_internacional' o None (ambos).
+    """
+    code = normalize_code(code)
+    if not code:
+        return None
+    if code_type == 'tracking':
+        criteria = Guia.tracking_norm == code
+    elif code_type == 'guia_internacional':
+        criteria = Guia.guia_internacional_norm == code
+    else:
+        criteria = (Guia.tracking_norm == code) | \
+                   (Guia.guia_internacional_norm == code)
+    return Guia.query.filter(criteria).first()
+
+
+def insert_ignore(model, rows: list, index_elements: list):
+    """
+    INSERT masivo que ignora las filas que violan la restricción única
+    indicada: ON CONFLICT DO NOTHING en PostgreSQL y SQLite, INSERT IGNORE
+    en MySQL y, en otros motores, una consulta previa y un INSERT por fila.
+    Devuelve las filas insertadas.
+    """
+    if not rows:
+        return 0
+    dialect = db.session.get_bind().dialect.name
+    table = model.__table__
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        # psycopg2 envía las filas por páginas y rowcount solo cuenta la
+        # última: se cuentan las filas devueltas
+        stmt = insert(table).on_conflict_do_nothing(
+            index_elements=index_elements
+        ).returning(table.c[index_elements[0]])
+        return len(db.session.execute(stmt, rows).all())
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table).on_conflict_do_nothing(
+            index_elements=index_elements)
+    elif dialect in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table).prefix_with('IGNORE')
+    else:
+        return _insert_missing(table, rows, index_elements)
+    result = db.session.execute(stmt, rows)
+    return result.rowcount if result.rowcount >= 0 else len(rows)
+
+
+def _insert_missing(table, rows: list, index_elements: list) -> int:
+    """
+    insert_ignore para motores sin INSERT que ignore conflictos: cada fila
+    se inserta si no existe, en un savepoint para que un conflicto con otra
+    transacción concurrente solo descarte esa fila.
+    """
+    columns = [table.c[name] for name in index_elements]
+    inserted = 0
+    for row in rows:
+        exists = db.session.execute(
+            select(1).where(*(column == row[column.name]
+                              for column in columns))
+        ).first()
+        if exists:
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(table), [row])
+            inserted += 1
+        except IntegrityError:
+            pass
+    return inserted
 
 
 def allowed_file(filename: str, allowed_extensions: set) -> bool:
@@ -20,85 +124,65 @@ def allowed_file(filename: str, allowed_extensions: set) -> bool:
            filename.rsplit('.', 1)[1].lower() in allowed_extensions
 
 
-def get_session_counts(session_id: int) -> dict:
+def upload_extension(file) -> str:
+    """
+    Extensión (en minúsculas) del nombre de un archivo cargado.
+    """
+    return file.filename.rsplit('.', 1)[-1].lower()
+
+
+def import_manifest_file(source, extension: str, session_id: int,
+                         app_config, on_chunk=None, sha256: str = None,
+                         filename: str = None) -> dict:
     """
-    Calcula los conteos de paquetes para una sesión dada.
+    Importa un manifiesto (ruta o archivo binario abierto, p. ej. el búfer
+    de la carga) en la sesión indicada. Con el sha256 del archivo, si ya se
+    cargó uno idéntico en la sesión se devuelve el resultado de esa carga
+    (con duplicate_of) sin leerlo.
     """
-    total_pending_packages = GuiaSessionStatus.query.filter(
-        GuiaSessionStatus.session_id == session_id,
-        GuiaSessionStatus.status.in_(['NO RECIBIDO', 'NO ESCANEADO'])
-    ).count()
+    from importer import iter_manifest_chunks, import_manifest_chunks
+    from import_history import find_identical_import, history_stats
+
+    if sha256:
+        previous = find_identical_import(session_id, sha256)
+        if previous is not None:
+            return dict(history_stats(previous), duplicate_of=previous.id)
+
+    # El archivo se lee por bloques (CSV por trozos, XLSX con el iterador
+    # read-only de openpyxl) y cada bloque se confirma por separado
+    chunk_size = app_config.get('IMPORT_CHUNK_SIZE', 5000)
+    chunks = iter_manifest_chunks(source, extension, chunk_size)
+    return import_manifest_chunks(chunks, session_id, chunk_size, on_chunk,
+                                  sha256, filename)
 
-    not_registered_packages = GuiaSessionStatus.query.filter(
-        GuiaSessionStatus.session_id == session_id,
-        GuiaSessionStatus.status == 'NO ESPERADO'
-    ).count()
 
-    missing_to_scan_packages = GuiaSessionStatus.query.filter(
-        GuiaSessionStatus.session_id == session_id,
-        GuiaSessionStatus.status == 'NO RECIBIDO'
-    ).count()
-    return {
-        'total_pending_packages': total_pending_packages,
-        'not_registered_packages': not_registered_packages,
-        'missing_to_scan_packages': missing_to_scan_packages
-    }
+def import_error_message(error: Exception) -> str:
+    """
+    Mensaje para el usuario de una carga de manifiesto fallida: el detalle
+    solo si no se pudo leer el archivo; cualquier otro error (base de datos,
+    error interno) queda en el registro del servidor.
+    """
+    from importer import ManifestReadError
+    if isinstance(error, ManifestReadError):
+        return f'Error al leer el archivo Excel: {error}'
+    return ('Error interno al importar el manifiesto; los detalles quedaron '
+            'en el registro del servidor.')
 
 
 def process_excel_upload(file, current_session, app_config):
     """
     Procesa un archivo Excel/CSV cargado, añadiendo guías a la base de datos.
     """
-    filepath = os.path.join(app_config['UPLOAD_FOLDER'], secure_filename(file.filename))
-    file.save(filepath)
-
+    # Se lee directamente del búfer de la carga (ver upload_stream.py)
     try:
-        if filepath.endswith('.csv'):
-            df = pd.read_csv(filepath)
-        else:
-            df = pd.read_excel(filepath)
+        stats = import_manifest_file(
+            file.stream, upload_extension(file), current_session.id,
+            app_config, sha256=upload_sha256(file),
+            filename=secure_filename(file.filename))
     except Exception as e:
-        return {'error': f'Error al leer el archivo Excel: {e}'}
-
-    n_added_guia = 0
-    n_ignored_guia = 0
-    n_added_session_status = 0
-
-    for _, row in df.iterrows():
-        tracking = sanitize_string(str(row.get('TRACKING', '')).strip())
-        guia_internacional = sanitize_string(str(row.get('GUIA INTERNACIONAL', '')).strip())
-
-        if not (tracking and guia_internacional):
-            n_ignored_guia += 1
-            continue
-
-        guia = Guia.query.filter_by(tracking=tracking).first()
-        if not guia:
-            guia = Guia(tracking=tracking,
-                        guia_internacional=guia_internacional,
-                        fecha_recibido=None)
-            db.session.add(guia)
-            db.session.flush()
-            n_added_guia += 1
-        else:
-            if guia.guia_internacional != guia_internacional:
-                guia.guia_internacional = guia_internacional
-            existing_guia_status = GuiaSessionStatus.query.filter_by(
-                session_id=current_session.id, guia_id=guia.id).first()
-            if existing_guia_status:
-                n_ignored_guia += 1
-                continue
-
-        guia_status = GuiaSessionStatus(session_id=current_session.id,
-                                        guia_id=guia.id,
-                                        status='NO RECIBIDO')
-        db.session.add(guia_status)
-        n_added_session_status += 1
-
-    db.session.commit()
-    return {
-        'success': True,
-        'n_added_guia': n_added_guia,
-        'n_added_session_status': n_added_session_status,
-        'n_ignored_guia': n_ignored_guia
-    }
+        db.session.rollback()
+        current_app.logger.exception('Falló la carga de %s', file.filename)
+        return {'error': import_error_message(e)}
+    finally:
+        file.close()
+    return dict(stats, success=True)